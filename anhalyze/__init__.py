@@ -1,4 +1,30 @@
-from .core.anhalyze import AnhaDataset
 from os.path import dirname, join as joinpath
+import importlib
+import logging
 
 PACKAGE_DATA_DIR = joinpath(dirname(__file__), 'package_data')
+
+# Package logger, output is left to applications (e.g. `logging.basicConfig()`), see `set_log_level`.
+logging.getLogger('anhalyze').addHandler(logging.NullHandler())
+
+# Public objects and their modules, imported on first use, so that `import anhalyze`
+# doesn't import xarray, scipy, etc. (e.g. in CLI calls and process pool workers).
+_LAZY_IMPORTS = {'AnhaDataset': 'anhalyze.core.anhalyze',
+                 'colocate': 'anhalyze.core.anhalyze_colocation',
+                 'set_log_level': 'anhalyze.core.anhalyze_utils',
+                 'set_options': 'anhalyze.core.options'}
+
+__all__ = ['PACKAGE_DATA_DIR'] + list(_LAZY_IMPORTS)
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name]), name)
+        globals()[name] = value
+        return value
+
+    raise AttributeError(f"module 'anhalyze' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import sys
+
+# Project-related libraries
+from anhalyze.cli import main
+
+sys.exit(main())
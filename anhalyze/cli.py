@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Command-line entry point of `ANHALYZE`, for bulk extraction jobs.
+
+    Examples:
+        anhalyze list /data/ANHA4-WLS001/ --grid gridT --years 1998 1999
+        anhalyze cut /data/ANHA4-WLS001/ --lat-range 50 65 --lon-range -93 -75 --output-dir cuts/ --workers 8
+        anhalyze timeseries /data/ANHA4-WLS001/ --var votemper --lat-range 51 54.7 --lon-range -82.5 -78.5 \\
+            --output james_bay.csv --workers 8 --memory-limit 2GB
+        anhalyze climatology /data/ANHA4-WLS001/ --var votemper --output clim.nc --workers 8
+        anhalyze hovmoller /data/ANHA4-WLS001/ --var votemper --axis depth --lat-range 51 54.7 \\
+            --lon-range -82.5 -78.5 --output james_bay_hovmoller.nc --image james_bay_hovmoller.png --workers 8
+        anhalyze render /data/ANHA4-WLS001/ --var votemper --output-dir maps/ --workers 8
+        anhalyze stats /data/ANHA4-WLS001/ --variables votemper vosaline --workers 8
+        anhalyze pyramid /data/ANHA4-WLS001/ --variables votemper --factors 2 4 8 --workers 8
+        anhalyze mirror /data/ANHA4-WLS001/ --variables votemper --workers 8
+        anhalyze serve /data/ANHA4-WLS001/ --variables votemper --port 8080
+"""
+
+# System-related libraries
+import os
+import sys
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+def get_parser():
+    """ Returns argument parser of `anhalyze` command.
+    """
+
+    parser = argparse.ArgumentParser(prog='anhalyze', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # Options shared by all subcommands
+    files_parser = argparse.ArgumentParser(add_help=False)
+    files_parser.add_argument('inputs', nargs='+',
+                              help='Directory with ANHA files of a run, or list of files.')
+    files_parser.add_argument('--run', default=None, help='Model run, e.g. ANHA4-WLS001 (default: any).')
+    files_parser.add_argument('--grid', default='gridT', help='Grid type (default: gridT).')
+    files_parser.add_argument('--years', nargs='+', type=int, default=None, help='Years to include.')
+    files_parser.add_argument('--months', nargs='+', type=int, default=None, help='Months to include.')
+    files_parser.add_argument('--recursive', action='store_true', help='Search subdirectories.')
+
+    job_parser = argparse.ArgumentParser(add_help=False)
+    job_parser.add_argument('--mask-filename', default=None, help='Mask filename.')
+    job_parser.add_argument('--lat-range', nargs=2, type=float, default=None, help='Latitude range [degrees].')
+    job_parser.add_argument('--lon-range', nargs=2, type=float, default=None, help='Longitude range [degrees].')
+    job_parser.add_argument('--depth-range', nargs=2, type=float, default=None, help='Depth range [m].')
+    job_parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1).')
+    job_parser.add_argument('--chunks', type=int, default=None,
+                            help='Number of files per worker task (default: files split evenly between workers).')
+    job_parser.add_argument('--memory-limit', default=None,
+                            help='Memory budget of each worker, e.g. 2GB, for files read ahead, '
+                                 'and data read in blocks (see anhalyze.set_options).')
+    job_parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                            help='Level of messages shown (default: WARNING).')
+    job_parser.add_argument('--metrics', default=None,
+                            help='JSON filename where counters and timers of the job are saved.')
+
+    subparsers.add_parser('list', parents=[files_parser], help="List a run's files.")
+
+    cut_parser = subparsers.add_parser('cut', parents=[files_parser, job_parser], help='Regional cuts.')
+    cut_parser.add_argument('--output-dir', required=True, help='Output directory.')
+    cut_parser.add_argument('--variables', nargs='+', default=None, help='Variables to save (default: all).')
+    cut_parser.add_argument('--suffix', default='_CutRegion', help='Suffix of output files.')
+    cut_parser.add_argument('--preset', default=None, choices=['archive', 'fast-read', 'time-series'],
+                            help='Encoding preset.')
+    cut_parser.add_argument('--precision', action='store_true', help='Trim precision (lossy, see to_netcdf).')
+    cut_parser.add_argument('--overwrite', action='store_true', help='Redo files already done.')
+    cut_parser.add_argument('--profile', action='store_true', help='Print phase stats aggregated over files.')
+
+    ts_parser = subparsers.add_parser('timeseries', parents=[files_parser, job_parser],
+                                      help='Time series of regional statistics.')
+    ts_parser.add_argument('--var', default='votemper', help='Variable name (default: votemper).')
+    ts_parser.add_argument('--output', required=True, help='Output csv filename.')
+    ts_parser.add_argument('--no-mirror', action='store_true',
+                           help='Read files, even if an up-to-date Zarr mirror of the run exists.')
+
+    clim_parser = subparsers.add_parser('climatology', parents=[files_parser, job_parser],
+                                        help='Monthly climatology.')
+    clim_parser.add_argument('--var', default='votemper', help='Variable name (default: votemper).')
+    clim_parser.add_argument('--output', required=True, help='Output netCDF filename.')
+    clim_parser.add_argument('--no-mirror', action='store_true',
+                             help='Read files, even if an up-to-date Zarr mirror of the run exists.')
+
+    hov_parser = subparsers.add_parser('hovmoller', parents=[files_parser, job_parser],
+                                       help='Hovmoller diagram (time-latitude, time-longitude or time-depth).')
+    hov_parser.add_argument('--var', default='votemper', help='Variable name (default: votemper).')
+    hov_parser.add_argument('--axis', default='lat', choices=['lat', 'lon', 'depth'],
+                            help='Axis of the diagram, means over the other axes (default: lat).')
+    hov_parser.add_argument('--bins', type=float, default=None,
+                            help='Width of latitude or longitude bins [degrees] (default: grid spacing).')
+    hov_parser.add_argument('--output', required=True, help='Output netCDF filename.')
+    hov_parser.add_argument('--image', default=None, help='Image filename of the diagram (default: none).')
+
+    render_parser = subparsers.add_parser('render', parents=[files_parser, job_parser], help='Map of each file.')
+    render_parser.add_argument('--var', default='votemper', help='Variable name (default: votemper).')
+    render_parser.add_argument('--output-dir', required=True, help='Output directory.')
+    render_parser.add_argument('--projection', default='LambertConformal', help='Projection name.')
+    render_parser.add_argument('--color-range', nargs='+', default=['default'],
+                               help="Color range: 'default', 'local' or two values vmin vmax.")
+    render_parser.add_argument('--format', default='png', help='Image format (default: png).')
+    render_parser.add_argument('--dpi', type=float, default=None, help='Resolution of images (default: matplotlib).')
+    render_parser.add_argument('--full-resolution', action='store_true',
+                               help='Plot all grid cells, instead of coarsening grids finer than the image resolution.')
+
+    stats_parser = subparsers.add_parser('stats', parents=[files_parser, job_parser],
+                                         help='Summary statistics sidecar of each file (whole files, no region).')
+    stats_parser.add_argument('--variables', nargs='+', default=None,
+                              help='Variables (default: all on the horizontal grid).')
+    stats_parser.add_argument('--stats-dir', default=None,
+                              help='Directory of sidecars (default: $ANHALYZE_STATS_DIR, or next to files).')
+    stats_parser.add_argument('--overwrite', action='store_true', help='Redo sidecars already up to date.')
+
+    pyramid_parser = subparsers.add_parser('pyramid', parents=[files_parser, job_parser],
+                                           help='Coarsened levels of each file (whole files, no region).')
+    pyramid_parser.add_argument('--variables', nargs='+', default=None,
+                                help='Variables (default: all on the horizontal grid).')
+    pyramid_parser.add_argument('--factors', nargs='+', type=int, default=[2, 4, 8],
+                                help='Coarsening factors of levels (default: 2 4 8).')
+    pyramid_parser.add_argument('--pyramid-dir', default=None,
+                                help='Directory of levels (default: $ANHALYZE_PYRAMID_DIR, or next to files).')
+    pyramid_parser.add_argument('--overwrite', action='store_true', help='Redo levels already up to date.')
+
+    mirror_parser = subparsers.add_parser('mirror', parents=[files_parser, job_parser],
+                                          help='Zarr mirror of the run chunked along time, for time series '
+                                               '(whole files, no region).')
+    mirror_parser.add_argument('--variables', nargs='+', default=None,
+                               help='Variables (default: all on the horizontal grid with a time dimension).')
+    mirror_parser.add_argument('--mirror-dir', default=None,
+                               help='Directory of mirror (default: $ANHALYZE_MIRROR_DIR, or next to files).')
+    mirror_parser.add_argument('--time-chunk', type=int, default=73,
+                               help='Chunk size along time (default: 73, one year of 5-day outputs).')
+
+    serve_parser = subparsers.add_parser('serve', parents=[files_parser],
+                                         help='Local server of map tiles (XYZ PNG) of the files.')
+    serve_parser.add_argument('--variables', nargs='+', default=None,
+                              help='Variables (default: all on the horizontal grid).')
+    serve_parser.add_argument('--mask-filename', default=None, help='Mask filename.')
+    serve_parser.add_argument('--color-range', nargs='+', default=['default'],
+                              help="Color range: 'default', 'local' or two values vmin vmax.")
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Server address (default: 127.0.0.1).')
+    serve_parser.add_argument('--port', type=int, default=8080, help='Server port (default: 8080).')
+    serve_parser.add_argument('--cache-dir', default=None,
+                              help='Directory of cached tiles (default: $ANHALYZE_TILE_CACHE_DIR, '
+                                   'or ~/.cache/anhalyze/tiles).')
+    serve_parser.add_argument('--cache-size', default='1GB', help='Maximum size of cached tiles (default: 1GB).')
+    serve_parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                              help='Level of messages shown (default: WARNING).')
+
+    return parser
+
+
+def get_files(args):
+    """ Returns file list given input directories or files and filters.
+    """
+
+    from anhalyze.core.anhalyze import get_date
+    from anhalyze.core.anhalyze_run import get_file_list
+
+    file_list = []
+    for path in args.inputs:
+        if os.path.isdir(path):
+            file_list += get_file_list(path, model_run=args.run, grid=args.grid, years=args.years,
+                                       months=args.months, recursive=args.recursive)
+        else:
+            if args.years and get_date(path, how='y') not in args.years:
+                continue
+            if args.months and get_date(path, how='m') not in args.months:
+                continue
+            file_list.append(path)
+
+    return file_list
+
+
+def run_list(args, file_list):
+    """ Prints files.
+    """
+
+    for filename in file_list:
+        print(filename)
+
+
+def run_cut(args, file_list):
+    """ Regional cut of each file.
+    """
+
+    from anhalyze.core.batch_cut import batch_cut
+
+    report = batch_cut(file_list, args.output_dir,
+                       lat_range=_to_list(args.lat_range), lon_range=_to_list(args.lon_range),
+                       depth_range=_to_list(args.depth_range), variables=args.variables, suffix=args.suffix,
+                       preset=args.preset, precision=args.precision or None, mask_filename=args.mask_filename,
+                       workers=args.workers, overwrite=args.overwrite, profile=args.profile)
+
+    if args.profile:
+        from anhalyze.core.profiling import get_stats
+        print(get_stats())
+
+    return int((report['status'] == 'failed').any())
+
+
+def run_timeseries(args, file_list):
+    """ Time series saved as csv.
+    """
+
+    from anhalyze.core.anhalyze_run import get_timeseries
+
+    timeseries = get_timeseries(file_list, var=args.var, use_mirror=not args.no_mirror, **_get_job_kwargs(args))
+    _make_parent_dir(args.output)
+    timeseries.to_csv(args.output, index=False)
+    logger.info('Saving: %s', args.output)
+
+
+def run_climatology(args, file_list):
+    """ Climatology saved as netCDF.
+    """
+
+    from anhalyze.core.anhalyze_run import get_climatology
+
+    climatology = get_climatology(file_list, var=args.var, use_mirror=not args.no_mirror,
+                                  **_get_job_kwargs(args))
+    _make_parent_dir(args.output)
+    climatology.to_netcdf(args.output)
+    logger.info('Saving: %s', args.output)
+
+
+def run_hovmoller(args, file_list):
+    """ Hovmoller diagram saved as netCDF, and optionally as image.
+    """
+
+    from anhalyze.core.hovmoller import get_hovmoller
+
+    hovmoller = get_hovmoller(file_list, var=args.var, axis=args.axis, bins=args.bins, **_get_job_kwargs(args))
+    _make_parent_dir(args.output)
+    hovmoller.to_netcdf(args.output)
+    logger.info('Saving: %s', args.output)
+
+    if args.image:
+        from anhalyze.core.anhalyze_plot_utils import show_hovmoller
+        _make_parent_dir(args.image)
+        show_hovmoller(hovmoller, savefig=args.image)
+
+
+def run_render(args, file_list):
+    """ Map of each file saved as image, with a figure set up once per worker.
+    """
+
+    from anhalyze.core.map_renderer import render_frames
+
+    render_frames(file_list, args.output_dir, var=args.var, lat_range=_to_list(args.lat_range),
+                  lon_range=_to_list(args.lon_range), depth_range=_to_list(args.depth_range),
+                  mask_filename=args.mask_filename, projection_name=args.projection,
+                  color_range=_get_color_range(args), image_format=args.format, dpi=args.dpi,
+                  full_resolution=args.full_resolution, workers=args.workers, chunk_size=args.chunks,
+                  memory_limit=args.memory_limit)
+
+
+def run_stats(args, file_list):
+    """ Summary statistics sidecar of each file.
+    """
+
+    from anhalyze.core.summary_stats import build_summary_stats
+
+    if any(_get_sel_kwargs(args).values()):
+        logger.warning('Region options are ignored, summary statistics are computed over whole files.')
+
+    build_summary_stats(file_list, variables=args.variables, mask_filename=args.mask_filename,
+                        stats_dir=args.stats_dir, overwrite=args.overwrite, workers=args.workers,
+                        chunk_size=args.chunks)
+
+
+def run_pyramid(args, file_list):
+    """ Coarsened levels of each file.
+    """
+
+    from anhalyze.core.pyramid import build_pyramid
+
+    if any(_get_sel_kwargs(args).values()):
+        logger.warning('Region options are ignored, pyramid levels are computed over whole files.')
+
+    build_pyramid(file_list, variables=args.variables, factors=args.factors, mask_filename=args.mask_filename,
+                  pyramid_dir=args.pyramid_dir, overwrite=args.overwrite, workers=args.workers,
+                  chunk_size=args.chunks)
+
+
+def run_mirror(args, file_list):
+    """ Zarr mirror of the run.
+    """
+
+    from anhalyze.core.zarr_mirror import build_zarr_mirror, get_mirror_path
+
+    if any(_get_sel_kwargs(args).values()):
+        logger.warning('Region options are ignored, mirrors are copies of whole files.')
+
+    build_zarr_mirror(file_list, mirror_path=get_mirror_path(file_list[0], mirror_dir=args.mirror_dir),
+                      variables=args.variables, time_chunk=args.time_chunk, workers=args.workers)
+
+
+def run_serve(args, file_list):
+    """ Tiles of the files served until interrupted.
+    """
+
+    from anhalyze.core.tile_server import serve_tiles
+
+    serve_tiles(file_list, variables=args.variables, mask_filename=args.mask_filename,
+                color_range=_get_color_range(args), host=args.host, port=args.port, cache_dir=args.cache_dir,
+                cache_size=args.cache_size)
+
+
+def main(argv=None):
+    """ Runs `anhalyze` command.
+
+        Parameters
+        ----------
+        argv : list, optional
+            Command-line arguments. [default: sys.argv[1:]]
+
+        Returns
+        -------
+        exit_code : int
+            Exit code, 0 if successful.
+
+    """
+
+    args = get_parser().parse_args(argv)
+
+    # Messages shown on stderr, as '[Anhalyze] LEVEL: ...'.
+    logging.basicConfig(format='[Anhalyze] %(levelname)s: %(message)s')
+    from anhalyze.core.anhalyze_utils import set_log_level
+    set_log_level(getattr(args, 'log_level', 'WARNING'))
+
+    # Maps of jobs are only saved, never displayed.
+    from anhalyze.core.options import set_options
+    set_options(headless=True)
+
+    if getattr(args, 'memory_limit', None):
+        set_options(memory_limit=args.memory_limit)
+
+    file_list = get_files(args)
+    if not file_list:
+        logger.error('No files found.')
+        return 1
+
+    commands = {'list': run_list,
+                'cut': run_cut,
+                'timeseries': run_timeseries,
+                'climatology': run_climatology,
+                'hovmoller': run_hovmoller,
+                'render': run_render,
+                'stats': run_stats,
+                'pyramid': run_pyramid,
+                'mirror': run_mirror,
+                'serve': run_serve}
+
+    exit_code = commands[args.command](args, file_list) or 0
+
+    if getattr(args, 'metrics', None):
+        from anhalyze.core.metrics import METRICS
+        METRICS.dump(args.metrics)
+        logger.info('Metrics saved: %s', args.metrics)
+
+    return exit_code
+
+
+def _get_color_range(args):
+    """ Returns color range option, either a name or [vmin, vmax].
+    """
+
+    return args.color_range[0] if len(args.color_range) == 1 else [float(v) for v in args.color_range]
+
+
+def _get_sel_kwargs(args):
+    """ Returns selection kwargs for `AnhaDataset.sel`.
+    """
+
+    return {'lat_range': _to_list(args.lat_range),
+            'lon_range': _to_list(args.lon_range),
+            'depth_range': _to_list(args.depth_range)}
+
+
+def _get_job_kwargs(args):
+    """ Returns kwargs shared by run-level functions.
+    """
+
+    return _get_sel_kwargs(args) | {'mask_filename': args.mask_filename,
+                                    'workers': args.workers,
+                                    'chunk_size': args.chunks,
+                                    'memory_limit': args.memory_limit}
+
+
+def _make_parent_dir(filename):
+    """ Creates directory of output file, if needed.
+    """
+
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+
+def _to_list(value):
+    """ Returns list, or None.
+    """
+
+    return list(value) if value else None
+
+
+if __name__ == '__main__':
+    sys.exit(main())
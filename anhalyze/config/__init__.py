@@ -2,13 +2,30 @@
 # Setting up config file based on
 # https://realpython.com/python-toml/#use-configuration-files-in-your-projects
 #
+# `package_data` is read on first use, see `__getattr__`.
+#
 
 import pathlib
-try:
-    import tomllib
-except ModuleNotFoundError:
-    import tomli as tomllib
 
 path = pathlib.Path(__file__).parent / "package_data.toml"
-with path.open(mode="rb") as fp:
-    package_data = tomllib.load(fp)
+
+
+def load_package_data():
+    """ Returns package data config, read from `package_data.toml`.
+    """
+
+    try:
+        import tomllib
+    except ModuleNotFoundError:
+        import tomli as tomllib
+
+    with path.open(mode="rb") as fp:
+        return tomllib.load(fp)
+
+
+def __getattr__(name):
+    if name == 'package_data':
+        globals()['package_data'] = load_package_data()
+        return globals()['package_data']
+
+    raise AttributeError(f"module 'anhalyze.config' has no attribute '{name}'")
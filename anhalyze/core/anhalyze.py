@@ -3,6 +3,8 @@
 
 # System-related libraries
 import os
+import logging
+import contextlib
 import numpy as np
 
 # Data-related libraries
@@ -11,7 +13,16 @@ import xarray as xr
 # Project-related libraries
 import anhalyze
 import anhalyze.config as config
+from anhalyze.core.anhalyze_utils import atomic_write
+from anhalyze.core.blocks import get_masked_array, get_nanrange, get_blocks, get_block_dims, to_netcdf_blocks
+from anhalyze.core.encoding import get_encoding, get_keepbits, trim_precision
+from anhalyze.core.file_pool import open_dataset
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.options import OPTIONS
+from anhalyze.core.profiling import phase, profile_phase
+from anhalyze.core.variables import get_var_info
 
+logger = logging.getLogger(__name__)
 
 #
 class AnhaDataset:
@@ -28,6 +39,13 @@ class AnhaDataset:
         Bool for loading data (Default: True)
     mask_filename : str, optional
         Mask filename(Default: )
+    use_file_pool : bool, optional
+        Bool for opening files through the shared `FilePool` of open files,
+        to avoid re-opening the same files (Default: True)
+    resolution : int, optional
+        Coarsening factor of the grid, e.g. 4 to read the 4x coarser pyramid level of the file,
+        with its own mask (see `anhalyze.core.pyramid.build_pyramid`). Native grid if the level
+        is missing or out of date. (Default: native grid)
 
     Returns
     -------
@@ -70,7 +88,8 @@ class AnhaDataset:
 
         return "{0}{1}{2}".format(anhalyze_repr, xarray_repr, anhalyze_warning)
 
-    def __init__(self, filename, load_data=True, mask_filename=None, _xr_dataset=None, _attrs=None):
+    def __init__(self, filename, load_data=True, mask_filename=None, use_file_pool=True, resolution=None,
+                 _xr_dataset=None, _attrs=None):
         """ Initializing object.
 
         Parameters
@@ -81,45 +100,85 @@ class AnhaDataset:
             Dict of attributes, use internally.
         """
 
-        # Initialize info from filename
-        if _attrs:
-            assert _xr_dataset, '[Anhalyze] Parameter _xr_dataset needs to be provided with _attrs'
-            self.attrs = _attrs
-        else:
-            self._init_filename_attrs(filename)
-            self.attrs['file_category'] = 'original'
-
-        # Loading data
-        if _xr_dataset:
-            # Check correct xarray.Dataset type.
-            assert type(_xr_dataset) == xr.core.dataset.Dataset, \
-                TypeError('[Anhalyze] Parameter _xr_dataset incorrect type.')
-            # Updating attrs
-            _xr_dataset.attrs = _attrs
-            # Setting internal xarray.Dataset
-            self._xr_dataset = _xr_dataset
-        else:
-            # Open dataset
-            if load_data:
-                self._xr_dataset = xr.open_dataset(os.path.join(self.attrs['filepath'], self.attrs['filename']))
+        # Only opening a file is recorded as 'init', datasets built by `sel` and `isel` are part of their phase.
+        with phase('init') if _attrs is None else contextlib.nullcontext():
+            self._use_file_pool = use_file_pool
+
+            # Initialize info from filename
+            if _attrs:
+                assert _xr_dataset, '[Anhalyze] Parameter _xr_dataset needs to be provided with _attrs'
+                self.attrs = _attrs
             else:
-                raise FutureWarning("[Anhalyze] load_data=false option hasn't been fully developed.")
-                # self._xr_dataset = xr.open_dataset(os.path.join(self.attrs['filepath'], self.attrs['filename']),
-                #                                    decode_cf=False)
+                resolution = self._get_resolution(filename, resolution)
+                if resolution > 1:
+                    from anhalyze.core.pyramid import get_pyramid_path
+                    filename = get_pyramid_path(filename, resolution)
+                self._init_filename_attrs(filename)
+                self.attrs['file_category'] = 'original'
+                self.attrs['resolution'] = resolution
+
+            # Loading data
+            if _xr_dataset:
+                # Check correct xarray.Dataset type.
+                assert type(_xr_dataset) == xr.core.dataset.Dataset, \
+                    TypeError('[Anhalyze] Parameter _xr_dataset incorrect type.')
+                # Updating attrs
+                _xr_dataset.attrs = _attrs
+                # Setting internal xarray.Dataset
+                self._xr_dataset = _xr_dataset
+            else:
+                # Open dataset
+                if load_data:
+                    self._xr_dataset = self._open_dataset(os.path.join(self.attrs['filepath'],
+                                                                       self.attrs['filename']))
+                else:
+                    raise FutureWarning("[Anhalyze] load_data=false option hasn't been fully developed.")
+                    # self._xr_dataset = xr.open_dataset(os.path.join(self.attrs['filepath'], self.attrs['filename']),
+                    #                                    decode_cf=False)
+
+            # Loading mask data
+            if not _xr_dataset:
+                # Get mask from filename
+                if 'mask' not in list(self._xr_dataset.data_vars):
+                    self._mask_filename = mask_filename
+
+            # Initialize file metadata
+            self._load_data = load_data
+            self._init_metadata()
+
+    @staticmethod
+    def _get_resolution(filename, resolution):
+        """ Returns coarsening factor of the pyramid level read, 1 (native grid) if not available.
+        """
 
-        # Loading mask data
-        if not _xr_dataset:
-            # Get mask from filename
-            if 'mask' not in list(self._xr_dataset.data_vars):
-                self._mask_filename = mask_filename
+        if not resolution or resolution == 1:
+            return 1
 
-        # Initialize file metadata
-        self._load_data = load_data
-        self._init_metadata()
+        from anhalyze.core.pyramid import find_pyramid_level
 
-        # Initialize other attrs
-        # TODO replace verbose with logging levels
-        self._verbose = True
+        assert int(resolution) == resolution and resolution > 1, \
+            f'[Anhalyze] Resolution {resolution} should be a coarsening factor (int >= 1).'
+
+        if find_pyramid_level(filename, resolution) is None:
+            METRICS.increment('pyramid_misses')
+            logger.warning('Pyramid level x%s of %s not found or out of date, reading native grid. '
+                           'See `anhalyze.core.pyramid.build_pyramid`.', resolution, filename)
+            return 1
+
+        METRICS.increment('pyramid_hits')
+        return int(resolution)
+
+    @profile_phase('open_dataset')
+    def _open_dataset(self, filename):
+        """ Returns `xarray.Dataset` for given filename, from the shared `FilePool` if enabled.
+        """
+
+        if self._use_file_pool:
+            # Shallow copy, so the pooled dataset is not modified.
+            return open_dataset(filename).copy()
+        else:
+            METRICS.increment('files_opened')
+            return xr.open_dataset(filename)
 
     def _init_coords(self):
         """ Initialize coordinates
@@ -165,6 +224,7 @@ class AnhaDataset:
 
         self.attrs |= self._xr_dataset.attrs
 
+    @profile_phase('init.dims')
     def _init_dims(self):
         """ Initialize dimensions
         """
@@ -185,6 +245,7 @@ class AnhaDataset:
 
         return self._xr_dataset.dims
 
+    @profile_phase('init.filename_attrs')
     def _init_filename_attrs(self, filename):
         """ Initialize properties from filename.
             Filename given in format ANHA?-??????_y????m??d??_grid?.nc
@@ -244,6 +305,7 @@ class AnhaDataset:
             self._init_xr_attrs()
         self._init_range()
 
+    @profile_phase('init.range')
     def _init_range(self):
         """ Initialize boundary values.
         """
@@ -295,23 +357,15 @@ class AnhaDataset:
         else:
             # Use edges if values outside range
             if coord_range[0] < full_range[0]:
-                mode_message = f'[Anhalyze] Warning: {coord_name} '
-                mode_message += f'using edge value {full_range[0]:.2f} ' \
-                                f'since given value {coord_range[0]} is out of bounds.'
+                logger.warning('Using edge value %.2f of %s since given value %s is out of bounds.',
+                               full_range[0], coord_name, coord_range[0])
                 coord_range[0] = full_range[0]
 
-                if self._verbose:
-                    print(mode_message)
-
             if coord_range[1] > full_range[1]:
-                mode_message = f'[Anhalyze] Warning: {coord_name} '
-                mode_message += f'using edge value {full_range[1]:.2f} ' \
-                                f'since given value {coord_range[1]} is out of bounds.'
+                logger.warning('Using edge value %.2f of %s since given value %s is out of bounds.',
+                               full_range[1], coord_name, coord_range[1])
                 coord_range[1] = full_range[1]
 
-                if self._verbose:
-                    print(mode_message)
-
         return coord_range
 
     def _get_row_col_range(self, lat_range, lon_range):
@@ -373,19 +427,44 @@ class AnhaDataset:
 
         return coord_range
 
-    def _get_var_data_array(self, var='', mask_data=True):
-        """ Returns DataArray for given var
+    def _get_var_data_array(self, var='', mask_data=True, indexers=None):
+        """ Returns DataArray for given var.
+            With a memory limit (see `anhalyze.set_options`), data is masked one block at a time.
+
+        Parameters
+        ----------
+        var : str
+            Variable name.
+        mask_data : bool, optional
+            If True, land is masked (NaN). [default: True]
+        indexers : dict, optional
+            Integer indexers ({dim: int | slice | list}) applied before masking,
+            e.g. {dim_z: [0]} to only read and mask the top layer.
+
+        """
+
+        # Mask data in blocks within memory limit
+        if mask_data and OPTIONS['memory_limit']:
+            return get_masked_array(self, var, indexers=indexers)
+
+        return self._get_var_data_block(var, mask_data=mask_data, indexers=indexers)
+
+    def _get_var_data_block(self, var, mask_data=True, indexers=None):
+        """ Returns DataArray for given var and indexers, see `_get_var_data_array`.
         """
 
         # Get DataArray for given var
         var_da = self.data_vars[var]
+        if indexers:
+            var_da = var_da.isel({dim: index for dim, index in indexers.items() if dim in var_da.dims})
 
         # Mask data
         if mask_data:
-            var_da = self._apply_mask(var_da)
+            var_da = self._apply_mask(var_da, indexers=indexers)
 
         return var_da
 
+    @profile_phase('init.mask')
     def _get_mask(self, mask_filename=None):
         """ Get mask from given mask_filename or default location.
 
@@ -397,19 +476,15 @@ class AnhaDataset:
         """
 
         if not mask_filename:
-            # Check if a mask is declared as environment variable
-            if os.environ.get('MASK_PATH_FILENAME'):
-                mask_filename = os.environ.get('MASK_PATH_FILENAME')
-            else:
-                # Get mask from standard location.
-                mask_filename = os.path.join(anhalyze.PACKAGE_DATA_DIR, 'ANHA4_mask.nc')
+            mask_filename = get_default_mask_filename()
 
-                # Download mask if not present and if config allows.
-                if not os.path.isfile(mask_filename) and config.package_data['mask']['autodownload_file']:
-                    print('[Anhalyze] No mask file found, downloading ...')
+            # Download mask if not present in standard location and if config allows.
+            if not os.environ.get('MASK_PATH_FILENAME') and not os.path.isfile(mask_filename) and \
+                    config.package_data['mask']['autodownload_file']:
+                logger.info('No mask file found, downloading ...')
 
-                    from anhalyze.core.downloader import download_mask
-                    download_mask()
+                from anhalyze.core.downloader import download_mask
+                download_mask()
 
         # Check if there is a mask file
         assert_message = '[Anhalyze] No mask file found, '
@@ -420,17 +495,18 @@ class AnhaDataset:
         if mask_filename:
 
             # Getting mask data
+            mask_dataset = self._open_dataset(mask_filename)
             if 'gridT' in self.attrs['grid']:
-                mask = xr.open_dataset(mask_filename).tmask.data
+                mask = mask_dataset.tmask.data
             elif 'gridU' in self.attrs['grid']:
-                mask = xr.open_dataset(mask_filename).umask.data
+                mask = mask_dataset.umask.data
             elif 'gridV' in self.attrs['grid']:
-                mask = xr.open_dataset(mask_filename).vmask.data
+                mask = mask_dataset.vmask.data
             elif 'gridW' in self.attrs['grid']:
-                mask = xr.open_dataset(mask_filename).tmask.data
-                print('[Anhalyze] Warning, using tmask. Check with the data creator to see if this is appropriate.')
+                mask = mask_dataset.tmask.data
+                logger.warning('Using tmask. Check with the data creator to see if this is appropriate.')
             else:
-                mask = xr.open_dataset(mask_filename).tmask.data
+                mask = mask_dataset.tmask.data
 
             # TODO: for icemod,  there are u and v data variables that need to have their exceptions
             #       (with in the same file)
@@ -463,8 +539,10 @@ class AnhaDataset:
         else:
             raise OSError('[Anhalyze] No mask/mesh file found.')
 
-    def _apply_mask(self, var_data, at_top_layer=False):
-        """ Applies mask to single var in `AnhaDataset.data_vars`.
+    @profile_phase('apply_mask')
+    def _apply_mask(self, var_data, at_top_layer=False, indexers=None):
+        """ Applies mask to single var in `AnhaDataset.data_vars`,
+            already indexed with indexers if given (see `_get_var_data_array`).
         """
 
         # Applying mask data
@@ -472,7 +550,16 @@ class AnhaDataset:
             var_data[~np.ma.filled((1 == self.data_vars['mask'][0, :]))] = np.nan
         else:
             # var_data[~np.ma.filled((1 == self.data_vars['mask']))] = np.nan
-            var_data = var_data.where(self.data_vars['mask'] == 1)
+            mask = self.data_vars['mask']
+            if indexers:
+                mask = mask.isel({dim: index for dim, index in indexers.items() if dim in mask.dims})
+
+            # Using top layer of mask for 2D variables (e.g. sea surface height) in 3D files.
+            if 'dim_z' in self.attrs.keys() and self.attrs['dim_z'] not in var_data.dims \
+                    and self.attrs['dim_z'] in mask.dims:
+                mask = mask.isel({self.attrs['dim_z']: 0}, drop=True)
+
+            var_data = var_data.where(mask == 1)
 
         # previous versions.
         # self._xr_dataset = self._xr_dataset.where(self.coords['mask'] == 1)
@@ -480,6 +567,7 @@ class AnhaDataset:
 
         return var_data
 
+    @profile_phase('sel')
     def sel(self, lat_range=None, lon_range=None, depth_range=None):
         """
         Returns a new `AnhaDataset` with each data array indexed
@@ -517,9 +605,8 @@ class AnhaDataset:
             lat_range = self._update_range('coord_lat', lat_range)
             lon_range = self._update_range('coord_lon', lon_range)
 
-            if self._verbose:
-                print(f'[Anhalyze] Selecting Latitude range: {lat_range}')
-                print(f'[Anhalyze] Selecting Longitude range: {lon_range}')
+            logger.info('Selecting Latitude range: %s', lat_range)
+            logger.info('Selecting Longitude range: %s', lon_range)
 
             # Find row and col ranges from lat or lon values
             row_range, col_range = self._get_row_col_range(lat_range, lon_range)
@@ -530,8 +617,7 @@ class AnhaDataset:
             if lat_range:
                 lat_range = self._update_range('coord_lat', lat_range)
 
-                if self._verbose:
-                    print(f'[Anhalyze] Selecting Latitude range: {lat_range}')
+                logger.info('Selecting Latitude range: %s', lat_range)
 
                 # Find row ranges from lat values
                 row_range = self._get_row_or_col_range(lat_range, self.attrs['coord_lat'])
@@ -539,8 +625,7 @@ class AnhaDataset:
             if lon_range:
                 lon_range = self._update_range('coord_lon', lon_range)
 
-                if self._verbose:
-                    print(f'[Anhalyze] Selecting Longitude range: {lon_range}')
+                logger.info('Selecting Longitude range: %s', lon_range)
 
                 # Find col ranges from lon values
                 col_range = self._get_row_or_col_range(lon_range, self.attrs['coord_lon'])
@@ -554,8 +639,7 @@ class AnhaDataset:
         if depth_range:
             depth_range = self._update_range('coord_depth', depth_range)
 
-            if self._verbose:
-                print(f'[Anhalyze] Selecting Depth range: {depth_range}')
+            logger.info('Selecting Depth range: %s', depth_range)
 
             dict_range = {self.attrs['dim_z']: slice(depth_range[0], depth_range[1])}
 
@@ -567,8 +651,10 @@ class AnhaDataset:
         _attrs['file_category'] = 'regional'
         # TODO could add section/transect or something specific like this.
 
-        return AnhaDataset('', load_data=self._load_data, _xr_dataset=_xr_dataset, _attrs=_attrs)
+        return AnhaDataset('', load_data=self._load_data, use_file_pool=self._use_file_pool,
+                           _xr_dataset=_xr_dataset, _attrs=_attrs)
 
+    @profile_phase('isel')
     def isel(self, x_range=None, y_range=None, z_range=None):
         """
         Returns a new `AnhaDataset` with each data array indexed
@@ -597,18 +683,15 @@ class AnhaDataset:
         # Populating dict for selection
         if x_range:
             x_range = self._update_range('dim_x', x_range)
-            if self._verbose:
-                print(f'[Anhalyze] Selecting x range: {x_range}')
+            logger.info('Selecting x range: %s', x_range)
             dict_range.update({self.attrs['dim_x']: slice(x_range[0], x_range[1])})
         if y_range:
             y_range = self._update_range('dim_y', y_range)
-            if self._verbose:
-                print(f'[Anhalyze] Selecting y range: {y_range}')
+            logger.info('Selecting y range: %s', y_range)
             dict_range.update({self.attrs['dim_y']: slice(y_range[0], y_range[1])})
         if z_range:
             z_range = self._update_range('dim_z', z_range)
-            if self._verbose:
-                print(f'[Anhalyze] Selecting z range: {z_range}')
+            logger.info('Selecting z range: %s', z_range)
             dict_range.update({self.attrs['dim_z']: slice(z_range[0], z_range[1])})
 
         # Selection of xarray instance
@@ -619,9 +702,48 @@ class AnhaDataset:
         _attrs['file_category'] = 'regional'
         # TODO could add section/transect or something specific like this.
 
-        return AnhaDataset('', load_data=self._load_data, _xr_dataset=_xr_dataset, _attrs=_attrs)
+        return AnhaDataset('', load_data=self._load_data, use_file_pool=self._use_file_pool,
+                           _xr_dataset=_xr_dataset, _attrs=_attrs)
+
+    @profile_phase('load')
+    def load(self, variables=None):
+        """ Reads data for given variables into memory, one variable at a time.
+            Only the selected region is read for `regional` datasets (i.e. after `sel` or `isel`).
 
-    def show_var_data_map(self, var, color_range='default', savefig=None, projection_name='LambertConformal'):
+            Note: Variables are not read concurrently, netCDF4/HDF5 reads are serialized (HDF5 lock),
+                  threads only add overhead.
+
+        Parameters
+        ----------
+        variables : list, optional
+            Variable names to read. If None, all variables in `AnhaDataset.data_vars`.
+
+        Returns
+        -------
+        out : AnhaDataset
+            Same `AnhaDataset`, with data in memory.
+
+        """
+
+        if variables is None:
+            variables = list(self.data_vars)
+        elif isinstance(variables, str):
+            variables = [variables]
+
+        for var in variables:
+            assert var in list(self.data_vars), \
+                f'[Anhalyze] Variable {var} not found in data_vars: {list(self.data_vars)}'
+
+        for var in variables:
+            var_data = self._xr_dataset[var].values
+            METRICS.increment('bytes_read', var_data.nbytes)
+            self._xr_dataset[var].variable.data = var_data
+
+        return self
+
+    @profile_phase('show_var_data_map')
+    def show_var_data_map(self, var, color_range='default', savefig=None, projection_name='LambertConformal',
+                          full_resolution=False, headless=None, dpi=None, image_format=None):
         """ Displays a map for given var in `AnhaDataset.data_vars`.
 
         Parameters
@@ -641,31 +763,77 @@ class AnhaDataset:
             Projection name from Cartopy list. The projections available are: 'PlateCarree',
             'LambertAzimuthalEqualArea', 'AlbersEqualArea', 'NorthPolarStereo', 'Orthographic', 'Robinson',
             'LambertConformal', 'Mercator', and 'AzimuthalEquidistant'.
+        full_resolution : bool
+            If True, plots the grid at full resolution. By default, grids finer than the figure resolution
+            (e.g. full domain, or ANHA12) are coarsened to about one cell per pixel, with land-aware block means.
+        headless : bool
+            If True, the map is only saved to savefig, without display, on a figure reused between maps.
+            By default, the global `headless` option (see `anhalyze.set_options`).
+        dpi : float
+            Resolution of saved figure. By default, matplotlib 'savefig.dpi'.
+        image_format : str
+            Format of saved figure, e.g. 'png' or 'jpg'. By default, from the savefig extension.
+
+        Returns
+        -------
+        savefig : str | None
+            Filename of saved figure, None if not saved.
         """
 
         import anhalyze.core.anhalyze_plot_utils as apu
 
         assert var in list(self.data_vars), f'[anhalyze] Variable {var} not found in data_vars: {list(self.data_vars)}'
 
-        # Get DataArray for given var
-        var_da = self._get_var_data_array(var=var)
+        var_da = self._get_map_data_array(var)
+
+        # Show var data map, with color ranges from the summary stats sidecar (top layer) if available.
+        return apu.show_var_data_map(var_da,
+                                     attrs=self.attrs,
+                                     color_range=color_range,
+                                     savefig=savefig,
+                                     proj_name=projection_name,
+                                     full_resolution=full_resolution,
+                                     stats=self._get_summary_stats(var, level=0),
+                                     headless=headless,
+                                     dpi=dpi,
+                                     image_format=image_format)
+
+    def _get_summary_stats(self, var, level=None):
+        """ Returns summary statistics of var from the sidecar of the file (see `anhalyze.core.summary_stats`),
+            None if not available, or if this dataset is a selection or uses another mask.
+        """
+
+        from anhalyze.core.summary_stats import get_summary_stats, read_summary_stats
+
+        if self.attrs['file_category'] != 'original':
+            return None
 
-        # Select top layer
-        if 'dim_z' in self.attrs.keys():
-            var_da = var_da.isel(indexers={self.attrs['dim_z']: [0]})
+        filename = os.path.join(self.attrs['filepath'], self.attrs['filename'])
+        mask_filename = self._xr_dataset.attrs['mask_filename']
+        sidecar = read_summary_stats(filename, mask_filename=mask_filename)
+        if sidecar is None or var not in sidecar['variables'] or \
+                sidecar['variables'][var]['shape'] != list(self.data_vars[var].shape):
+            return None
 
-        # Show var data map
-        apu.show_var_data_map(var_da,
-                              attrs=self.attrs,
-                              color_range=color_range,
-                              savefig=savefig,
-                              proj_name=projection_name)
+        return get_summary_stats(filename, var, level=level, mask_filename=mask_filename)
+
+    def _get_map_data_array(self, var):
+        """ Returns masked DataArray of var to be shown in a map, only reading and masking the top layer.
+        """
 
-    def to_netcdf(self, path=None, filename=None, suffix='_CutRegion', **kwargs):
+        indexers = {self.attrs['dim_z']: [0]} if 'dim_z' in self.attrs.keys() else None
+
+        return self._get_var_data_array(var=var, indexers=indexers)
+
+    @profile_phase('to_netcdf')
+    def to_netcdf(self, path=None, filename=None, suffix='_CutRegion', preset=None, precision=None,
+                  overwrite=False, **kwargs):
         """ Writes `AnhaDataset` contents to netCDF file.
             For additional options see: `self._xr_dataset.to_netcdf`
 
-            Note: Behaviour differs from `xarray.Dataset.to_netcdf` since here we avoid overwriting files.
+            Note: Behaviour differs from `xarray.Dataset.to_netcdf` since here we avoid overwriting files,
+                  unless `overwrite=True`. The file is written to a temporary file first, and then renamed,
+                  so an interrupted write never leaves a partial file with the final name.
 
         Parameters
         ----------
@@ -675,6 +843,25 @@ class AnhaDataset:
             Filename to which to save this `AnhaDatabase`.
         suffix : str, default: _CutRegion.nc
             Suffix added to filename to avoid overwriting.
+        preset : str, optional
+            Encoding preset, setting compression, chunk shapes and packing:
+             archive: High zlib level, and float data packed as int16 (lossy, precision of range/65532).
+             fast-read: Light zlib level, and a single chunk per variable.
+             time-series: Medium zlib level, and small horizontal chunks with full depth,
+                          for point/profile reads across many files.
+            Values given in `encoding` take precedence over the preset.
+        precision : bool | dict, optional
+            Trims precision (bit-rounding) of float variables before saving, so they compress
+            several-fold better with zlib (lossy). If True, uses `tolerance` or `keepbits` defaults
+            from the variable table (`anhalyze.core.variables`), variables without defaults are unchanged.
+            A dict, e.g. {'votemper': {'tolerance': 0.01}, 'vosaline': {'keepbits': 12}}, overrides defaults.
+        overwrite : bool, optional
+            If True, replace an existing file with the same name, instead of adding a `_copy` suffix.
+
+        Returns
+        -------
+        new_full_filename : str
+            Full filename of saved file.
 
         """
 
@@ -697,18 +884,106 @@ class AnhaDataset:
         new_full_filename = os.path.join(path, filename.replace('.nc', suffix))
 
         # Avoiding overwriting files by adding extra suffix continuously until available.
-        while os.path.isfile(new_full_filename):
-            print(f'[Anhalyze] Warning, file exists: {new_full_filename}')
+        while os.path.isfile(new_full_filename) and not overwrite:
+            logger.warning('File exists: %s', new_full_filename)
             new_full_filename = new_full_filename.replace('.nc', '_copy.nc')
 
-        if self._verbose:
-            print(f'[Anhalyze] Saving: {new_full_filename}')
+        logger.info('Saving: %s', new_full_filename)
 
         # Updating filename
         self._xr_dataset.attrs['filename'] = os.path.basename(new_full_filename)
 
-        # Saving new file
-        self._xr_dataset.to_netcdf(new_full_filename, **kwargs)
+        # Writing variables too large for the memory limit in blocks, with precision trimmed in each block.
+        block_dims = [dim for dim in [self.attrs.get('dim_z'), 'time_counter'] if dim in self._xr_dataset.dims]
+        in_blocks = (OPTIONS['memory_limit'] and kwargs.get('mode', 'w') == 'w'
+                     and kwargs.get('engine', 'netcdf4') == 'netcdf4'
+                     and any(len(get_blocks(var_da, block_dims)) > 1 for var_da in self.data_vars.values()))
+
+        # Trimming precision, on a copy so this dataset is not modified.
+        xr_dataset = self._xr_dataset
+        keepbits = None
+        if precision and in_blocks:
+            keepbits = self._get_keepbits(precision)
+        elif precision:
+            xr_dataset = self._trim_precision(precision)
+
+        # Setting up encoding from preset
+        if preset:
+            encoding = get_encoding(xr_dataset, preset=preset,
+                                    dims={'x': self.attrs['dim_x'],
+                                          'y': self.attrs['dim_y'],
+                                          'z': self.attrs.get('dim_z')},
+                                    keepbits=keepbits)
+            for var, var_encoding in kwargs.get('encoding', {}).items():
+                encoding[var] = encoding.get(var, {}) | var_encoding
+            kwargs['encoding'] = encoding
+
+        # Appending to an existing file can't go through a temporary file.
+        if kwargs.get('mode') == 'a':
+            xr_dataset.to_netcdf(new_full_filename, **kwargs)
+            return new_full_filename
+
+        # Saving new file, through a temporary file in the same directory.
+        with atomic_write(new_full_filename) as tmp_filename:
+            if in_blocks:
+                to_netcdf_blocks(xr_dataset, tmp_filename, block_dims, keepbits=keepbits, **kwargs)
+            else:
+                xr_dataset.to_netcdf(tmp_filename, **kwargs)
+        METRICS.increment('files_written')
+        METRICS.increment('bytes_written', os.path.getsize(new_full_filename))
+
+        return new_full_filename
+
+    @profile_phase('to_netcdf.trim_precision')
+    def _trim_precision(self, precision=True):
+        """ Returns copy of `xarray.Dataset` with precision of float variables trimmed.
+            See `AnhaDataset.to_netcdf` for `precision` options.
+        """
+
+        xr_dataset = self._xr_dataset.copy()
+        for var, keepbits in self._get_keepbits(precision).items():
+            xr_dataset[var] = xr_dataset[var].copy(data=trim_precision(xr_dataset[var].values, keepbits=keepbits))
+            xr_dataset[var].attrs['precision_keepbits'] = keepbits
+
+        return xr_dataset
+
+    def _get_keepbits(self, precision=True):
+        """ Returns {var: keepbits} of float variables with precision trimmed.
+            See `AnhaDataset.to_netcdf` for `precision` options.
+        """
+
+        if not isinstance(precision, dict):
+            precision = {}
+
+        var_keepbits = {}
+        for var in self.data_vars:
+            if not np.issubdtype(self.data_vars[var].dtype, np.floating):
+                continue
+
+            # Getting tolerance or keepbits, given values first.
+            var_info = get_var_info(var, self.attrs['grid'])
+            var_precision = precision.get(var, {'tolerance': var_info['tolerance'],
+                                                'keepbits': var_info['keepbits']})
+            keepbits = var_precision.get('keepbits')
+            if keepbits is None and var_precision.get('tolerance') is not None:
+                # Only the largest absolute value is needed, from data range read in blocks.
+                var_range = get_nanrange(self.data_vars[var], dims=get_block_dims(self.data_vars[var], self.attrs))
+                keepbits = get_keepbits(np.array(var_range), var_precision['tolerance'])
+            if keepbits is None:
+                continue
+
+            logger.info('Trimming precision of %s to %s mantissa bits.', var, keepbits)
+            var_keepbits[var] = keepbits
+
+        return var_keepbits
+
+
+def get_default_mask_filename():
+    """ Returns mask filename used when none is given: the one declared in environment variable
+        `MASK_PATH_FILENAME`, or the mask in the standard location (package data).
+    """
+
+    return os.environ.get('MASK_PATH_FILENAME') or os.path.join(anhalyze.PACKAGE_DATA_DIR, 'ANHA4_mask.nc')
 
 
 def get_date(filename, how=None):
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import os
+import hashlib
+import numpy as np
+
+# Data-related libraries
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset, get_date
+from anhalyze.core.metrics import METRICS
+
+# Earth radius used to convert chord distances to km.
+EARTH_RADIUS_KM = 6371.0
+
+# ANHA outputs are 5-day means, the filename shows the last day of the
+# period, while the file time_counter is at the middle of the period.
+OUTPUT_PERIOD_DAYS = 5
+FILENAME_TIME_OFFSET_DAYS = 2
+
+# Cache of spatial indices, keyed by a hash of the grid coordinates.
+_GRID_INDEX_CACHE = {}
+
+
+class GridIndex:
+    """ Spatial index of a curvilinear ANHA grid, used to find the nearest
+    grid cell (row, col) for given lat-lon points.
+
+    Parameters
+    ----------
+    lat : ndarray
+        2D array with grid latitudes (e.g. `nav_lat`). [in degrees]
+    lon : ndarray
+        2D array with grid longitudes (e.g. `nav_lon`). [in degrees]
+
+    Attributes
+    ----------
+    cell_sizes : ndarray
+        Size of each grid cell, see `get_cell_sizes`. [in km]
+
+    """
+
+    def __init__(self, lat, lon):
+        """ Initializing object.
+        """
+
+        self.shape = lat.shape
+        self.cell_sizes = get_cell_sizes(lat, lon)
+
+        # Points with lat=lon=0 are fill values in ANHA files, excluding them from the index.
+        valid = ~((lat == 0) & (lon == 0))
+        self._flat_index = np.flatnonzero(valid)
+        self._tree = cKDTree(lat_lon_to_xyz(lat[valid], lon[valid]))
+
+    def query(self, lat, lon):
+        """ Returns nearest grid cell for each lat-lon point.
+
+        Parameters
+        ----------
+        lat : array_like
+            Latitude values. [in degrees]
+        lon : array_like
+            Longitude values. [in degrees]
+
+        Returns
+        -------
+        row : ndarray
+            Row (dim_y) index of nearest grid cell.
+        col : ndarray
+            Col (dim_x) index of nearest grid cell.
+        distance : ndarray
+            Distance to nearest grid cell. [in km]
+
+        """
+
+        chord, index = self._tree.query(lat_lon_to_xyz(np.asarray(lat), np.asarray(lon)))
+        row, col = np.unravel_index(self._flat_index[index], self.shape)
+
+        # Converting chord length to great-circle distance.
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+        return row, col, distance
+
+
+def get_grid_index(lat, lon):
+    """ Returns cached `GridIndex` for given grid coordinates,
+        building it only the first time a grid is seen.
+
+        Parameters
+        ----------
+        lat : ndarray
+            2D array with grid latitudes.
+        lon : ndarray
+            2D array with grid longitudes.
+
+    """
+
+    lat = np.ascontiguousarray(lat)
+    lon = np.ascontiguousarray(lon)
+
+    key = hashlib.sha1(lat.tobytes() + lon.tobytes()).hexdigest()
+    if key not in _GRID_INDEX_CACHE:
+        METRICS.increment('grid_index_misses')
+        _GRID_INDEX_CACHE[key] = GridIndex(lat, lon)
+    else:
+        METRICS.increment('grid_index_hits')
+
+    return _GRID_INDEX_CACHE[key]
+
+
+def get_file_time(filename):
+    """ Returns the time at the middle of the output period of an ANHA file,
+        based on the date in its filename.
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+
+    """
+
+    year, month, day = get_date(filename, how='ymd')
+    file_time = np.datetime64(f'{year:04d}-{month:02d}-{day:02d}', 'ns')
+
+    return file_time - np.timedelta64(FILENAME_TIME_OFFSET_DAYS, 'D')
+
+
+def colocate(obs, file_list, var='votemper', mask_filename=None, time_interp=True):
+    """ Returns model values co-located with a set of observations (e.g. Argo profiles,
+        CTD casts or ship tracks).
+
+        Observations are sorted by the file(s) covering them, each file is opened once (files are read
+        one after the other, as netCDF reads don't run in parallel in threads),
+        and the nearest grid cell is found through a cached spatial index.
+        Observations farther than a cell size from the nearest grid cell are outside the grid.
+        Values are interpolated linearly in depth and (optionally) in time between outputs.
+
+        Parameters
+        ----------
+        obs : pandas.DataFrame | dict
+            Observations with columns 'time', 'lat' and 'lon', and optionally 'depth' [in meters].
+            Without 'depth', the top layer is used.
+        file_list : list
+            List of ANHA files (same grid) covering the observation times.
+        var : str | list, optional
+            Variable name(s) to co-locate. [default: 'votemper']
+        mask_filename : str, optional
+            Mask filename, passed to `AnhaDataset`.
+        time_interp : bool, optional
+            If True, interpolate linearly in time between the two outputs bracketing each
+            observation, otherwise use the nearest output. [default: True]
+
+        Returns
+        -------
+        colocated : pandas.DataFrame
+            Table aligned to `obs` (same index), with the model value for each var, and
+            columns 'row', 'col', 'distance' [in km] and 'file' (nearest output in time).
+            Values are NaN for observations outside the time span of `file_list`, outside the grid,
+            on land, or below the bottom.
+
+    """
+
+    obs = pd.DataFrame(obs)
+    var_list = [var] if isinstance(var, str) else list(var)
+
+    for column in ['time', 'lat', 'lon']:
+        assert column in obs.columns, f'[Anhalyze] Observations need a "{column}" column.'
+    assert len(file_list) > 0, '[Anhalyze] file_list is empty.'
+
+    # Sorting files by time
+    file_list = sorted(file_list, key=get_file_time)
+    file_times = np.array([get_file_time(filename) for filename in file_list])
+
+    # Find the files bracketing each observation, and the weight of the second file.
+    obs_time = pd.to_datetime(obs['time']).values.astype('datetime64[ns]')
+    file_0, file_1, weight = _get_time_weights(obs_time, file_times, time_interp)
+
+    # Getting horizontal indices, using the grid of the first file, opened once.
+    first_ds = AnhaDataset(file_list[0], mask_filename=mask_filename)
+    grid_index = get_grid_index(first_ds.coords[first_ds.attrs['coord_lat']].data,
+                                first_ds.coords[first_ds.attrs['coord_lon']].data)
+    row, col, distance = grid_index.query(obs['lat'].values, obs['lon'].values)
+    inside = distance <= grid_index.cell_sizes[row, col]
+
+    obs_depth = obs['depth'].values.astype(float) if 'depth' in obs.columns else None
+
+    # Grouping observations by file, each observation needs one or two files.
+    groups = {}
+    valid = (file_0 >= 0) & inside
+    for file_id, obs_ids, slot in [(file_0, np.flatnonzero(valid), 0),
+                                   (file_1, np.flatnonzero(valid & (weight > 0)), 1)]:
+        for k in np.unique(file_id[obs_ids]):
+            groups.setdefault(k, []).append((slot, obs_ids[file_id[obs_ids] == k]))
+
+    # Initializing values for both bracketing files
+    values = {v: np.full((2, len(obs)), np.nan) for v in var_list}
+
+    # Values for each group of obs sharing a file.
+    for k in sorted(groups):
+        ds = first_ds if k == 0 else AnhaDataset(file_list[k], mask_filename=mask_filename)
+        file_values = _get_file_values(ds, groups[k], var_list, row, col, obs_depth)
+        for (slot, obs_ids), var_values in zip(groups[k], file_values):
+            for v in var_list:
+                values[v][slot, obs_ids] = var_values[v]
+
+    # Setting up output table
+    colocated = pd.DataFrame(index=obs.index)
+    for v in var_list:
+        colocated[v] = np.where(weight > 0,
+                                (1 - weight) * values[v][0] + weight * values[v][1],
+                                values[v][0])
+    colocated['row'] = row
+    colocated['col'] = col
+    colocated['distance'] = distance
+    nearest = np.where(weight > 0.5, file_1, file_0)
+    colocated['file'] = [os.path.basename(file_list[k]) if k >= 0 else None for k in nearest]
+
+    return colocated
+
+
+def _get_time_weights(obs_time, file_times, time_interp=True):
+    """ Returns indices of files bracketing each observation time,
+        and the weight of the second file.
+        Index is -1 for observations outside the time span of the files.
+    """
+
+    # Half an output period is accepted outside the first and last files.
+    half_period = np.timedelta64(OUTPUT_PERIOD_DAYS * 12, 'h')
+
+    index = np.searchsorted(file_times, obs_time, side='right')
+    file_0 = np.clip(index - 1, 0, len(file_times) - 1)
+    file_1 = np.clip(index, 0, len(file_times) - 1)
+
+    # Weights in time, only used for observations in between two files.
+    dt = (file_times[file_1] - file_times[file_0]).astype(float)
+    weight = np.zeros(len(obs_time))
+    between = dt > 0
+    weight[between] = (obs_time[between] - file_times[file_0][between]).astype(float) / dt[between]
+
+    if not time_interp:
+        file_0 = np.where(weight > 0.5, file_1, file_0)
+        weight[:] = 0
+
+    # Observations outside of the time span
+    outside = (obs_time < file_times[0] - half_period) | (obs_time > file_times[-1] + half_period)
+    file_0[outside] = -1
+    file_1[outside] = -1
+    weight[outside] = 0
+
+    return file_0, file_1, weight
+
+
+def _get_file_values(ds, obs_groups, var_list, row, col, obs_depth):
+    """ Returns values of an opened file for each group of observations.
+    """
+
+    # Only reading the rows and cols needed
+    obs_ids = np.concatenate([ids for _, ids in obs_groups])
+    rows, row_inverse = np.unique(row[obs_ids], return_inverse=True)
+    cols, col_inverse = np.unique(col[obs_ids], return_inverse=True)
+
+    dict_range = {ds.attrs['dim_y']: rows, ds.attrs['dim_x']: cols}
+    mask = ds.data_vars['mask'].isel(dict_range).data
+
+    var_values = {}
+    for v in var_list:
+        var_da = ds.data_vars[v].isel(dict_range)
+
+        # Removing time dimension, ANHA files have one time step per file.
+        if 'time_counter' in var_da.dims:
+            var_da = var_da.isel(time_counter=0)
+        var_data = np.where(mask == 1, var_da.data, np.nan) if var_da.ndim == mask.ndim \
+            else np.where(mask[0] == 1, var_da.data, np.nan)
+
+        # Point values, with depth as first axis for 3D vars.
+        points = var_data[..., row_inverse, col_inverse]
+
+        if var_da.ndim == 3:
+            depth = ds.coords[ds.attrs['coord_depth']].data
+            if obs_depth is None:
+                points = points[0]
+            else:
+                points = _interp_depth(points, depth, obs_depth[obs_ids])
+
+        var_values[v] = points
+
+    # Splitting values back into groups
+    file_values = []
+    start = 0
+    for _, ids in obs_groups:
+        file_values.append({v: var_values[v][start:start + len(ids)] for v in var_list})
+        start += len(ids)
+
+    return file_values
+
+
+def _interp_depth(profiles, depth, obs_depth):
+    """ Linear interpolation in depth for many profiles at once.
+
+        Parameters
+        ----------
+        profiles : ndarray
+            2D array (depth, obs) with one profile per observation.
+        depth : ndarray
+            Depth levels of profiles.
+        obs_depth : ndarray
+            Depth of each observation.
+
+    """
+
+    # Observations above the first level use the first level.
+    obs_depth = np.maximum(obs_depth, depth[0])
+
+    index = np.clip(np.searchsorted(depth, obs_depth), 1, len(depth) - 1)
+    weight = (obs_depth - depth[index - 1]) / (depth[index] - depth[index - 1])
+
+    obs_ids = np.arange(profiles.shape[1])
+    values = (1 - weight) * profiles[index - 1, obs_ids] + weight * profiles[index, obs_ids]
+
+    # When the observation falls exactly on a level, the one below may be land.
+    values = np.where(weight == 0, profiles[index - 1, obs_ids], values)
+
+    # Observations below the deepest level
+    values[obs_depth > depth[-1]] = np.nan
+
+    return values
+
+
+def get_cell_sizes(lat, lon):
+    """ Returns size of each grid cell, as the largest distance to its neighbours along each axis. [in km]
+        Neighbours with lat=lon=0 (fill values of land-eliminated blocks) are ignored.
+
+        Parameters
+        ----------
+        lat, lon : ndarray
+            2D arrays with grid latitudes and longitudes. [in degrees]
+
+    """
+
+    xyz = lat_lon_to_xyz(lat, lon)
+    fill = (np.asarray(lat) == 0) & (np.asarray(lon) == 0)
+    cell_sizes = np.zeros(np.shape(lat))
+
+    for axis in [0, 1]:
+        if xyz.shape[axis] < 2:
+            continue
+        chord = np.linalg.norm(np.diff(xyz, axis=axis), axis=-1)
+        n = fill.shape[axis]
+        chord[np.take(fill, range(n - 1), axis=axis) | np.take(fill, range(1, n), axis=axis)] = 0
+        # Distances to the next and previous neighbours, so cells next to fill values keep the other one.
+        edge = np.zeros_like(np.take(chord, [0], axis=axis))
+        chord = np.maximum(np.concatenate([chord, edge], axis=axis), np.concatenate([edge, chord], axis=axis))
+        cell_sizes = np.maximum(cell_sizes, 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1)))
+
+    return cell_sizes
+
+
+def lat_lon_to_xyz(lat, lon):
+    """ Converts lat-lon to 3D points on the unit sphere.
+
+        Parameters
+        ----------
+        lat, lon : array_like
+            Latitudes and longitudes. [in degrees]
+
+        Returns
+        -------
+        xyz : ndarray
+            Points, with x, y, z on the last axis.
+
+    """
+
+    lat = np.deg2rad(np.asarray(lat, dtype=float))
+    lon = np.deg2rad(np.asarray(lon, dtype=float))
+
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
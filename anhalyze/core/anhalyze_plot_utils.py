@@ -5,24 +5,68 @@
 import matplotlib
 import numpy as np
 import os
+import sys
+import hashlib
+import logging
+import functools
+import threading
+from contextlib import contextmanager
 
 # Plotting-related libraries
-import matplotlib.pyplot as plt
 import matplotlib.path as mpath
 import matplotlib.colors as mcolors
-import cmocean.cm as cmo
-from IPython.core.getipython import get_ipython
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 from cartopy import crs as ccrs, feature as cfeature
 
 # Project custom made libraries
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.options import OPTIONS
+from anhalyze.core.variables import get_var_info
+
+logger = logging.getLogger(__name__)
 
 # Setting plotting variables as global constants for now
 LEVELS = 21
 LINE_LEVELS = 11
 
-
-def get_plot_config(var, var_data, grid, color_range='default'):
+# Grid cells drawn per pixel of the saved figure along each axis, finer grids are coarsened (level of detail).
+# See `get_lod_factor`.
+LOD_CELLS_PER_PIXEL = 1
+
+# Figure of headless mode, reused by maps of the same thread, see `get_headless_figure`.
+_headless = threading.local()
+
+# Projections available, built on demand given projection information (see `get_projection_info`).
+PROJECTIONS = {'PlateCarree': lambda info: ccrs.PlateCarree(central_longitude=info['central_longitude']),
+               'LambertAzimuthalEqualArea': lambda info: ccrs.LambertAzimuthalEqualArea(
+                   central_longitude=info['central_longitude'],
+                   central_latitude=info['central_latitude']),
+               'AlbersEqualArea': lambda info: ccrs.AlbersEqualArea(
+                   central_longitude=info['central_longitude'],
+                   central_latitude=info['central_latitude'],
+                   standard_parallels=info['standard_parallels']),
+               'NorthPolarStereo': lambda info: ccrs.NorthPolarStereo(central_longitude=info['central_longitude']),
+               'Orthographic': lambda info: ccrs.Orthographic(central_longitude=info['central_longitude'],
+                                                              central_latitude=info['central_latitude']),
+               'Robinson': lambda info: ccrs.Robinson(central_longitude=0),
+               'LambertConformal': lambda info: ccrs.LambertConformal(
+                   central_longitude=info['central_longitude'],
+                   standard_parallels=info['standard_parallels']),
+               'Mercator': lambda info: ccrs.Mercator(central_longitude=0,
+                                                      min_latitude=info['lat_range'][0],
+                                                      max_latitude=info['lat_range'][1]),
+               'AzimuthalEquidistant': lambda info: ccrs.AzimuthalEquidistant(
+                   central_longitude=info['central_longitude'],
+                   central_latitude=info['central_latitude']),
+               }
+
+# Grid coordinates in projection coordinates, keyed by a hash of the grid and projection,
+# see `get_projected_coords`. Oldest grids are removed above `PROJECTED_COORDS_CACHE_SIZE`.
+_PROJECTED_COORDS_CACHE = {}
+PROJECTED_COORDS_CACHE_SIZE = 16
+
+
+def get_plot_config(var, var_data, grid, color_range='default', stats=None):
     """ Return var-dependent plotting information
 
         Parameters
@@ -40,6 +84,9 @@ def get_plot_config(var, var_data, grid, color_range='default'):
                       likely limits the user can find in a ANHA4 outputs.
              local: Color range based on the values within selected area.
              [vmin, vmax]: List of color range limits chosen by the user.
+        stats : dict, optional
+            Precomputed statistics of var_data (min, max, nonzero_min), e.g. from a summary statistics sidecar
+            (see `anhalyze.core.summary_stats`), used instead of scanning var_data for color ranges.
     """
 
     color_range_options = ['default', 'local']
@@ -50,41 +97,28 @@ def get_plot_config(var, var_data, grid, color_range='default'):
     assert color_range in color_range_options or isinstance(color_range, list), assert_message
 
     # Selection of cmap and vrange given var.
-    if var == 'votemper':  # Temperature
-        cmap = cmo.thermal  # Other possible colors: 'plasma', 'magma'
-        vrange = [-2, 30]    # Physical based values
-    elif var == 'vosaline':  # Salinity
-        cmap = cmo.haline  # Other possible colors: 'winter'
-        vrange = [25, 38]    # Physical based values
-    elif var == 'ileadfra':  # Sea ice concentration
-        cmap = cmo.ice
-        vrange = [0, 1]  # Physical based values
-    elif var == 'chl':  # Chlorophyll
-        cmap = cmo.algae
-        vrange = [10, 1000]  # Placeholder for physical based values
-    elif (grid in ['gridU', 'gridV']) or (var in ['iicevelu', 'iicevelv']):
-        cmap = cmo.balance
-        vrange = [-1.5, 1.5]
-    elif grid == 'icebergs':
-        cmap = cmo.thermal
-        vrange = [0.00000001, 0.001]
-    else:
-        cmap = 'spring'
-        vrange = None
+    var_info = get_var_info(var, grid)
+    cmap = get_cmap(var_info['cmap'])
+    vrange = var_info['vrange']
 
     # When the user decides by the local color range option,
     # the range is selected from the dataset values.
     if not vrange or color_range == 'local':
         # Set always zero as center for divergent color scheme
-        if cmap == cmo.balance:
+        if stats is not None:
+            vmin, vmax = stats['min'], stats['max']
+        else:
+            vmin, vmax = np.nanmin(var_data), np.nanmax(var_data)
+
+        if var_info['divergent']:
             # Base vrange in the maximum distance from zero in the dataset.
-            vdistmax = np.nanmax(np.abs(var_data))
+            # From min and max, to avoid a full-size temporary with np.abs.
+            vdistmax = max(-vmin, vmax)
             vrange = [-vdistmax, vdistmax]
-            print('[anhalyze_plot_utils] vrange based on the maximum distance from zero within the dataset values.')
-            print(f'  vrange: {vrange}')
+            logger.info('vrange based on the maximum distance from zero within the dataset values: %s', vrange)
         else:
-            vrange = [np.nanmin(var_data), np.nanmax(var_data)]
-            print(f'[anhalyze_plot_utils]  vrange: {vrange}')
+            vrange = [vmin, vmax]
+            logger.info('vrange: %s', vrange)
     else:
         vrange = vrange
 
@@ -94,13 +128,19 @@ def get_plot_config(var, var_data, grid, color_range='default'):
 
     # Colorbar boundaries normalization based on vrange and LEVELS. Applicable only in pcolormesh plots.
     # Does not clip out values beyond the limits.
-    if grid == 'icebergs' or var == 'chl':
+    if var_info['log']:
         # Logarithmic scale doesn't work when a vrange lim is set as 0.
         # We replace that by using the value closest to 0 in the dataset.
         if 0 in vrange:
-            print('[anhalyze_plot_utils] A value in vrange is equal to 0, it cant be used in log plot.')
-            newv = np.nanmin(np.abs(var_data[np.nonzero(var_data)]))  # get the value closest to 0 from the dataset.
-            print(f'[anhalyze_plot_utils] Replacing by the data value closest to 0: {newv}')
+            logger.info('A value in vrange is equal to 0, it cant be used in log plot.')
+            # Get the value closest to 0 from the dataset, without copying nonzero values.
+            if stats is not None:
+                newv = stats['nonzero_min']
+            else:
+                var_values = np.asarray(var_data)
+                newv = min(np.nanmin(var_values, where=var_values > 0, initial=np.inf),
+                           -np.nanmax(var_values, where=var_values < 0, initial=-np.inf))
+            logger.info('Replacing by the data value closest to 0: %s', newv)
 
             # Replace 0 value with new value
             i = vrange.index(0)
@@ -116,16 +156,56 @@ def get_plot_config(var, var_data, grid, color_range='default'):
     return cmap, vrange, cnorm
 
 
-def get_feature_mask(feature='land', resolution='50m'):
+def get_cmap(cmap_name):
+    """ Returns colormap given its name in the variable table, 'cmo.*' names are cmocean colormaps.
+
+        Parameters
+        ----------
+        cmap_name : str
+            Colormap name, e.g. 'cmo.thermal' or 'spring'.
+    """
+
+    if cmap_name.startswith('cmo.'):
+        import cmocean.cm as cmo
+        return getattr(cmo, cmap_name[len('cmo.'):])
+
+    # Matplotlib colormap names are used directly.
+    return cmap_name
+
+
+def is_notebook():
+    """ Returns True if running in a Jupyter notebook.
+        IPython is only checked if already imported, i.e. it is never imported here.
+    """
+
+    if 'IPython' not in sys.modules:
+        return False
+
+    return sys.modules['IPython'].get_ipython().__class__.__name__ == 'ZMQInteractiveShell'
+
+
+def get_feature_mask(feature='land', resolution='50m', projection=None, extent=None):
     """
         Wrapper to set `cfeature.NaturalEarthFeature` up, to plot as background in `show_var_data_map`.
 
+        When `projection` and `extent` are given, geometries are read from local shapefiles, clipped to the extent
+        and projected once, then cached (see `anhalyze.core.natural_earth`), and no download is attempted.
+
         Parameters
         ----------
         feature : str,  optional
             Sets natural earth features for 'land/ocean' in cartopy.
         resolution : str, optional
             Available resolutions ‘10m’, ‘50m’, or ‘110m’.
+        projection : cartopy.crs.Projection, optional
+            Map projection, to use cached geometries.
+        extent : list, optional
+            Map extent as [lon_min, lon_max, lat_min, lat_max], to use cached geometries.
+
+        Returns
+        -------
+        feature_mask : cartopy.feature.Feature | None
+            None if cached geometries are requested and the shapefile is not available locally.
     """
 
     # Select face color
@@ -136,6 +216,16 @@ def get_feature_mask(feature='land', resolution='50m'):
     else:
         facecolor = matplotlib.colors.to_hex('gray')
 
+    # Construct feature mask from cached geometries, already projected.
+    if projection is not None and extent is not None:
+        from anhalyze.core.natural_earth import get_feature_geometries
+
+        geometries = get_feature_geometries(feature, resolution, projection, extent)
+        if geometries is None:
+            return None
+
+        return cfeature.ShapelyFeature(geometries, projection, edgecolor='face', facecolor=facecolor)
+
     # Construct feature mask
     feature_mask = cfeature.NaturalEarthFeature('physical', feature,
                                                 scale=resolution,
@@ -164,27 +254,9 @@ def get_projection(proj_name='LambertConformal', proj_info=None):
     if proj_info is None:
         raise "Argument proj_info is None. Use get_projection_info do obtain projection information from `AnhaDataset`."
 
-    # Creating list of available projections
-    proj_list = {'PlateCarree': ccrs.PlateCarree(central_longitude=proj_info['central_longitude']),
-                 'LambertAzimuthalEqualArea': ccrs.LambertAzimuthalEqualArea(
-                     central_longitude=proj_info['central_longitude'],
-                     central_latitude=proj_info['central_latitude']),
-                 'AlbersEqualArea': ccrs.AlbersEqualArea(
-                     central_longitude=proj_info['central_longitude'],
-                     central_latitude=proj_info['central_latitude'],
-                     standard_parallels=proj_info['standard_parallels']),
-                 'NorthPolarStereo': ccrs.NorthPolarStereo(central_longitude=proj_info['central_longitude']),
-                 'Orthographic': ccrs.Orthographic(central_longitude=proj_info['central_longitude'],
-                                                   central_latitude=proj_info['central_latitude']),
-                 'Robinson': ccrs.Robinson(central_longitude=0),
-                 'LambertConformal': ccrs.LambertConformal(central_longitude=proj_info['central_longitude'],
-                                                           standard_parallels=proj_info['standard_parallels']),
-                 'Mercator': ccrs.Mercator(central_longitude=0,
-                                           min_latitude=proj_info['lat_range'][0],
-                                           max_latitude=proj_info['lat_range'][1]),
-                 'AzimuthalEquidistant': ccrs.AzimuthalEquidistant(central_longitude=proj_info['central_longitude'],
-                                                                   central_latitude=proj_info['central_latitude']),
-                 }
+    assert_message = f'[anhalyze_plot_utils] Projection {proj_name} '
+    assert_message += f'not found in list of projections available: {list(PROJECTIONS.keys())}'
+    assert proj_name in list(PROJECTIONS.keys()), assert_message
 
     # Setting y_inline dependent on projection
     if proj_name in ['Orthographic', 'NorthPolarStereo']:
@@ -192,15 +264,68 @@ def get_projection(proj_name='LambertConformal', proj_info=None):
     else:
         y_inline = False
 
-    assert_message = f'[anhalyze_plot_utils] Projection {proj_name} '
-    assert_message += f'not found in list of projections available: {list(proj_list.keys())}'
-    assert proj_name in list(proj_list.keys()), assert_message
-
-    proj_config = proj_list[proj_name]
+    # Projection built only once for given projection information.
+    proj_config = _get_projection(proj_name, tuple(sorted(proj_info.items())))
 
     return proj_config, y_inline
 
 
+@functools.lru_cache(maxsize=64)
+def _get_projection(proj_name, proj_info_items):
+    """ Returns projection given its name and information as sorted (key, value) items, memoized.
+    """
+
+    return PROJECTIONS[proj_name](dict(proj_info_items))
+
+
+def get_projected_coords(lon, lat, projection):
+    """ Returns grid longitudes and latitudes transformed to projection coordinates, computed once per grid
+        and projection, then cached. Used to plot in native projection coordinates, without cartopy
+        transforming every grid point for each plot.
+
+        Parameters
+        ----------
+        lon, lat : ndarray
+            2D arrays with grid longitudes and latitudes. [in degrees]
+        projection : cartopy.crs.Projection
+            Map projection.
+
+        Returns
+        -------
+        x, y : ndarray | None
+            2D arrays with projection coordinates, None if the grid can not be plotted in projection coordinates
+            (points outside the projection domain, or cells wrapped around the projection boundary).
+    """
+
+    lon = np.ascontiguousarray(lon, dtype=np.float64)
+    lat = np.ascontiguousarray(lat, dtype=np.float64)
+
+    key = hashlib.sha1(lon.tobytes() + lat.tobytes() + str(lon.shape).encode() +
+                       repr((projection.proj4_init, projection.x_limits, projection.y_limits)).encode()).hexdigest()
+
+    if key in _PROJECTED_COORDS_CACHE:
+        METRICS.increment('projected_coords_hits')
+        return _PROJECTED_COORDS_CACHE[key]
+
+    METRICS.increment('projected_coords_misses')
+
+    points = projection.transform_points(ccrs.PlateCarree(), lon, lat)
+    x, y = points[..., 0], points[..., 1]
+
+    # Cells spanning more than half the projection width are wrapped around its boundary (e.g. at the dateline).
+    x_width = projection.x_limits[1] - projection.x_limits[0]
+    wrapped = any(np.abs(np.diff(x, axis=axis)).max(initial=0) > x_width / 2 for axis in [0, 1])
+
+    coords = None if wrapped or not (np.isfinite(x).all() and np.isfinite(y).all()) else (x, y)
+
+    # Oldest grids removed first.
+    if len(_PROJECTED_COORDS_CACHE) >= PROJECTED_COORDS_CACHE_SIZE:
+        _PROJECTED_COORDS_CACHE.pop(next(iter(_PROJECTED_COORDS_CACHE)))
+    _PROJECTED_COORDS_CACHE[key] = coords
+
+    return coords
+
+
 def get_projection_info(attrs):
     """ Calculate information used to set map projection in `show_var_data_map`.
     
@@ -245,7 +370,8 @@ def get_projection_info(attrs):
     return proj_info
 
 
-def show_var_data_map(var_da, attrs, color_range='default', savefig=None, proj_name=''):
+def show_var_data_map(var_da, attrs, color_range='default', savefig=None, proj_name='', full_resolution=False,
+                      stats=None, headless=None, dpi=None, image_format=None):
     """ Displays map of given parameter (var) in lat-lon range and depth.
 
         Parameters
@@ -270,13 +396,267 @@ def show_var_data_map(var_da, attrs, color_range='default', savefig=None, proj_n
             The projections available are: 'PlateCarree', 'LambertAzimuthalEqualArea','AlbersEqualArea',
             'NorthPolarStereo', 'Orthographic', 'Robinson',
             'LambertConformal', 'Mercator', and 'AzimuthalEquidistant'.
+        full_resolution : bool, optional
+            If True, the grid is plotted at full resolution, otherwise grids finer than the figure resolution
+            are coarsened (see `get_lod_factor`). [default: False]
+        stats : dict, optional
+            Precomputed statistics of var data, for local color range, see `get_plot_config`.
+        headless : bool, optional
+            If True, the map is only saved (savefig required), without display nor pyplot, on a figure reused
+            between maps (see `get_headless_figure`). [default: global `headless` option, see `anhalyze.set_options`]
+        dpi : float, optional
+            Resolution of saved figure. [default: matplotlib 'savefig.dpi']
+        image_format : str, optional
+            Format of saved figure, e.g. 'png' or 'jpg'. [default: from savefig extension]
+
+        Returns
+        -------
+        savefig : str | None
+            Filename of saved figure, None if not saved.
     """
 
-    # Setting color bar feature
-    if color_range == 'default':
-        bar_extend = 'neither'
+    # Including path from original file if not given
+    if savefig and not os.path.dirname(savefig):
+        savefig = os.path.join(attrs["filepath"], savefig)
+
+    # Getting lat and lon
+    lat, lon = np.squeeze(var_da.coords[attrs['coord_lat']].data), np.squeeze(var_da.coords[attrs['coord_lon']].data)
+
+    # Get var data to 2D for plotting.
+    var_data = np.squeeze(var_da.data)
+
+    with open_figure(var_da.name, savefig=savefig, headless=headless, dpi=dpi, image_format=image_format) as fig:
+        # Set up projection, background features and grid-lines
+        ax = setup_map_axes(fig, attrs, proj_name)
+
+        # Get var-dependent plotting information
+        cmap, vrange, cnorm = get_plot_config(str(var_da.name), var_data, grid=attrs['grid'],
+                                              color_range=color_range, stats=stats)
+
+        # Plotting var data, coarsened for the resolution of the saved figure.
+        lod_factor = 1 if full_resolution else get_lod_factor(ax, var_data.shape, dpi=dpi)
+        artists = plot_var_data(ax, lon, lat, var_data, attrs, cmap, vrange, cnorm,
+                                color_range=color_range, proj_name=proj_name, lod_factor=lod_factor)
+
+        # Set Color-bar
+        add_colorbar(fig, ax, artists[0], var_da, attrs, vrange, color_range=color_range)
+
+    return savefig
+
+
+def show_hovmoller(hovmoller_da, color_range='default', savefig=None, headless=None, dpi=None, image_format=None):
+    """ Displays Hovmöller diagram, see `anhalyze.core.hovmoller.get_hovmoller`.
+        Time is along the y-axis of time-longitude diagrams, and along the x-axis of others (time-latitude,
+        time-depth, with depth downwards).
+
+        Parameters
+        ----------
+        hovmoller_da : xarray.DataArray
+            Hovmöller diagram, with dimensions (time, axis), and grid name of the variable in attribute `grid`
+            (for its colormap). [default grid: 'gridT']
+        color_range : str | list, optional
+            Color range either `default` limits, `local` data values or a two items list [vmin, vmax],
+            see `get_plot_config`. [default: 'default']
+        savefig : str, optional
+            Filename to save figure including path.
+        headless : bool, optional
+            If True, the diagram is only saved (savefig required), see `show_var_data_map`.
+            [default: global `headless` option, see `anhalyze.set_options`]
+        dpi : float, optional
+            Resolution of saved figure. [default: matplotlib 'savefig.dpi']
+        image_format : str, optional
+            Format of saved figure, e.g. 'png' or 'jpg'. [default: from savefig extension]
+
+        Returns
+        -------
+        savefig : str | None
+            Filename of saved figure, None if not saved.
+    """
+
+    time_dim, axis = hovmoller_da.dims
+    var_data = hovmoller_da.values
+
+    with open_figure(f'{hovmoller_da.name}_{axis}', savefig=savefig, headless=headless, dpi=dpi,
+                     image_format=image_format) as fig:
+        ax = fig.add_subplot(1, 1, 1)
+
+        # Same colormaps and color levels as maps of the variable grid.
+        cmap, vrange, cnorm = get_plot_config(str(hovmoller_da.name), var_data,
+                                              grid=hovmoller_da.attrs.get('grid', 'gridT'), color_range=color_range)
+
+        times, values = hovmoller_da[time_dim].values, hovmoller_da[axis].values
+        if axis == 'lon':
+            im = ax.pcolormesh(values, times, np.ma.masked_invalid(var_data), cmap=cmap, norm=cnorm,
+                               shading='nearest')
+            ax.set_xlabel('Longitude [degrees]')
+        else:
+            im = ax.pcolormesh(times, values, np.ma.masked_invalid(var_data).T, cmap=cmap, norm=cnorm,
+                               shading='nearest')
+            if axis == 'depth':
+                ax.invert_yaxis()
+                ax.set_ylabel(f"Depth [{hovmoller_da[axis].attrs.get('units', 'm')}]")
+            else:
+                ax.set_ylabel('Latitude [degrees]')
+
+        extend = 'neither' if color_range == 'default' else 'both'
+        label = '%s [%s]' % (hovmoller_da.attrs.get('long_name', hovmoller_da.name).title(),
+                             hovmoller_da.attrs.get('units', ''))
+        fig.colorbar(im, ax=ax, label=label, extend=extend)
+        if axis != 'lon':
+            fig.autofmt_xdate()
+        fig.tight_layout()
+
+    return savefig
+
+
+def show_section(section_da, color_range='default', savefig=None, headless=None, dpi=None, image_format=None):
+    """ Displays vertical section along a transect, see `anhalyze.core.transect.get_section`,
+        with distance along the x-axis, depth downwards, and waypoints as dashed lines.
+
+        Parameters
+        ----------
+        section_da : xarray.DataArray
+            Section, with dimensions (depth, distance), and grid name of the variable in attribute `grid`
+            (for its colormap). [default grid: 'gridT']
+        color_range : str | list, optional
+            Color range either `default` limits, `local` data values or a two items list [vmin, vmax],
+            see `get_plot_config`. [default: 'default']
+        savefig : str, optional
+            Filename to save figure including path.
+        headless : bool, optional
+            If True, the section is only saved (savefig required), see `show_var_data_map`.
+            [default: global `headless` option, see `anhalyze.set_options`]
+        dpi : float, optional
+            Resolution of saved figure. [default: matplotlib 'savefig.dpi']
+        image_format : str, optional
+            Format of saved figure, e.g. 'png' or 'jpg'. [default: from savefig extension]
+
+        Returns
+        -------
+        savefig : str | None
+            Filename of saved figure, None if not saved.
+    """
+
+    assert section_da.dims == ('depth', 'distance'), \
+        f'[Anhalyze] Section dimensions {section_da.dims} should be (depth, distance).'
+
+    var_data = section_da.values
+
+    with open_figure(f'{section_da.name}_section', savefig=savefig, headless=headless, dpi=dpi,
+                     image_format=image_format) as fig:
+        ax = fig.add_subplot(1, 1, 1)
+
+        # Same colormaps and color levels as maps of the variable grid.
+        cmap, vrange, cnorm = get_plot_config(str(section_da.name), var_data,
+                                              grid=section_da.attrs.get('grid', 'gridT'), color_range=color_range)
+
+        im = ax.pcolormesh(section_da['distance'].values, section_da['depth'].values,
+                           np.ma.masked_invalid(var_data), cmap=cmap, norm=cnorm, shading='nearest')
+        for distance in section_da['distance'].attrs.get('waypoint_distance', [])[1:-1]:
+            ax.axvline(distance, color='k', linestyle='--', linewidth=0.8)
+
+        ax.invert_yaxis()
+        ax.set_xlabel('Distance [km]')
+        ax.set_ylabel(f"Depth [{section_da['depth'].attrs.get('units', 'm')}]")
+
+        extend = 'neither' if color_range == 'default' else 'both'
+        label = '%s [%s]' % (section_da.attrs.get('long_name', section_da.name).title(),
+                             section_da.attrs.get('units', ''))
+        fig.colorbar(im, ax=ax, label=label, extend=extend)
+        fig.tight_layout()
+
+    return savefig
+
+
+@contextmanager
+def open_figure(num, savefig=None, headless=None, dpi=None, image_format=None):
+    """ Context manager yielding a new figure, then displayed (unless headless) and saved on exit.
+        Used by `show_var_data_map`, `show_hovmoller` and `show_section`.
+
+        Parameters
+        ----------
+        num : str
+            Figure name, for pyplot figures.
+        savefig : str, optional
+            Filename to save figure including path.
+        headless : bool, optional
+            If True, the figure is only saved (savefig required), without display nor pyplot, on a figure reused
+            between figures (see `get_headless_figure`). [default: global `headless` option, see `anhalyze.set_options`]
+        dpi : float, optional
+            Resolution of saved figure. [default: matplotlib 'savefig.dpi']
+        image_format : str, optional
+            Format of saved figure, e.g. 'png' or 'jpg'. [default: from savefig extension]
+
+        Yields
+        ------
+        fig : matplotlib.figure.Figure
+            Figure to plot on.
+    """
+
+    if headless is None:
+        headless = OPTIONS['headless']
+
+    assert savefig or not headless, '[Anhalyze] savefig should be given in headless mode, maps are not displayed.'
+
+    if headless:
+        fig = get_headless_figure()
     else:
-        bar_extend = 'both'
+        import matplotlib.pyplot as plt
+        fig = plt.figure(num=num)
+
+    yield fig
+
+    # Display figure when using ipython/terminal
+    if not headless and not is_notebook():
+        plt.ion()
+        fig.show()
+
+    # Save plot if filename is provided
+    if savefig:
+        logger.info('Saving figure: %s', savefig)
+        fig.savefig(savefig, dpi=dpi, format=image_format)
+
+    # Figure cleared for the next one.
+    if headless:
+        fig.clear()
+
+
+def get_headless_figure():
+    """ Returns figure of headless mode, cleared: drawn with the Agg backend, without pyplot (never displayed,
+        nor kept open by pyplot), and created once per thread, so that memory use stays flat over many maps.
+    """
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = getattr(_headless, 'figure', None)
+    if fig is None:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        _headless.figure = fig
+    else:
+        fig.clear()
+
+    return fig
+
+
+def setup_map_axes(fig, attrs, proj_name='LambertConformal'):
+    """ Adds map axes to figure, with projection and extent given the `AnhaDataset` lat-lon limits,
+        ocean and land background features, and grid-lines. Used by `show_var_data_map` and `MapRenderer`.
+
+        Parameters
+        ----------
+        fig : matplotlib.figure.Figure
+            Figure.
+        attrs : dict
+            Attributes from `AnhaDataset`
+        proj_name : str, optional
+            Projection name, see `get_projection`. [default: 'LambertConformal']
+
+        Returns
+        -------
+        ax : cartopy.mpl.geoaxes.GeoAxes
+    """
 
     # Calculate projection information (e.g. Standard parallels) based on the dataset lat and lon limits
     proj_info = get_projection_info(attrs)
@@ -284,14 +664,6 @@ def show_var_data_map(var_da, attrs, color_range='default', savefig=None, proj_n
     # Select figure projection
     proj_config, y_inline = get_projection(proj_name, proj_info)
 
-    # getting lat and lon
-    lat, lon = np.squeeze(var_da.coords[attrs['coord_lat']].data), np.squeeze(var_da.coords[attrs['coord_lon']].data)
-
-    # Get var data to 2D for plotting.
-    var_data = np.squeeze(var_da.data)
-
-    # Set up figure and projection
-    fig = plt.figure(num=var_da.name)
     ax = fig.add_subplot(1, 1, 1,
                          projection=proj_config)
 
@@ -311,44 +683,228 @@ def show_var_data_map(var_da, attrs, color_range='default', savefig=None, proj_n
             circle = mpath.Path(verts * radius + center)
             ax.set_boundary(circle, transform=ax.transAxes)
 
-    # Adding ocean and land features
-    ax.add_feature(get_feature_mask(), zorder=1)
-    ax.add_feature(get_feature_mask(feature='ocean'), zorder=0)
+    # Adding ocean and land features, from cached geometries within the dataset extent.
+    extent = attrs['coord_lon_range'] + attrs['coord_lat_range']
+    for feature, zorder in [('land', 1), ('ocean', 0)]:
+        feature_mask = get_feature_mask(feature=feature, projection=proj_config, extent=extent)
+        if feature_mask is not None:
+            ax.add_feature(feature_mask, zorder=zorder)
+
+    # Create grid-line labels
+    gl = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True, x_inline=False,
+                      y_inline=y_inline, color='k', alpha=.3)
+    gl.right_labels = gl.top_labels = False
 
-    # Get var-dependent plotting information
-    cmap, vrange, cnorm = get_plot_config(str(var_da.name), var_data, grid=attrs['grid'], color_range=color_range)
+    return ax
+
+
+def use_pcolormesh(attrs, color_range, cnorm):
+    """ Returns True if var data is plotted with pcolormesh, instead of filled contours.
+
+        When plotting using projections with the North Pole as either as center or included in the plot,
+        or is a Log normalized dataset, contourf creates weird and unrealistic shapes.
+        Probably related with ANHA4 grid. Use pcolormesh instead.
+        Also, in case of manually selected color range, to rightly show the colorbar in the selected range,
+        its necessary to plot the data using pcolormesh.
+    """
 
-    # When plotting using projections with the North Pole as either as center or included in the plot,
-    # or is a Log normalized dataset, contourf creates weird and unrealistic shapes.
-    # Probably related with ANHA4 grid. Use pcolormesh instead.
-    # Also, in case of manually selected color range, to rightly show the colorbar in the selected range,
-    # its necessary to plot the data using pcolormesh. Shading option smooths the edges.
     # TODO The "> 89" could be replaced by something like attrs['file_category'] == northpole_included/polar
-    if attrs['coord_lat_range'][1] > 89 or isinstance(color_range, list) or 'Log' in str(type(cnorm)):
+    return attrs['coord_lat_range'][1] > 89 or isinstance(color_range, list) or 'Log' in str(type(cnorm))
+
+
+def plot_var_data(ax, lon, lat, var_data, attrs, cmap, vrange, cnorm, color_range='default',
+                  proj_name='LambertConformal', levels=LEVELS, extend='neither', lod_factor=None):
+    """ Plots 2D var data on map axes, with pcolormesh or filled contours (see `use_pcolormesh`).
+
+        Parameters
+        ----------
+        ax : cartopy.mpl.geoaxes.GeoAxes
+            Map axes, see `setup_map_axes`.
+        lon, lat : ndarray
+            2D arrays with grid longitudes and latitudes.
+        var_data : ndarray
+            2D array with var data.
+        attrs : dict
+            Attributes from `AnhaDataset`
+        cmap, vrange, cnorm :
+            Plotting information, see `get_plot_config`.
+        color_range : str | list, optional
+            Color range, see `get_plot_config`. [default: 'default']
+        proj_name : str, optional
+            Projection name, see `get_projection`. [default: 'LambertConformal']
+        levels : int | array_like, optional
+            Levels of filled contours. [default: LEVELS]
+        extend : str, optional
+            Filled contours extension beyond levels, 'neither', 'both', 'min' or 'max'. [default: 'neither']
+        lod_factor : int, optional
+            Grid coarsening factor (level of detail), 1 for full resolution.
+            [default: from the figure resolution, see `get_lod_factor`]
+
+        Returns
+        -------
+        artists : list
+            Plotted artists, the first one being the color mapped one (`QuadMesh` or filled `ContourSet`).
+    """
+
+    # Plotting in native projection coordinates, cached, when possible.
+    coords = get_projected_coords(lon, lat, ax.projection)
+    if coords is not None:
+        (x, y), transform = coords, ax.projection
+    else:
+        x, y, transform = lon, lat, ccrs.PlateCarree()
 
-        # Avoiding incompatible proj_name/shading combination
+    # Grid coarsened to the figure resolution, cells smaller than a pixel are not drawn.
+    if lod_factor is None:
+        lod_factor = get_lod_factor(ax, var_data.shape)
+    if lod_factor > 1:
+        logger.debug('Grid coarsened by a factor %s for the figure resolution.', lod_factor)
+        x, y = coarsen_coords(x, y, lod_factor, geographic=coords is None)
+        var_data = coarsen_data(var_data, lod_factor)
+
+    if use_pcolormesh(attrs, color_range, cnorm):
+
+        # Avoiding incompatible proj_name/shading combination. Shading option smooths the edges.
         if proj_name == 'LambertAzimuthalEqualArea':
             shading = 'auto'
         else:
             shading = 'gouraud'
 
-        im = ax.pcolormesh(lon, lat, var_data, cmap=cmap, shading=shading,
-                           norm=cnorm, transform=ccrs.PlateCarree(), zorder=2)
-    else:
-        # In case of plotting smaller regions, contourf smoothly gets the job done.
+        im = ax.pcolormesh(x, y, var_data, cmap=cmap, shading=shading,
+                           norm=cnorm, transform=transform, zorder=2)
 
-        # Plotting var data as filled contour regions
-        im = ax.contourf(lon, lat, var_data, levels=LEVELS,  vmin=vrange[0], vmax=vrange[1],
-                         cmap=cmap, transform=ccrs.PlateCarree(), zorder=2)
-        # Plotting var data contour lines
-        ax.contour(lon, lat, var_data, levels=LINE_LEVELS, cmap='Greys', linewidths=.2, transform=ccrs.PlateCarree())
+        return [im]
 
-    # Create grid-line labels
-    gl = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True, x_inline=False,
-                      y_inline=y_inline, color='k', alpha=.3)
-    gl.right_labels = gl.top_labels = False
+    # In case of plotting smaller regions, contourf smoothly gets the job done.
+
+    # Plotting var data as filled contour regions
+    im = ax.contourf(x, y, var_data, levels=levels, vmin=vrange[0], vmax=vrange[1],
+                     cmap=cmap, extend=extend, transform=transform, zorder=2)
+    # Plotting var data contour lines
+    lines = ax.contour(x, y, var_data, levels=LINE_LEVELS, cmap='Greys', linewidths=.2,
+                       transform=transform)
+
+    return [im, lines]
+
+
+def get_lod_factor(ax, shape, dpi=None):
+    """ Returns coarsening factor (level of detail) of a grid plotted on map axes, so that it has about
+        `LOD_CELLS_PER_PIXEL` cells per pixel of the saved figure along each axis. 1 if the grid is not finer.
+
+        Parameters
+        ----------
+        ax : cartopy.mpl.geoaxes.GeoAxes
+            Map axes.
+        shape : tuple
+            Grid shape (ny, nx).
+        dpi : float, optional
+            Resolution of the saved figure. [default: matplotlib 'savefig.dpi', or figure dpi]
+    """
+
+    fig = ax.figure
+    if dpi is None:
+        dpi = matplotlib.rcParams['savefig.dpi']
+        if dpi == 'figure':
+            dpi = fig.dpi
+
+    bbox = ax.get_position()
+    n_pixels = (fig.get_figwidth() * bbox.width * dpi) * (fig.get_figheight() * bbox.height * dpi)
+
+    return max(1, int(np.sqrt(shape[0] * shape[1] / n_pixels) / LOD_CELLS_PER_PIXEL))
+
+
+def coarsen_data(var_data, factor):
+    """ Returns 2D data coarsened by block means of factor x factor cells (smaller blocks at the edges).
+        Mask-aware: land/missing cells are excluded from means, and blocks with fewer than half valid cells
+        are missing, so that coastlines are kept.
+
+        Parameters
+        ----------
+        var_data : ndarray
+            2D array with var data, NaN or masked where missing. Arrays with more dimensions
+            (e.g. depth, y, x) are coarsened along their last two axes.
+        factor : int
+            Coarsening factor.
+    """
+
+    var_data = np.ma.filled(np.ma.masked_invalid(var_data).astype(np.float64), np.nan)
+    valid = np.isfinite(var_data)
+
+    n_valid = _block_sum(valid.astype(np.float64), factor)
+    n_cells = _block_sum(np.ones(var_data.shape), factor)
+    var_sum = _block_sum(np.where(valid, var_data, 0.), factor)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n_valid >= n_cells / 2, var_sum / n_valid, np.nan)
+
+
+def coarsen_coords(x, y, factor, geographic=False):
+    """ Returns 2D grid coordinates coarsened by block means of factor x factor cells, see `coarsen_data`.
+
+        Parameters
+        ----------
+        x, y : ndarray
+            2D arrays with projection coordinates, or longitudes and latitudes [in degrees] if geographic.
+        factor : int
+            Coarsening factor.
+        geographic : bool, optional
+            If True, means are computed on the sphere, so that blocks across the dateline are kept together.
+            [default: False]
+    """
+
+    n_cells = _block_sum(np.ones(np.shape(x)), factor)
+
+    if not geographic:
+        return _block_sum(np.asarray(x, dtype=np.float64), factor) / n_cells, \
+            _block_sum(np.asarray(y, dtype=np.float64), factor) / n_cells
+
+    lon, lat = np.radians(np.asarray(x, dtype=np.float64)), np.radians(np.asarray(y, dtype=np.float64))
+    xyz = [_block_sum(component, factor) for component in [np.cos(lat) * np.cos(lon),
+                                                         np.cos(lat) * np.sin(lon),
+                                                         np.sin(lat)]]
+
+    return np.degrees(np.arctan2(xyz[1], xyz[0])), np.degrees(np.arctan2(xyz[2], np.hypot(xyz[0], xyz[1])))
+
+
+def _block_sum(a, factor):
+    """ Returns sums of array over blocks of factor x factor cells along its last two axes, smaller at the edges.
+    """
+
+    a = np.add.reduceat(a, np.arange(0, a.shape[-2], factor), axis=-2)
+
+    return np.add.reduceat(a, np.arange(0, a.shape[-1], factor), axis=-1)
+
+
+def add_colorbar(fig, ax, im, var_da, attrs, vrange, color_range='default'):
+    """ Adds color-bar of plotted var data in an inset on the right of map axes.
+
+        Parameters
+        ----------
+        fig : matplotlib.figure.Figure
+            Figure.
+        ax : cartopy.mpl.geoaxes.GeoAxes
+            Map axes.
+        im : matplotlib.cm.ScalarMappable
+            Color mapped artist, see `plot_var_data`.
+        var_da: xarray.DataArray
+            xarray.DataArray for given var, for label (long_name and units).
+        attrs : dict
+            Attributes from `AnhaDataset`
+        vrange : list
+            Color range [vmin, vmax], see `get_plot_config`.
+        color_range : str | list, optional
+            Color range, see `get_plot_config`. [default: 'default']
+
+        Returns
+        -------
+        cbar : matplotlib.colorbar.Colorbar
+    """
+
+    # Setting color bar feature
+    if color_range == 'default':
+        bar_extend = 'neither'
+    else:
+        bar_extend = 'both'
 
-    # Set Color-bar
     axins = inset_axes(ax, width="3%", height="100%", loc='right', borderpad=-3)
     label = '%s [%s]' % (var_da.attrs['long_name'].title(), var_da.attrs['units'])
     cbar = fig.colorbar(im, cax=axins, orientation="vertical", label=label, extend=bar_extend)
@@ -359,17 +915,4 @@ def show_var_data_map(var_da, attrs, color_range='default', savefig=None, proj_n
         cbar.ax.set_yticks(np.arange(vrange[0], vrange[1] * 1.01, step * 2))
         cbar.ax.set_ylim(vrange[0], vrange[1])
 
-    # Display map when using ipython/terminal
-    if get_ipython().__class__.__name__ != 'ZMQInteractiveShell':
-        plt.ion()
-        fig.show()
-
-    # Save plot if filename is provided
-    if savefig:
-        # Including path from original file if not given
-        if not os.path.dirname(savefig):
-            savefig = os.path.join(attrs["filepath"], savefig)
-
-        print(f'[Anhalyze] Saving figure: {savefig}')
-
-        fig.savefig(savefig)
+    return cbar
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Data-related libraries
+import pandas as pd
+import xarray as xr
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset, get_date
+from anhalyze.core.blocks import get_var_stats, get_var_sums
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.options import get_options, init_worker
+from anhalyze.core.prefetch import Prefetcher
+
+
+def get_file_list(path, model_run=None, grid='gridT', years=None, months=None, recursive=False):
+    """ Returns sorted list of files of a run, given a directory.
+
+        Parameters
+        ----------
+        path : str
+            Directory with ANHA files.
+        model_run : str, optional
+            Model run, e.g. 'ANHA4-WLS001'. If None, any run.
+        grid : str, optional
+            Grid type, e.g. 'gridT', 'icemod'. [default: 'gridT']
+        years : list, optional
+            List of years (int). If None, all years.
+        months : list, optional
+            List of months (int). If None, all months.
+        recursive : bool, optional
+            If True, also search subdirectories. [default: False]
+
+    """
+
+    pattern = f'{model_run if model_run else "ANHA*"}_y????m??d??_{grid}.nc'
+    if recursive:
+        pattern = os.path.join('**', pattern)
+
+    file_list = glob.glob(os.path.join(path, pattern), recursive=recursive)
+
+    # Filtering by date
+    if years:
+        file_list = [filename for filename in file_list if get_date(filename, how='y') in years]
+    if months:
+        file_list = [filename for filename in file_list if get_date(filename, how='m') in months]
+
+    return sorted(file_list, key=lambda filename: get_date(filename, how='ymd'))
+
+
+def load_region(filename, var='votemper', sel_kwargs=None, mask_filename=None):
+    """ Returns masked data of a variable within a region, read into memory.
+        Loader used by `Prefetcher` in run-level functions.
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        var : str, optional
+            Variable name. [default: 'votemper']
+        sel_kwargs : dict, optional
+            Selection, with keys of `AnhaDataset.sel` (lat_range, lon_range, depth_range).
+        mask_filename : str, optional
+            Mask filename.
+
+    """
+
+    return open_region(filename, sel_kwargs, mask_filename)._get_var_data_array(var=var).load()
+
+
+def load_region_stats(filename, var='votemper', sel_kwargs=None, mask_filename=None):
+    """ Returns statistics (mean, std, min, max, count) of a variable within a region,
+        read in blocks within the memory limit (see `anhalyze.set_options`).
+        Loader used by `Prefetcher` in `get_timeseries`. See `load_region` for parameters.
+    """
+
+    return get_var_stats(open_region(filename, sel_kwargs, mask_filename), var)
+
+
+def load_region_sums(filename, var='votemper', sel_kwargs=None, mask_filename=None):
+    """ Returns sum and count of valid values of a variable (first time step) within a region,
+        read in blocks within the memory limit (see `anhalyze.set_options`).
+        Loader used by `Prefetcher` in `get_climatology`. See `load_region` for parameters.
+    """
+
+    ds = open_region(filename, sel_kwargs, mask_filename)
+
+    # Removing time dimension, one time step per file.
+    indexers = {'time_counter': 0} if 'time_counter' in ds.data_vars[var].dims else None
+
+    return get_var_sums(ds, var, indexers=indexers)
+
+
+def get_timeseries(file_list, var='votemper', lat_range=None, lon_range=None, depth_range=None,
+                   mask_filename=None, workers=1, chunk_size=None, memory_limit=None, use_mirror=True):
+    """ Returns time series of regional statistics (mean, std, min, max) of a variable, one value per file.
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files.
+        var : str, optional
+            Variable name. [default: 'votemper']
+        lat_range, lon_range, depth_range : list, optional
+            Region, see `AnhaDataset.sel`.
+        mask_filename : str, optional
+            Mask filename.
+        workers : int, optional
+            Number of processes. [default: 1]
+        chunk_size : int, optional
+            Number of files per task, each task reading its files with a `Prefetcher`.
+            [default: files split evenly between workers]
+        memory_limit : int | str, optional
+            Memory budget of files read ahead by each task, e.g. '2GB'.
+            [default: global `memory_limit` option, see `anhalyze.set_options`, also used to read data in blocks]
+        use_mirror : bool, optional
+            If True, read from the Zarr mirror of the run when it is up to date with the files,
+            see `anhalyze.core.zarr_mirror`. [default: True]
+
+        Returns
+        -------
+        timeseries : pandas.DataFrame
+            Columns: date, var_mean, var_std, var_min, var_max.
+
+    """
+
+    sel_kwargs = {'lat_range': lat_range, 'lon_range': lon_range, 'depth_range': depth_range}
+    with METRICS.timer('timeseries'):
+        mirror_ds = _open_mirror_dataset(file_list, var, sel_kwargs, mask_filename) if use_mirror else None
+        if mirror_ds is not None:
+            from anhalyze.core.zarr_mirror import get_mirror_stats
+
+            stats = get_mirror_stats(mirror_ds, var)
+            rows = [[_get_timeseries_row(filename, {key: values[i] for key, values in stats.items()})
+                     for i, filename in enumerate(file_list)]]
+        else:
+            rows = map_chunks(_timeseries_chunk, file_list, workers, chunk_size,
+                               var=var, sel_kwargs=sel_kwargs, mask_filename=mask_filename,
+                               memory_limit=memory_limit)
+
+    return pd.DataFrame([row for chunk_rows in rows for row in chunk_rows])
+
+
+def get_climatology(file_list, var='votemper', lat_range=None, lon_range=None, depth_range=None,
+                    mask_filename=None, workers=1, chunk_size=None, memory_limit=None, use_mirror=True):
+    """ Returns monthly climatology (mean field for each month of the year) of a variable within a region.
+        Files are reduced as they are read, so memory use doesn't grow with the number of files.
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files.
+        var : str, optional
+            Variable name. [default: 'votemper']
+        lat_range, lon_range, depth_range : list, optional
+            Region, see `AnhaDataset.sel`.
+        mask_filename : str, optional
+            Mask filename.
+        workers : int, optional
+            Number of processes. [default: 1]
+        chunk_size : int, optional
+            Number of files per task. [default: files split evenly between workers]
+        memory_limit : int | str, optional
+            Memory budget of files read ahead by each task, e.g. '2GB'.
+            [default: global `memory_limit` option, see `anhalyze.set_options`, also used to read data in blocks]
+        use_mirror : bool, optional
+            If True, read from the Zarr mirror of the run when it is up to date with the files,
+            see `anhalyze.core.zarr_mirror`. [default: True]
+
+        Returns
+        -------
+        climatology : xarray.DataArray
+            Monthly mean with a `month` dimension (months without files are not included),
+            and `count` coordinate with number of files for each month.
+
+    """
+
+    sel_kwargs = {'lat_range': lat_range, 'lon_range': lon_range, 'depth_range': depth_range}
+    with METRICS.timer('climatology'):
+        mirror_ds = _open_mirror_dataset(file_list, var, sel_kwargs, mask_filename) if use_mirror else None
+        if mirror_ds is not None:
+            from anhalyze.core.zarr_mirror import get_mirror_sums
+
+            chunk_sums = [get_mirror_sums(mirror_ds, var, [get_date(filename, how='m') for filename in file_list])]
+        else:
+            chunk_sums = map_chunks(_climatology_chunk, file_list, workers, chunk_size,
+                                     var=var, sel_kwargs=sel_kwargs, mask_filename=mask_filename,
+                                     memory_limit=memory_limit)
+
+    # Combining sums from each task
+    sums, counts, files, template = {}, {}, {}, None
+    for chunk_sum in chunk_sums:
+        for month, (var_sum, var_count, n_files, var_template) in chunk_sum.items():
+            sums[month] = sums.get(month, 0) + var_sum
+            counts[month] = counts.get(month, 0) + var_count
+            files[month] = files.get(month, 0) + n_files
+            template = var_template
+
+    months = sorted(sums)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        clim_data = np.stack([sums[month] / counts[month] for month in months])
+
+    climatology = xr.DataArray(clim_data,
+                               dims=('month',) + template.dims,
+                               coords={name: coord for name, coord in template.coords.items()
+                                       if 'time_counter' not in (name,) + coord.dims} | {'month': months},
+                               attrs=template.attrs,
+                               name=template.name)
+    climatology = climatology.assign_coords(count=('month', [files[month] for month in months]))
+
+    return climatology
+
+
+def map_chunks(function, file_list, workers=1, chunk_size=None, **kwargs):
+    """ Runs function over chunks of file_list, in a process pool if workers > 1.
+        Metrics of workers are added to metrics of this process.
+
+        Parameters
+        ----------
+        function : callable
+            Function called as `function(chunk, **kwargs)`, a module-level function when workers > 1.
+        file_list : list
+            Files (or other tasks) split into chunks.
+        workers : int
+            Number of worker processes. [default: 1, in this process]
+        chunk_size : int
+            Number of files per chunk. [default: files split evenly between workers]
+        **kwargs
+            Other arguments of function.
+
+        Returns
+        -------
+        results : list
+            Output of function for each chunk, in order.
+
+    """
+
+    if not chunk_size:
+        chunk_size = int(np.ceil(len(file_list) / max(1, workers)))
+    chunks = [file_list[i:i + chunk_size] for i in range(0, len(file_list), max(1, chunk_size))]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(get_options(),)) as executor:
+            futures = [executor.submit(_run_chunk, function, chunk, **kwargs) for chunk in chunks]
+
+            results = []
+            for future in futures:
+                result, metrics = future.result()
+                METRICS.merge(metrics)
+                results.append(result)
+
+            return results
+
+    return [function(chunk, **kwargs) for chunk in chunks]
+
+
+def open_region(filename, sel_kwargs=None, mask_filename=None):
+    """ Returns `AnhaDataset` of a file, within a region if sel_kwargs are given.
+
+        Parameters
+        ----------
+        filename : str
+            ANHA file.
+        sel_kwargs : dict
+            Arguments of `AnhaDataset.sel`, e.g. {'lat_range': [60, 75]}.
+        mask_filename : str
+            Mask file.
+
+        Returns
+        -------
+        ds : AnhaDataset
+            Dataset, within the region.
+
+    """
+
+    ds = AnhaDataset(filename, mask_filename=mask_filename)
+    if sel_kwargs and any(sel_kwargs.values()):
+        ds = ds.sel(**sel_kwargs)
+
+    return ds
+
+
+def _open_mirror_dataset(file_list, var, sel_kwargs=None, mask_filename=None):
+    """ Returns `AnhaDataset` of a variable read from the Zarr mirror of the run, None if there is no
+        up-to-date mirror, see `anhalyze.core.zarr_mirror.open_mirror_dataset`.
+    """
+
+    from anhalyze.core.zarr_mirror import open_mirror_dataset
+
+    return open_mirror_dataset(file_list, var, sel_kwargs=sel_kwargs, mask_filename=mask_filename)
+
+
+def _run_chunk(function, file_list, **kwargs):
+    """ Returns function output for a chunk of files, and metrics of this chunk. Used by process pool workers.
+    """
+
+    metrics_snapshot = METRICS.to_dict()
+    result = function(file_list, **kwargs)
+
+    return result, METRICS.since(metrics_snapshot)
+
+
+def _timeseries_chunk(file_list, var, sel_kwargs, mask_filename, memory_limit):
+    """ Returns time series rows for a chunk of files.
+    """
+
+    rows = []
+    for filename, stats in Prefetcher(file_list, loader=load_region_stats, memory_limit=memory_limit,
+                                      var=var, sel_kwargs=sel_kwargs, mask_filename=mask_filename):
+        rows.append(_get_timeseries_row(filename, stats))
+
+    return rows
+
+
+def _get_timeseries_row(filename, stats):
+    """ Returns time series row of a file, given statistics of the region.
+    """
+
+    y, m, d = get_date(filename, how='ymd')
+
+    return {'date': pd.Timestamp(y, m, d),
+            'var_mean': stats['mean'],
+            'var_std': stats['std'],
+            'var_min': stats['min'],
+            'var_max': stats['max']}
+
+
+def _climatology_chunk(file_list, var, sel_kwargs, mask_filename, memory_limit):
+    """ Returns monthly sums and counts for a chunk of files,
+        with first sum of each month as template for coordinates.
+    """
+
+    sums = {}
+    for filename, (var_sum, var_count) in Prefetcher(file_list, loader=load_region_sums, memory_limit=memory_limit,
+                                                     var=var, sel_kwargs=sel_kwargs, mask_filename=mask_filename):
+        month = get_date(filename, how='m')
+        if month in sums:
+            # Adding in place, to keep a single sum per month.
+            month_sum, month_count, n_files, template = sums[month]
+            month_sum += var_sum.values
+            month_count += var_count.values
+            sums[month] = (month_sum, month_count, n_files + 1, template)
+        else:
+            sums[month] = (var_sum.values, var_count.values, 1, var_sum)
+
+    return sums
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import os
+import re
+import logging
+import threading
+import contextlib
+
+# Byte units accepted by `parse_bytes`.
+BYTE_UNITS = {'': 1,
+              'B': 1,
+              'KB': 10 ** 3, 'MB': 10 ** 6, 'GB': 10 ** 9, 'TB': 10 ** 12,
+              'KIB': 2 ** 10, 'MIB': 2 ** 20, 'GIB': 2 ** 30, 'TIB': 2 ** 40}
+
+
+def parse_bytes(size):
+    """ Returns number of bytes given a size as int or str.
+
+        Parameters
+        ----------
+        size : int | float | str
+            Size in bytes, or a str with units, e.g. '500MB', '4GB', '2 GiB'.
+
+        Returns
+        -------
+        n_bytes : int
+            Number of bytes.
+
+    """
+
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([a-zA-Z]*)\s*', str(size))
+    assert match and match.group(2).upper() in BYTE_UNITS, f'[Anhalyze] Size format not recognized: {size}'
+
+    return int(float(match.group(1)) * BYTE_UNITS[match.group(2).upper()])
+
+
+def set_log_level(level):
+    """ Sets level of messages of `anhalyze`, e.g. 'WARNING' to hide
+        informative messages (selections, saved files) in batch jobs.
+        Messages are shown where the application sends them (e.g. `logging.basicConfig()`),
+        the `anhalyze` command shows them on stderr.
+
+        Parameters
+        ----------
+        level : str | int
+            Logging level: 'DEBUG', 'INFO', 'WARNING', 'ERROR', or a `logging` level.
+
+    """
+
+    logging.getLogger('anhalyze').setLevel(level.upper() if isinstance(level, str) else level)
+
+
+@contextlib.contextmanager
+def atomic_write(filename):
+    """ Context manager giving a temporary filename, in the directory of `filename` (created if needed),
+        renamed to `filename` when the block ends without error, and removed otherwise.
+        Readers never see a partially written file.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the file to write.
+
+        Yields
+        ------
+        tmp_filename : str
+            Name of the temporary file to write to.
+
+    """
+
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    os.makedirs(dirname, exist_ok=True)
+    # Unique between processes and threads writing the same file.
+    tmp_filename = os.path.join(dirname, f'.{basename}.tmp{os.getpid()}-{threading.get_ident()}')
+    try:
+        yield tmp_filename
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.isfile(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def get_grid_variables(ds):
+    """ Returns variables of `ds` on the horizontal grid (with both y and x dimensions), without the mask.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset.
+
+        Returns
+        -------
+        variables : list
+            Variable names.
+
+    """
+
+    dim_y, dim_x = ds.attrs['dim_y'], ds.attrs['dim_x']
+
+    return [var for var in ds.data_vars if var != 'mask' and {dim_y, dim_x} <= set(ds.data_vars[var].dims)]
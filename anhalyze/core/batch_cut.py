@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import os
+import json
+import logging
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Data-related libraries
+import pandas as pd
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core import profiling
+from anhalyze.core.anhalyze_utils import atomic_write
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.options import get_options, init_worker
+
+logger = logging.getLogger(__name__)
+
+# Default name of state file, saved in output directory.
+STATE_FILENAME = '.anhalyze_batch_cut_state.json'
+
+# Columns of batch cut reports.
+REPORT_COLUMNS = ['status', 'output', 'seconds', 'bytes_in', 'bytes_out', 'mb_per_s', 'error']
+
+
+def get_output_filename(filename, output_dir, suffix='_CutRegion'):
+    """ Returns deterministic output filename of a cut, given input filename.
+
+        Parameters
+        ----------
+        filename : str
+            Input filename, with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        output_dir : str
+            Output directory.
+        suffix : str, optional
+            Suffix added to filename. [default: '_CutRegion']
+
+    """
+
+    if '.nc' not in suffix[-3:]:
+        suffix += '.nc'
+
+    return os.path.join(output_dir, os.path.basename(filename).replace('.nc', suffix))
+
+
+def cut_file(filename, output_dir, cut_kwargs, suffix='_CutRegion', preset=None, precision=None,
+             variables=None, mask_filename=None, profile=False):
+    """ Cuts region from a single file and saves it. Used by `batch_cut` workers.
+
+        Parameters
+        ----------
+        filename : str
+            Input filename.
+        output_dir : str
+            Output directory.
+        cut_kwargs : dict
+            Selection, with keys of `AnhaDataset.sel` (lat_range, lon_range, depth_range).
+        suffix, preset, precision :
+            See `AnhaDataset.to_netcdf`.
+        variables : list, optional
+            Variables to save. If None, all variables.
+        mask_filename : str, optional
+            Mask filename.
+        profile : bool, optional
+            If True, phase stats of this file are returned (see `anhalyze.core.profiling`). [default: False]
+
+        Returns
+        -------
+        info : dict
+            Output filename, time and sizes, metrics of this file, and phase stats if profile is True.
+
+    """
+
+    metrics_snapshot = METRICS.to_dict()
+
+    if profile:
+        profiling.enable_profiling()
+        profiling.get_stats().reset()
+
+    start = time.perf_counter()
+
+    with profiling.phase('batch_cut.file'):
+        ds = AnhaDataset(filename, mask_filename=mask_filename)
+        ds = ds.sel(**cut_kwargs)
+        if variables:
+            drop_list = [var for var in ds.data_vars if var not in list(variables) + ['mask']]
+            ds._xr_dataset = ds._xr_dataset.drop_vars(drop_list)
+            ds.data_vars = ds._xr_dataset.data_vars
+
+        output_filename = ds.to_netcdf(path=output_dir, suffix=suffix, preset=preset, precision=precision,
+                                       overwrite=True)
+
+    info = {'output': os.path.basename(output_filename),
+            'seconds': time.perf_counter() - start,
+            'bytes_in': os.path.getsize(filename),
+            'bytes_out': os.path.getsize(output_filename)}
+
+    info['metrics'] = METRICS.since(metrics_snapshot)
+    if profile:
+        info['stats'] = profiling.get_stats().to_dict()
+
+    return info
+
+
+def batch_cut(file_list, output_dir, lat_range=None, lon_range=None, depth_range=None, variables=None,
+              suffix='_CutRegion', preset=None, precision=None, mask_filename=None, workers=1,
+              state_filename=None, overwrite=False, profile=False):
+    """ Cuts a region from every file in a list and saves it, with a process pool.
+
+        Each output has a deterministic name (see `get_output_filename`) and is written atomically.
+        Progress is appended to a progress log after each file, and folded into the state file at the start
+        and end of the job, so an interrupted job resumes where it stopped, skipping files already done with
+        the same parameters.
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files.
+        output_dir : str
+            Output directory.
+        lat_range, lon_range, depth_range : list, optional
+            Region to cut, see `AnhaDataset.sel`.
+        variables : list, optional
+            Variables to save. If None, all variables.
+        suffix, preset, precision :
+            See `AnhaDataset.to_netcdf`.
+        mask_filename : str, optional
+            Mask filename.
+        workers : int, optional
+            Number of processes. [default: 1]
+        state_filename : str, optional
+            Progress file. [default: `<output_dir>/.anhalyze_batch_cut_state.json`]
+            Files finished since it was saved are in a progress log next to it (`.jsonl`).
+        overwrite : bool, optional
+            If True, redo files already done. [default: False]
+        profile : bool, optional
+            If True, phase stats of all workers are aggregated and added to the stats of this process,
+            see `anhalyze.core.profiling.get_stats`. [default: False]
+
+        Returns
+        -------
+        report : pandas.DataFrame
+            One row per file (indexed by real path), with status ('done', 'skipped' or 'failed'),
+            output filename, time [in s], sizes [in bytes], throughput [in MB/s] and error message.
+
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    if not state_filename:
+        state_filename = os.path.join(output_dir, STATE_FILENAME)
+
+    cut_kwargs = {'lat_range': lat_range, 'lon_range': lon_range, 'depth_range': depth_range}
+    options = {'suffix': suffix, 'preset': preset, 'precision': precision,
+               'variables': variables, 'mask_filename': mask_filename}
+
+    # Loading progress, only valid for same parameters
+    params_id = _get_params_id(cut_kwargs, options)
+    state = _load_state(state_filename)
+    if state.get('params_id') != params_id:
+        if state.get('files'):
+            logger.warning('Batch cut parameters changed, previous progress is not used.')
+        state = {'params_id': params_id, 'files': {}}
+    _save_state(state_filename, state)
+
+    # Setting up files to do, identified by real path.
+    report = {}
+    todo = []
+    for filename in file_list:
+        key = os.path.realpath(filename)
+        done = state['files'].get(key, {})
+        output_filename = get_output_filename(filename, output_dir, suffix)
+        if not overwrite and done.get('status') == 'done' and os.path.isfile(output_filename):
+            report[key] = done | {'status': 'skipped'}
+        else:
+            todo.append(filename)
+
+    logger.info('Batch cut: %d files to do, %d already done.', len(todo), len(report))
+    METRICS.increment('batch_cut_files_skipped', len(report))
+
+    start = time.perf_counter()
+    with METRICS.timer('batch_cut'), open(_get_log_filename(state_filename), 'a') as log, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(get_options(),)) as executor:
+        futures = {executor.submit(cut_file, filename, output_dir, cut_kwargs, profile=profile, **options): filename
+                   for filename in todo}
+
+        for n, future in enumerate(as_completed(futures), 1):
+            key = os.path.realpath(futures[future])
+            try:
+                info = future.result() | {'status': 'done'}
+                METRICS.merge(info.pop('metrics'))
+                METRICS.increment('batch_cut_files_done')
+                if 'stats' in info:
+                    profiling.get_stats().merge(info.pop('stats'))
+            except Exception as e:
+                info = {'status': 'failed', 'error': repr(e)}
+                METRICS.increment('batch_cut_files_failed')
+                logger.warning('Batch cut failed for %s: %r', key, e)
+
+            report[key] = info
+            state['files'][key] = info
+            # One line per file, instead of saving the whole state each time.
+            log.write(json.dumps([params_id, key, info]) + '\n')
+            log.flush()
+
+            if n % max(1, len(todo) // 20) == 0 or n == len(todo):
+                logger.info('Batch cut: %d/%d files.', n, len(todo))
+
+    _save_state(state_filename, state)
+
+    # Setting up report, in same order as file_list
+    report = pd.DataFrame.from_dict(report, orient='index', columns=REPORT_COLUMNS)
+    report = report.reindex([os.path.realpath(filename) for filename in file_list])
+    report.index.name = 'filename'
+    report['mb_per_s'] = report['bytes_in'] / report['seconds'] / 1e6
+
+    done = report['status'] == 'done'
+    if done.any():
+        elapsed = time.perf_counter() - start
+        logger.info('Batch cut: %d files in %.1f s, %.1f MB/s read, %.1f MB written.',
+                    done.sum(), elapsed, report.loc[done, 'bytes_in'].sum() / elapsed / 1e6,
+                    report.loc[done, 'bytes_out'].sum() / 1e6)
+
+    return report
+
+
+def _get_params_id(cut_kwargs, options):
+    """ Returns id of batch cut parameters.
+    """
+
+    params = json.dumps([cut_kwargs, options], sort_keys=True, default=str)
+
+    return hashlib.sha1(params.encode()).hexdigest()
+
+
+def _get_log_filename(state_filename):
+    """ Returns filename of progress log of a state file.
+    """
+
+    return os.path.splitext(state_filename)[0] + '.jsonl'
+
+
+def _load_state(state_filename):
+    """ Returns progress saved in state file, with files finished since then (progress log), or empty state.
+    """
+
+    state = {}
+    if os.path.isfile(state_filename):
+        try:
+            with open(state_filename) as f:
+                state = json.load(f)
+        except json.JSONDecodeError:
+            logger.warning('State file %s not readable, starting again.', state_filename)
+
+    log_filename = _get_log_filename(state_filename)
+    if state.get('params_id') and os.path.isfile(log_filename):
+        with open(log_filename) as f:
+            for line in f:
+                try:
+                    params_id, key, info = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted job.
+                    continue
+                if params_id == state['params_id']:
+                    state['files'][key] = info
+
+    return state
+
+
+def _save_state(state_filename, state):
+    """ Saves progress atomically, and removes the progress log folded into it.
+    """
+
+    with atomic_write(state_filename) as tmp_filename, open(tmp_filename, 'w') as f:
+        json.dump(state, f)
+
+    log_filename = _get_log_filename(state_filename)
+    if os.path.isfile(log_filename):
+        os.remove(log_filename)
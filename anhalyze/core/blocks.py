@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Out-of-core processing of `AnhaDataset` variables in depth (or time) blocks,
+    fitting within the global memory budget (see `anhalyze.set_options(memory_limit=...)`).
+
+    Example:
+        import anhalyze as ah
+        from anhalyze.core.blocks import get_var_stats
+
+        ah.set_options(memory_limit='2GB')
+        ds = ah.AnhaDataset(filename).sel(lat_range=[50, 80], lon_range=[-100, -20])
+        stats = get_var_stats(ds, 'votemper')  # mean, std, min, max, count
+"""
+
+# System-related libraries
+import logging
+import numpy as np
+
+# Data-related libraries
+import xarray as xr
+
+# Project-related libraries
+from anhalyze.core.options import OPTIONS
+
+logger = logging.getLogger(__name__)
+
+# Peak memory of processing a block (reading, decoding, masking and reduction temporaries),
+# as multiple of the block size, see `anhalyze.core.profiling.MEMORY_BUDGETS`.
+BLOCK_MEMORY_FACTOR = 4
+
+# Storage options of netCDF4 variables kept from encoding, when writing in blocks.
+NC4_STORAGE_OPTIONS = ['zlib', 'complevel', 'shuffle', 'fletcher32', 'contiguous', 'chunksizes']
+
+
+def get_block_dims(var_da, attrs):
+    """ Returns dimensions of var_da that blocks are split along: depth, then time.
+    """
+
+    return [dim for dim in [attrs.get('dim_z'), 'time_counter'] if dim and dim in var_da.dims]
+
+
+def get_blocks(var_da, dims, memory_limit=None, factor=BLOCK_MEMORY_FACTOR):
+    """ Returns list of indexers ({dim: slice}) splitting var_da into blocks
+        small enough to be processed within the memory limit.
+
+        Parameters
+        ----------
+        var_da : xarray.DataArray
+            Data array, in memory or not.
+        dims : list
+            Dimensions split, in order (e.g. [dim_z, 'time_counter']).
+            The next dimension is split only if a single slab of the previous one doesn't fit.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+        factor : float, optional
+            Peak memory of processing a block, as multiple of its size. [default: `BLOCK_MEMORY_FACTOR`]
+
+        Returns
+        -------
+        blocks : list
+            List of indexers, a single empty indexer ([{}]) if no memory limit or var_da fits.
+
+    """
+
+    if memory_limit is None:
+        memory_limit = OPTIONS['memory_limit']
+
+    block_nbytes = var_da.size * var_da.dtype.itemsize
+    if not memory_limit or block_nbytes * factor <= memory_limit:
+        return [{}]
+
+    blocks = [{}]
+    for dim in dims:
+        size = var_da.sizes[dim]
+        slab_nbytes = block_nbytes / size
+        step = int(max(1, min(size, memory_limit // (factor * slab_nbytes))))
+
+        blocks = [block | {dim: slice(start, min(start + step, size))}
+                  for block in blocks for start in range(0, size, step)]
+        block_nbytes = slab_nbytes * step
+
+        if block_nbytes * factor <= memory_limit:
+            break
+    else:
+        logger.warning('Processing blocks of %s (%.1f MB, up to %.1f MB with temporaries) '
+                       'does not fit in memory limit (%.1f MB).',
+                       var_da.name, block_nbytes / 1e6, block_nbytes * factor / 1e6, memory_limit / 1e6)
+
+    return blocks
+
+
+def iter_masked_blocks(ds, var, indexers=None, memory_limit=None):
+    """ Yields (indexer, masked DataArray) for each block of a variable, read one at a time.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset.
+        var : str
+            Variable name.
+        indexers : dict, optional
+            Indexers applied before splitting into blocks, e.g. {'time_counter': 0}.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+    """
+
+    var_da = ds.data_vars[var]
+    if indexers:
+        var_da = var_da.isel({dim: index for dim, index in indexers.items() if dim in var_da.dims})
+
+    for block in get_blocks(var_da, get_block_dims(var_da, ds.attrs), memory_limit=memory_limit):
+        yield block, ds._get_var_data_block(var, indexers=_combine_indexers(indexers, block))
+
+
+def get_masked_array(ds, var, indexers=None, memory_limit=None):
+    """ Returns masked DataArray of a variable in memory, masked one block at a time
+        into the output array, so that peak memory stays close to the output size.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset.
+        var : str
+            Variable name.
+        indexers : dict, optional
+            Indexers applied before masking, see `AnhaDataset._get_var_data_array`.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+    """
+
+    if memory_limit is None:
+        memory_limit = OPTIONS['memory_limit']
+
+    var_da = ds.data_vars[var]
+    if indexers:
+        var_da = var_da.isel({dim: index for dim, index in indexers.items() if dim in var_da.dims})
+
+    # Output is kept in memory, blocks use what is left of the budget.
+    out_nbytes = var_da.size * np.result_type(var_da.dtype, np.float32).itemsize
+    if memory_limit and out_nbytes > memory_limit:
+        logger.warning('Masked %s (%.1f MB) does not fit in memory limit (%.1f MB), '
+                       'consider a smaller selection, or blockwise functions in `anhalyze.core.blocks`.',
+                       var, out_nbytes / 1e6, memory_limit / 1e6)
+
+    blocks = get_blocks(var_da, get_block_dims(var_da, ds.attrs),
+                        memory_limit=max(1, memory_limit - out_nbytes) if memory_limit else None)
+    if len(blocks) == 1:
+        return ds._get_var_data_block(var, indexers=indexers)
+
+    var_data = None
+    for block in blocks:
+        block_da = ds._get_var_data_block(var, indexers=_combine_indexers(indexers, block))
+        if var_data is None:
+            var_data = np.empty(var_da.shape, dtype=block_da.dtype)
+        var_data[_get_index(block, var_da.dims)] = block_da.values
+
+    return var_da.copy(deep=False, data=var_data)
+
+
+def get_var_stats(ds, var, indexers=None, memory_limit=None):
+    """ Returns statistics of a masked variable, computed one block at a time.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset.
+        var : str
+            Variable name.
+        indexers : dict, optional
+            Indexers applied before splitting into blocks, e.g. {'time_counter': 0}.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+        Returns
+        -------
+        stats : dict
+            Mean, std, min, max (NaN if no valid values) and count of valid values.
+
+    """
+
+    count, mean, m2 = 0, 0., 0.
+    vmin, vmax = np.inf, -np.inf
+
+    for _, block_da in iter_masked_blocks(ds, var, indexers=indexers, memory_limit=memory_limit):
+        block_data = block_da.values
+        block_count = int(np.count_nonzero(np.isfinite(block_data)))
+        if not block_count:
+            continue
+
+        block_mean = np.nansum(block_data, dtype=np.float64) / block_count
+        block_m2 = np.nanvar(block_data, dtype=np.float64) * block_count
+
+        # Combining mean and sum of squared differences of blocks (Chan et al.).
+        delta = block_mean - mean
+        total = count + block_count
+        mean += delta * block_count / total
+        m2 += block_m2 + delta ** 2 * count * block_count / total
+        count = total
+
+        vmin = min(vmin, np.nanmin(block_data))
+        vmax = max(vmax, np.nanmax(block_data))
+
+    if not count:
+        return {'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan, 'count': 0}
+
+    return {'mean': mean, 'std': np.sqrt(m2 / count), 'min': vmin, 'max': vmax, 'count': count}
+
+
+def get_var_sums(ds, var, indexers=None, memory_limit=None):
+    """ Returns sum and count of valid values of a masked variable (NaN counted as 0), computed one block at a time.
+        Used for running means over files (e.g. climatologies).
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset.
+        var : str
+            Variable name.
+        indexers : dict, optional
+            Indexers applied before splitting into blocks, e.g. {'time_counter': 0}.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+        Returns
+        -------
+        var_sum, var_count : xarray.DataArray
+            Data with NaN replaced by 0, and 1 where data is valid (0 otherwise), with coordinates of var.
+
+    """
+
+    var_sum = var_count = None
+    for block, block_da in iter_masked_blocks(ds, var, indexers=indexers, memory_limit=memory_limit):
+        if var_sum is None:
+            var_da = ds.data_vars[var]
+            if indexers:
+                var_da = var_da.isel({dim: index for dim, index in indexers.items() if dim in var_da.dims})
+            var_sum = var_da.copy(deep=False, data=np.zeros(var_da.shape, dtype=block_da.dtype))
+            var_count = var_da.copy(deep=False, data=np.zeros(var_da.shape, dtype=int))
+
+        block_data = block_da.values
+        valid = np.isfinite(block_data)
+        index = _get_index(block, block_da.dims)
+        var_sum.values[index] = np.where(valid, block_data, 0)
+        var_count.values[index] = valid
+
+    return var_sum, var_count
+
+
+def get_nanrange(var_da, dims=None, memory_limit=None):
+    """ Returns (min, max) of data ignoring NaN, (nan, nan) if no valid values,
+        reading one block at a time if needed.
+
+        Parameters
+        ----------
+        var_da : xarray.DataArray
+            Data array, in memory or not.
+        dims : list, optional
+            Dimensions split into blocks. [default: first dimension]
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+    """
+
+    vmin, vmax = np.inf, -np.inf
+    for block in get_blocks(var_da, dims if dims is not None else list(var_da.dims[:1]), memory_limit=memory_limit):
+        block_data = var_da.isel(block).values
+        if np.isfinite(block_data).any():
+            vmin = min(vmin, np.nanmin(block_data))
+            vmax = max(vmax, np.nanmax(block_data))
+
+    if vmin > vmax:
+        return np.nan, np.nan
+
+    return vmin, vmax
+
+
+def to_netcdf_blocks(xr_dataset, filename, dims, keepbits=None, encoding=None, memory_limit=None, **kwargs):
+    """ Writes `xarray.Dataset` to a new netCDF4 file, with variables too large for the memory limit
+        written one block at a time. Other variables are written by `xarray.Dataset.to_netcdf`.
+
+        Parameters
+        ----------
+        xr_dataset : xarray.Dataset
+            Dataset to save.
+        filename : str
+            Filename.
+        dims : list
+            Dimensions split into blocks, in order (e.g. [dim_z, 'time_counter']).
+        keepbits : dict, optional
+            Mantissa bits kept for each variable, see `anhalyze.core.encoding.trim_precision`.
+        encoding : dict, optional
+            Encoding of variables, see `xarray.Dataset.to_netcdf`.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+        **kwargs
+            Additional options of `xarray.Dataset.to_netcdf`.
+
+        Returns
+        -------
+        blocked_vars : list
+            Variables written in blocks.
+
+    """
+
+    import netCDF4
+    from anhalyze.core.encoding import trim_precision
+
+    keepbits = keepbits if keepbits else {}
+    encoding = encoding if encoding else {}
+
+    # Variables written in blocks
+    var_blocks = {}
+    for var, var_da in xr_dataset.data_vars.items():
+        blocks = get_blocks(var_da, [dim for dim in dims if dim in var_da.dims], memory_limit=memory_limit)
+        if len(blocks) > 1:
+            var_blocks[var] = blocks
+
+    # Other variables, with precision trimmed
+    small_dataset = xr_dataset.drop_vars(list(var_blocks))
+    for var in small_dataset.data_vars:
+        if keepbits.get(var) is not None:
+            small_dataset[var] = small_dataset[var].copy(data=trim_precision(small_dataset[var].values,
+                                                                             keepbits=keepbits[var]))
+            small_dataset[var].attrs['precision_keepbits'] = keepbits[var]
+
+    small_dataset.to_netcdf(filename, encoding={var: var_encoding for var, var_encoding in encoding.items()
+                                                if var not in var_blocks}, **kwargs)
+
+    with netCDF4.Dataset(filename, 'a') as nc:
+        for var, blocks in var_blocks.items():
+            var_da = xr_dataset[var]
+            if keepbits.get(var) is not None:
+                var_da = var_da.assign_attrs(precision_keepbits=keepbits[var])
+            var_encoding = var_da.encoding | encoding.get(var, {})
+            var_encoding.pop('coordinates', None)
+
+            for dim, size in var_da.sizes.items():
+                if dim not in nc.dimensions:
+                    nc.createDimension(dim, size)
+
+            logger.debug('Writing %s in %s blocks.', var, len(blocks))
+
+            nc_var = None
+            for block in blocks:
+                block_data = var_da.isel(block).values
+                if keepbits.get(var) is not None:
+                    block_data = trim_precision(block_data, keepbits=keepbits[var])
+
+                # Same encoding as xarray (fill values, packing), one block at a time.
+                encoded = xr.conventions.encode_cf_variable(xr.Variable(var_da.dims, block_data, var_da.attrs,
+                                                                        encoding=var_encoding), name=var)
+                if nc_var is None:
+                    nc_var = _create_nc_variable(nc, var, var_da, encoded)
+
+                nc_var[_get_index(block, var_da.dims)] = encoded.values
+
+    return list(var_blocks)
+
+
+def _create_nc_variable(nc, var, var_da, encoded):
+    """ Creates netCDF4 variable given its first encoded block, with attributes and storage options.
+    """
+
+    attrs = dict(encoded.attrs)
+    fill_value = attrs.pop('_FillValue', None)
+
+    storage = {key: encoded.encoding[key] for key in NC4_STORAGE_OPTIONS if key in encoded.encoding}
+    # Chunk sizes of the original file may not fit a selection.
+    if 'chunksizes' in storage and (storage['chunksizes'] is None
+                                    or len(storage['chunksizes']) != var_da.ndim
+                                    or any(chunk > size for chunk, size in zip(storage['chunksizes'],
+                                                                               var_da.shape))):
+        del storage['chunksizes']
+
+    nc_var = nc.createVariable(var, encoded.dtype, var_da.dims, fill_value=fill_value, **storage)
+    nc_var.set_auto_maskandscale(False)
+
+    coordinates = [name for name in var_da.coords if name not in var_da.dims]
+    if coordinates:
+        attrs['coordinates'] = ' '.join(map(str, coordinates))
+    nc_var.setncatts(attrs)
+
+    return nc_var
+
+
+def _combine_indexers(indexers, block):
+    """ Returns indexers of a block within data already indexed with indexers.
+        Integer indexers drop their dimension, so they don't overlap with block dimensions.
+    """
+
+    if not indexers:
+        return block
+
+    combined = dict(indexers)
+    for dim, block_slice in block.items():
+        if dim in combined and isinstance(combined[dim], slice):
+            start = combined[dim].start or 0
+            assert combined[dim].step in [None, 1], '[Anhalyze] Indexers with steps are not supported in blocks.'
+            combined[dim] = slice(start + block_slice.start, start + block_slice.stop)
+        elif dim in combined:
+            combined[dim] = np.asarray(combined[dim])[block_slice]
+        else:
+            combined[dim] = block_slice
+
+    return combined
+
+
+def _get_index(block, dims):
+    """ Returns positional index (tuple of slices) of a block, given dimensions of the array.
+    """
+
+    return tuple(block.get(dim, slice(None)) for dim in dims)
@@ -4,11 +4,15 @@
 # System-related libraries
 import requests
 import os
+import logging
 
 # Project-related libraries
 import anhalyze.config as config
 import anhalyze as ah
 from anhalyze.core.anhalyze import get_date
+from anhalyze.core.metrics import METRICS
+
+logger = logging.getLogger(__name__)
 
 
 def download_sharepoint_file(download_url, download_destination):
@@ -30,14 +34,15 @@ def download_sharepoint_file(download_url, download_destination):
     # Code from:
     # https://www.geeksforgeeks.org/how-to-download-large-file-in-python-with-requests/
     try:
-        with requests.get(download_url, stream=True) as response:
+        with METRICS.timer('download'), requests.get(download_url, stream=True) as response:
             response.raise_for_status()
             with open(download_destination, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
                     f.write(chunk)
-        print("[Anhalyze.Downloader] File downloaded successfully!")
+                    METRICS.increment('bytes_downloaded', len(chunk))
+        logger.info("Downloader: File downloaded successfully!")
     except requests.exceptions.RequestException as e:
-        print("[Anhalyze.Downloader] Error downloading file:", e)
+        logger.error("Downloader: Error downloading file: %s", e)
 
 
 def download_mask():
@@ -51,7 +56,7 @@ def download_mask():
     mask_destination = os.path.join(ah.PACKAGE_DATA_DIR, 'ANHA4_mask.nc')
 
     # Downloading mask.
-    print("[Anhalyze.Downloader] Downloading mask file.")
+    logger.info("Downloader: Downloading mask file.")
     download_sharepoint_file(mask_url, mask_destination)
 
 
@@ -74,7 +79,7 @@ def download_example(file_type='gridT'):
     file_destination = os.path.join(ah.PACKAGE_DATA_DIR, config.package_data[file_type]['filename'])
 
     # Downloading mask.
-    print(f"[Anhalyze.Downloader] Downloading {file_type} file.")
+    logger.info("Downloader: Downloading %s file.", file_type)
     download_sharepoint_file(file_url, file_destination)
 
     # Check filename reflects correct ymd
@@ -114,11 +119,57 @@ def download_tutorial():
                                         'anhalyze_tutorial.html')
 
     # Downloading tutorial
-    print(f"[Anhalyze.Downloader] Downloading tutorial version: {config.package_data['tutorial']['version']}, "
-          f"here:{tutorial_destination}.")
+    logger.info("Downloader: Downloading tutorial version: %s, here:%s.",
+                config.package_data['tutorial']['version'], tutorial_destination)
     download_sharepoint_file(config.package_data['tutorial']['url'], tutorial_destination)
 
 
+def download_natural_earth(feature='land', resolution='50m', category='physical'):
+    """ Downloads a Natural Earth shapefile to `<package root path>/anhalyze/package_data/natural_earth/`,
+        used as map background (see `anhalyze.core.natural_earth`). To be run once on a node with network access.
+
+        Parameters
+        ----------
+        feature : str, optional
+            Natural Earth feature, e.g. 'land' or 'ocean'. [default: 'land']
+        resolution : str, optional
+            Available resolutions '10m', '50m', or '110m'. [default: '50m']
+        category : str, optional
+            Natural Earth category. [default: 'physical']
+
+        Returns
+        -------
+        shapefile : str | None
+            Filename of shapefile, None if download failed.
+
+    """
+
+    import zipfile
+    from anhalyze.core.natural_earth import NATURAL_EARTH_DIR
+
+    url = config.package_data['natural_earth']['url'].format(feature=feature, resolution=resolution,
+                                                             category=category)
+    zip_destination = os.path.join(NATURAL_EARTH_DIR, f'ne_{resolution}_{feature}.zip')
+    os.makedirs(NATURAL_EARTH_DIR, exist_ok=True)
+
+    logger.info("Downloader: Downloading Natural Earth %s (%s).", feature, resolution)
+    download_sharepoint_file(url, zip_destination)
+
+    try:
+        with zipfile.ZipFile(zip_destination) as f:
+            f.extractall(NATURAL_EARTH_DIR)
+    except (OSError, zipfile.BadZipFile) as e:
+        logger.error("Downloader: Error extracting file: %s", e)
+        return None
+    finally:
+        if os.path.isfile(zip_destination):
+            os.remove(zip_destination)
+
+    shapefile = os.path.join(NATURAL_EARTH_DIR, f'ne_{resolution}_{feature}.shp')
+
+    return shapefile if os.path.isfile(shapefile) else None
+
+
 if __name__ == '__main__':
 
     download_mask()
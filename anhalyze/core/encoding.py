@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import numpy as np
+
+# Project-related libraries
+from anhalyze.core.blocks import get_nanrange
+
+# Encoding presets for `AnhaDataset.to_netcdf`.
+#   complevel: zlib compression level (with shuffle filter).
+#   chunk_yx: max chunk size along (y, x), chunks are matched to the selection size.
+#   chunk_z: max chunk size along depth.
+#   pack: if True, float fields are packed as int16 with scale_factor/add_offset (lossy).
+ENCODING_PRESETS = {
+    # Smallest files, for long term storage of cuts.
+    'archive': {'complevel': 6, 'chunk_yx': None, 'chunk_z': 1, 'pack': True},
+    # Light compression, whole selection in one chunk per time step.
+    'fast-read': {'complevel': 1, 'chunk_yx': None, 'chunk_z': None, 'pack': False},
+    # Small horizontal tiles with full depth, for point/profile reads across many files.
+    'time-series': {'complevel': 4, 'chunk_yx': 16, 'chunk_z': None, 'pack': False},
+}
+
+# int16 values used when packing, keeping -32768 for missing values.
+PACK_FILL_VALUE = np.int16(-32768)
+PACK_MAX = 32767
+
+
+def get_encoding(xr_dataset, preset='archive', dims=None, keepbits=None):
+    """ Returns `encoding` dict for `xarray.Dataset.to_netcdf` given an encoding preset.
+
+        Parameters
+        ----------
+        xr_dataset : xarray.Dataset
+            Dataset to save.
+        preset : str, optional
+            Encoding preset name: 'archive', 'fast-read', or 'time-series'. [default: 'archive']
+        dims : dict, optional
+            Dimension names, as {'x': dim_x, 'y': dim_y, 'z': dim_z}. [default: {'x': 'x', 'y': 'y'}]
+        keepbits : dict, optional
+            Mantissa bits kept for each variable, if precision is trimmed after this call (e.g. when saving
+            in blocks), so that packing matches the trimmed data range.
+
+        Returns
+        -------
+        encoding : dict
+            Encoding for each data variable.
+
+    """
+
+    assert preset in ENCODING_PRESETS, \
+        f'[Anhalyze] Encoding preset {preset} not found in: {list(ENCODING_PRESETS)}'
+    options = ENCODING_PRESETS[preset]
+
+    if dims is None:
+        dims = {'x': 'x', 'y': 'y'}
+
+    encoding = {}
+    for var, var_da in xr_dataset.data_vars.items():
+
+        var_encoding = {'zlib': True, 'shuffle': True, 'complevel': options['complevel']}
+        on_grid = bool(var_da.ndim) and dims['x'] in var_da.dims and dims['y'] in var_da.dims
+
+        # Chunks matched to selection size, only for variables with a horizontal grid.
+        if on_grid:
+            chunksizes = []
+            for dim, size in zip(var_da.dims, var_da.shape):
+                if dim in [dims['x'], dims['y']]:
+                    chunk = options['chunk_yx']
+                elif dim == dims.get('z'):
+                    chunk = options['chunk_z']
+                else:
+                    chunk = 1
+                chunksizes.append(max(1, min(size, chunk if chunk else size)))
+            var_encoding['chunksizes'] = tuple(chunksizes)
+
+        # Packing float fields as int16, with data range read in blocks within the memory limit.
+        # Other variables (e.g. depth bounds) are kept as they are.
+        if options['pack'] and on_grid and np.issubdtype(var_da.dtype, np.floating):
+            block_dims = [dim for dim in [dims.get('z'), 'time_counter'] if dim in var_da.dims]
+            vrange = np.array(get_nanrange(var_da, dims=block_dims), dtype=var_da.dtype)
+            if keepbits and keepbits.get(var) is not None:
+                vrange = trim_precision(vrange, keepbits=keepbits[var])
+            var_encoding |= get_pack_encoding(vrange=vrange)
+
+        encoding[var] = var_encoding
+
+    return encoding
+
+
+def get_pack_encoding(var_data=None, vrange=None):
+    """ Returns encoding to pack float data as int16 with scale_factor and add_offset,
+        given the data range. Precision is about the data range divided by 65532.
+
+        Parameters
+        ----------
+        var_data : ndarray, optional
+            Data to pack.
+        vrange : tuple, optional
+            Data range (min, max), NaN if no valid data, instead of var_data.
+
+    """
+
+    if vrange is None:
+        vrange = (np.nan, np.nan) if np.all(np.isnan(var_data)) else (np.nanmin(var_data), np.nanmax(var_data))
+
+    if np.isnan(vrange).any():
+        vmin, vmax = 0., 0.
+    else:
+        vmin, vmax = float(vrange[0]), float(vrange[1])
+
+    # Leaving a margin of one value, in case of rounding errors in float32.
+    scale_factor = (vmax - vmin) / (2 * (PACK_MAX - 1)) if vmax > vmin else 1.
+    add_offset = (vmax + vmin) / 2
+
+    return {'dtype': 'int16',
+            'scale_factor': np.float32(scale_factor),
+            'add_offset': np.float32(add_offset),
+            '_FillValue': PACK_FILL_VALUE}
+
+
+def get_keepbits(var_data, tolerance):
+    """ Returns number of mantissa bits to keep, so that rounding errors stay
+        within an absolute tolerance for all values in data.
+
+        Parameters
+        ----------
+        var_data : ndarray
+            Float data.
+        tolerance : float
+            Absolute tolerance. [in var units]
+
+    """
+
+    max_abs = np.nanmax(np.abs(var_data)) if np.isfinite(var_data).any() else 0
+
+    # Rounding error is at most half a unit in the last kept bit: 2**(exponent - keepbits - 1)
+    if max_abs <= tolerance:
+        return 0
+
+    return int(np.ceil(np.log2(max_abs / tolerance)))
+
+
+def trim_precision(var_data, keepbits=None, tolerance=None):
+    """ Returns copy of float data with mantissa bits rounded to zero (bit-rounding, round to nearest),
+        so that compression (e.g. zlib) is much more effective. Lossy.
+
+        Parameters
+        ----------
+        var_data : ndarray
+            Float data (float32 or float64).
+        keepbits : int, optional
+            Mantissa bits kept, i.e. relative precision of 2**-(keepbits+1).
+        tolerance : float, optional
+            Absolute tolerance, used to compute keepbits if not given. [in var units]
+
+    """
+
+    assert keepbits is not None or tolerance is not None, '[Anhalyze] Either keepbits or tolerance is needed.'
+
+    var_data = np.asarray(var_data)
+    assert np.issubdtype(var_data.dtype, np.floating), '[Anhalyze] Only float data can be trimmed.'
+
+    if keepbits is None:
+        keepbits = get_keepbits(var_data, tolerance)
+
+    # Mantissa bits for each float type.
+    mantissa_bits = np.finfo(var_data.dtype).nmant
+    if keepbits >= mantissa_bits:
+        return var_data.copy()
+
+    uint = np.dtype(f'uint{var_data.dtype.itemsize * 8}').type
+    shift = uint(mantissa_bits - keepbits)
+    one = uint(1)
+
+    bits = var_data.view(uint).copy()
+
+    # Round half to even: add half of the last kept bit (minus one if even), then drop trailing bits.
+    half = (one << (shift - one)) - one + ((bits >> shift) & one)
+    finite = np.isfinite(var_data)
+    bits[finite] += half[finite]
+    bits[finite] &= ~((one << shift) - one)
+
+    return bits.view(var_data.dtype)
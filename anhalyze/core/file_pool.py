@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import os
+import threading
+from collections import OrderedDict
+
+# Data-related libraries
+import xarray as xr
+
+# Project-related libraries
+from anhalyze.core.metrics import METRICS
+
+# Maximum number of files kept open by default.
+DEFAULT_MAXSIZE = 128
+
+
+class FilePool:
+    """ Bounded LRU pool of open netCDF files (as `xarray.Dataset`),
+    used to avoid re-opening and re-parsing the same files in random-access
+    workloads (e.g. point lookups, co-location, interactive browsing).
+
+    When the pool is full, the least recently used file is closed.
+    Datasets returned by the pool can still be used after being closed,
+    since xarray re-opens the file when data is accessed.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of open files. It is limited to a quarter of the
+        file descriptor limit of the process. If 0, files are not pooled.
+
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        """ Initializing object.
+        """
+
+        self._datasets = OrderedDict()
+        self._lock = threading.RLock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.maxsize = maxsize
+
+    def __repr__(self):
+        """ Return string representation of object
+        """
+
+        return f'[Anhalyze] FilePool: {self.stats}'
+
+    def __len__(self):
+        """ Returns number of open files.
+        """
+
+        return len(self._datasets)
+
+    @property
+    def maxsize(self):
+        """ Maximum number of open files.
+        """
+
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        """ Set maximum number of open files, within file descriptor limit.
+        """
+
+        assert maxsize >= 0, '[Anhalyze] FilePool maxsize should be a positive integer.'
+
+        self._maxsize = min(int(maxsize), get_fd_limit() // 4)
+
+        # Closing files if above new limit.
+        with self._lock:
+            self._evict()
+
+    @property
+    def stats(self):
+        """ Returns dict with pool counters.
+        """
+
+        return {'size': len(self),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+    def open_dataset(self, filename, **kwargs):
+        """ Returns open `xarray.Dataset` for given filename,
+            opening it only if not already in the pool.
+
+        Parameters
+        ----------
+        filename : str
+            netCDF filename.
+        **kwargs
+            Additional options for `xarray.open_dataset`.
+
+        """
+
+        if not self.maxsize:
+            METRICS.increment('files_opened')
+            return xr.open_dataset(filename, **kwargs)
+
+        # Files modified since opened are opened again.
+        realpath = os.path.realpath(filename)
+        key = (realpath, os.stat(realpath).st_mtime_ns, tuple(sorted(kwargs.items())))
+
+        with self._lock:
+            if key in self._datasets:
+                self.hits += 1
+                METRICS.increment('file_pool_hits')
+                self._datasets.move_to_end(key)
+            else:
+                self.misses += 1
+                METRICS.increment('files_opened')
+                self._datasets[key] = xr.open_dataset(realpath, **kwargs)
+                self._evict()
+
+            return self._datasets[key]
+
+    def close(self, filename=None):
+        """ Closes given file, or all files if filename is not given.
+        """
+
+        with self._lock:
+            if filename:
+                realpath = os.path.realpath(filename)
+                keys = [key for key in self._datasets if key[0] == realpath]
+            else:
+                keys = list(self._datasets)
+
+            for key in keys:
+                self._datasets.pop(key).close()
+
+    def reset_stats(self):
+        """ Set counters back to zero.
+        """
+
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def _evict(self):
+        """ Closes least recently used files until within maxsize.
+        """
+
+        while len(self._datasets) > self.maxsize:
+            _, ds = self._datasets.popitem(last=False)
+            ds.close()
+            self.evictions += 1
+            METRICS.increment('file_pool_evictions')
+
+
+def get_fd_limit():
+    """ Returns soft limit of open file descriptors for this process.
+    """
+
+    try:
+        import resource
+        fd_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError):
+        # Windows default limit.
+        fd_limit = 512
+
+    # No limit
+    if fd_limit < 0:
+        fd_limit = 4 * DEFAULT_MAXSIZE
+
+    return fd_limit
+
+
+# Default pool used by `AnhaDataset`.
+FILE_POOL = FilePool()
+
+
+def open_dataset(filename, **kwargs):
+    """ Opens netCDF file through the default `FilePool`.
+
+    Parameters
+    ----------
+    filename : str
+        netCDF filename.
+    **kwargs
+        Additional options for `xarray.open_dataset`.
+
+    """
+
+    return FILE_POOL.open_dataset(filename, **kwargs)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Hovmöller diagrams of a run: time-latitude and time-longitude (means over latitude or longitude bands)
+    and time-depth (means over a region, at each depth). Each file is reduced to a profile as it is read,
+    with area (and layer thickness) weighted means over wet cells, so memory use doesn't grow with the
+    number of files.
+
+    Example:
+        from anhalyze.core.anhalyze_plot_utils import show_hovmoller
+        from anhalyze.core.hovmoller import get_hovmoller
+
+        hovmoller = get_hovmoller(file_list, var='votemper', axis='depth', lat_range=[51, 54.7],
+                                  lon_range=[-82.5, -78.5], workers=8)
+        show_hovmoller(hovmoller, savefig='james_bay_votemper.png')
+"""
+
+# System-related libraries
+import numpy as np
+
+# Data-related libraries
+import pandas as pd
+import xarray as xr
+
+# Project-related libraries
+from anhalyze.core.anhalyze import get_date
+from anhalyze.core.anhalyze_colocation import EARTH_RADIUS_KM, lat_lon_to_xyz
+from anhalyze.core.anhalyze_run import map_chunks, open_region
+from anhalyze.core.blocks import iter_masked_blocks
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.prefetch import Prefetcher
+
+# Axes of Hovmöller diagrams, with the grid coordinate binned ('coord_lat', 'coord_lon') or the depth dimension.
+HOVMOLLER_AXES = {'lat': 'coord_lat', 'lon': 'coord_lon', 'depth': 'dim_z'}
+
+
+def get_cell_areas(lat, lon):
+    """ Returns area of each grid cell, from distances to its neighbours along each axis. [in km2]
+
+        Parameters
+        ----------
+        lat, lon : ndarray
+            2D arrays with grid latitudes and longitudes. [in degrees]
+
+    """
+
+    xyz = lat_lon_to_xyz(lat, lon)
+
+    sizes = []
+    for axis in [0, 1]:
+        if xyz.shape[axis] < 2:
+            # Single row or column, sized as the cells along the other axis.
+            sizes.append(None)
+            continue
+        sizes.append(EARTH_RADIUS_KM * np.linalg.norm(np.gradient(xyz, axis=axis), axis=-1))
+
+    sizes = [size if size is not None else sizes[1 - axis] for axis, size in enumerate(sizes)]
+    if sizes[0] is None:
+        return np.ones(np.shape(lat))
+
+    return sizes[0] * sizes[1]
+
+
+def get_layer_thickness(ds):
+    """ Returns thickness of each depth level of an `AnhaDataset`, from depth bounds if in the file,
+        otherwise from midpoints between levels. [in m]
+        Without bounds, the top and bottom edges are extrapolated symmetrically (top edge not above the surface),
+        so the top level of a depth selection doesn't extend to the surface.
+    """
+
+    dim_z = ds.attrs['dim_z']
+    bounds = f'{dim_z}_bounds'
+
+    if bounds in ds._xr_dataset.data_vars:
+        return np.abs(np.diff(ds._xr_dataset[bounds].values, axis=-1)[:, 0]).astype(np.float64)
+
+    depth = ds._xr_dataset[dim_z].values.astype(np.float64)
+    if depth.size == 1:
+        return 2 * depth
+
+    edges = np.concatenate([[max(0., depth[0] - (depth[1] - depth[0]) / 2)], (depth[1:] + depth[:-1]) / 2,
+                            [depth[-1] + (depth[-1] - depth[-2]) / 2]])
+
+    return np.diff(edges)
+
+
+def get_hovmoller_bins(ds, axis, bins=None):
+    """ Returns bin edges of a latitude or longitude Hovmöller axis, over the dataset coordinate range.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset, within the region of the diagram.
+        axis : str
+            'lat' or 'lon'.
+        bins : float | array_like, optional
+            Bin width [in degrees], or bin edges. [default: median grid spacing along the axis]
+
+    """
+
+    coord = ds.coords[ds.attrs[HOVMOLLER_AXES[axis]]].values.astype(np.float64)
+
+    if bins is not None and np.ndim(bins):
+        return np.asarray(bins, dtype=np.float64)
+
+    if bins is None:
+        # Spacing along the grid dimension closest to the axis direction.
+        bins = max(np.nanmedian(np.abs(np.diff(coord, axis=grid_axis))) for grid_axis in [0, 1])
+
+    start = np.floor(np.nanmin(coord) / bins) * bins
+    n_bins = max(1, int(np.ceil((np.nanmax(coord) - start) / bins)))
+
+    return start + bins * np.arange(n_bins + 1)
+
+
+def get_hovmoller_profile(ds, var, axis='lat', bins=None, memory_limit=None):
+    """ Returns mean profile of a masked variable along a Hovmöller axis, for the first time step,
+        read in blocks within the memory limit (see `anhalyze.set_options`).
+        Means are weighted by cell area, and by layer thickness when depth levels are averaged.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset, within the region of the diagram (see `AnhaDataset.sel`).
+        var : str
+            Variable name.
+        axis : str, optional
+            'lat' or 'lon' (means over latitude or longitude bins, and depth levels),
+            or 'depth' (means over the region at each depth level). [default: 'lat']
+        bins : array_like, optional
+            Bin edges of 'lat' or 'lon' axis. [default: see `get_hovmoller_bins`]
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+        Returns
+        -------
+        profile : ndarray
+            Mean of each bin or depth level, NaN without wet cells.
+
+    """
+
+    assert axis in HOVMOLLER_AXES, f'[Anhalyze] Hovmoller axis {axis} not found in: {list(HOVMOLLER_AXES)}'
+
+    dim_z = ds.attrs.get('dim_z')
+    var_dims = ds.data_vars[var].dims
+    assert axis != 'depth' or dim_z in var_dims, f'[Anhalyze] Variable {var} has no depth dimension.'
+
+    lat = ds.coords[ds.attrs['coord_lat']].values
+    lon = ds.coords[ds.attrs['coord_lon']].values
+    areas = get_cell_areas(lat, lon)
+    thickness = get_layer_thickness(ds) if dim_z in var_dims else None
+
+    if axis == 'depth':
+        n_values = ds.data_vars[var].sizes[dim_z]
+    else:
+        if bins is None:
+            bins = get_hovmoller_bins(ds, axis)
+        n_values = len(bins) - 1
+        # Bin of each cell, cells outside bins are not included (index n_values).
+        coord = lat if axis == 'lat' else lon
+        bin_index = np.digitize(coord, bins) - 1
+        bin_index[(bin_index < 0) | (bin_index >= n_values)] = n_values
+
+    sums, weights = np.zeros(n_values + 1), np.zeros(n_values + 1)
+
+    # Removing time dimension, one time step per file.
+    indexers = {'time_counter': 0} if 'time_counter' in var_dims else None
+
+    for block, block_da in iter_masked_blocks(ds, var, indexers=indexers, memory_limit=memory_limit):
+        block_data = block_da.values.astype(np.float64)
+        valid = np.isfinite(block_data)
+
+        cell_weights = np.broadcast_to(areas, block_data.shape)
+        if thickness is not None:
+            levels = block.get(dim_z, slice(None))
+            cell_weights = cell_weights * thickness[levels][:, np.newaxis, np.newaxis]
+
+        cell_weights = np.where(valid, cell_weights, 0.)
+        cell_values = np.where(valid, block_data, 0.) * cell_weights
+
+        if axis == 'depth':
+            levels = np.arange(n_values)[block.get(dim_z, slice(None))]
+            sums[levels] += cell_values.sum(axis=(-2, -1))
+            weights[levels] += cell_weights.sum(axis=(-2, -1))
+        else:
+            index = np.broadcast_to(bin_index, block_data.shape).ravel()
+            sums += np.bincount(index, weights=cell_values.ravel(), minlength=n_values + 1)
+            weights += np.bincount(index, weights=cell_weights.ravel(), minlength=n_values + 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weights[:n_values] > 0, sums[:n_values] / weights[:n_values], np.nan)
+
+
+def load_hovmoller_profile(filename, var='votemper', axis='lat', bins=None, sel_kwargs=None, mask_filename=None):
+    """ Returns Hovmöller profile of a file within a region, see `get_hovmoller_profile`.
+        Loader used by `Prefetcher` in `get_hovmoller`.
+    """
+
+    return get_hovmoller_profile(open_region(filename, sel_kwargs, mask_filename), var, axis=axis, bins=bins)
+
+
+def get_hovmoller(file_list, var='votemper', axis='lat', lat_range=None, lon_range=None, depth_range=None,
+                  bins=None, mask_filename=None, workers=1, chunk_size=None, memory_limit=None):
+    """ Returns Hovmöller diagram (time x axis) of a variable, one profile per file.
+        Files are reduced to profiles as they are read, so memory use doesn't grow with the number of files.
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files.
+        var : str, optional
+            Variable name. [default: 'votemper']
+        axis : str, optional
+            'lat' or 'lon' (means over latitude or longitude bins, and depth levels within depth_range),
+            or 'depth' (means over the region at each depth level). [default: 'lat']
+        lat_range, lon_range, depth_range : list, optional
+            Region, see `AnhaDataset.sel`.
+        bins : float | array_like, optional
+            Bin width [in degrees], or bin edges, of 'lat' or 'lon' axis. [default: grid spacing]
+        mask_filename : str, optional
+            Mask filename.
+        workers : int, optional
+            Number of processes. [default: 1]
+        chunk_size : int, optional
+            Number of files per task. [default: files split evenly between workers]
+        memory_limit : int | str, optional
+            Memory budget of files read ahead by each task, e.g. '2GB'.
+            [default: global `memory_limit` option, see `anhalyze.set_options`, also used to read data in blocks]
+
+        Returns
+        -------
+        hovmoller : xarray.DataArray
+            Means with dimensions (time, axis), in the order of file_list, and `axis` coordinate with
+            bin centers (and bin edges in attribute `bin_edges`) or depth levels, and grid name in attribute
+            `grid`.
+
+    """
+
+    assert axis in HOVMOLLER_AXES, f'[Anhalyze] Hovmoller axis {axis} not found in: {list(HOVMOLLER_AXES)}'
+    assert file_list, '[Anhalyze] No files given for Hovmoller diagram.'
+
+    sel_kwargs = {'lat_range': lat_range, 'lon_range': lon_range, 'depth_range': depth_range}
+
+    # Axis found once from the first file, shared by all tasks.
+    ds = open_region(file_list[0], sel_kwargs, mask_filename)
+    var_da = ds.data_vars[var]
+    if axis == 'depth':
+        assert ds.attrs.get('dim_z') in var_da.dims, f'[Anhalyze] Variable {var} has no depth dimension.'
+        bins = None
+        axis_coord = {'depth': ('depth', ds._xr_dataset[ds.attrs['dim_z']].values,
+                                ds._xr_dataset[ds.attrs['dim_z']].attrs)}
+    else:
+        bins = get_hovmoller_bins(ds, axis, bins=bins)
+        axis_coord = {axis: (axis, (bins[1:] + bins[:-1]) / 2, {'units': 'degrees', 'bin_edges': bins})}
+
+    with METRICS.timer('hovmoller'):
+        chunk_profiles = map_chunks(_hovmoller_chunk, file_list, workers, chunk_size, var=var, axis=axis,
+                                     bins=bins, sel_kwargs=sel_kwargs, mask_filename=mask_filename,
+                                     memory_limit=memory_limit)
+
+    times = [pd.Timestamp(*get_date(filename, how='ymd')) for filename in file_list]
+
+    return xr.DataArray(np.concatenate(chunk_profiles), dims=('time', axis),
+                        coords={'time': times} | axis_coord, name=var,
+                        attrs=dict(var_da.attrs) | {'hovmoller_axis': axis, 'grid': ds.attrs['grid']})
+
+
+def _hovmoller_chunk(file_list, var, axis, bins, sel_kwargs, mask_filename, memory_limit):
+    """ Returns profiles (files x axis) of a chunk of files, filled as files are read.
+    """
+
+    profiles = None
+    for i, (filename, profile) in enumerate(Prefetcher(file_list, loader=load_hovmoller_profile,
+                                                       memory_limit=memory_limit, var=var, axis=axis, bins=bins,
+                                                       sel_kwargs=sel_kwargs, mask_filename=mask_filename)):
+        if profiles is None:
+            profiles = np.full((len(file_list), profile.size), np.nan)
+        profiles[i] = profile
+
+    return profiles
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Batch rendering of maps, e.g. one frame per time step for animations.
+    The figure (projection, background features, grid-lines and color-bar) is set up once
+    per region, projection and variable, and only the plotted data is updated for each frame.
+
+    Example:
+        from anhalyze.core.map_renderer import render_frames
+        frames = render_frames(file_list, 'frames/', var='votemper', lat_range=[51, 54.7], lon_range=[-82.5, -78.5],
+                               color_range=[-2, 10], workers=8)
+
+        # Then, e.g.: ffmpeg -pattern_type glob -i 'frames/*.png' votemper.mp4
+"""
+
+# System-related libraries
+import os
+import logging
+import numpy as np
+
+# Project-related libraries
+import anhalyze.core.anhalyze_plot_utils as apu
+from anhalyze.core.anhalyze import get_date
+from anhalyze.core.anhalyze_run import map_chunks, open_region
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.prefetch import Prefetcher
+from anhalyze.core.summary_stats import get_run_stats
+
+logger = logging.getLogger(__name__)
+
+
+class MapRenderer:
+    """ Map of a variable, rendered for many frames of the same region and projection.
+        The figure is drawn with the Agg backend without pyplot (never displayed), and is reused for all frames.
+
+    Parameters
+    ----------
+    var_da : xarray.DataArray
+        Masked 2D (or top layer) DataArray of the first frame, see `AnhaDataset._get_map_data_array`.
+    attrs : dict
+        Attributes from `AnhaDataset`
+    color_range : str | list, optional
+        Color range either `default` limits, `local` data values or a two items list [vmin, vmax],
+        see `get_plot_config`. With `local`, the color range is found from the first frame (or given by `vrange`),
+        and kept for all frames. [default: 'default']
+    proj_name : str, optional
+        Projection name, see `get_projection`. [default: 'LambertConformal']
+    vrange : list, optional
+        Color range [vmin, vmax] of `local` color range, e.g. found once for frames rendered by several workers.
+    dpi : float, optional
+        Resolution of saved frames. [default: matplotlib 'savefig.dpi']
+    full_resolution : bool, optional
+        If True, plots the grid at full resolution, otherwise grids finer than the frame resolution are coarsened,
+        see `get_lod_factor`. [default: False]
+
+    """
+
+    def __init__(self, var_da, attrs, color_range='default', proj_name='LambertConformal', vrange=None, dpi=None,
+                 full_resolution=False):
+        """ Initializing object, setting the figure up with the first frame.
+        """
+
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.attrs = attrs
+        self.var = str(var_da.name)
+        self.color_range = color_range
+        self.proj_name = proj_name
+        self.dpi = dpi
+
+        self.lat = np.squeeze(var_da.coords[attrs['coord_lat']].data)
+        self.lon = np.squeeze(var_da.coords[attrs['coord_lon']].data)
+        var_data = np.squeeze(var_da.data)
+
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+        self.ax = apu.setup_map_axes(self.fig, attrs, proj_name)
+
+        # Color range kept for all frames.
+        plot_color_range = list(vrange) if color_range == 'local' and vrange is not None else color_range
+        self.cmap, self.vrange, self.cnorm = apu.get_plot_config(self.var, var_data, grid=attrs['grid'],
+                                                                 color_range=plot_color_range)
+        self.pcolormesh = apu.use_pcolormesh(attrs, color_range, self.cnorm)
+
+        # Filled contours with the same levels in all frames, so that they all match the color-bar.
+        self.levels = np.linspace(self.vrange[0], self.vrange[1], apu.LEVELS)
+
+        # Same level of detail in all frames.
+        self.lod_factor = 1 if full_resolution else apu.get_lod_factor(self.ax, self.lat.shape, dpi=dpi)
+
+        self._artists = self._plot(var_data)
+        self._current = var_da
+        apu.add_colorbar(self.fig, self.ax, self._artists[0], var_da, attrs, self.vrange, color_range=color_range)
+        self._title = self.ax.set_title('')
+
+    def update(self, var_da, title=None):
+        """ Updates plotted data, and title if given.
+
+            Parameters
+            ----------
+            var_da : xarray.DataArray
+                Masked 2D (or top layer) DataArray, on the same grid as the first frame.
+            title : str, optional
+                Title of frame, e.g. its date.
+
+        """
+
+        if var_da is not self._current:
+            var_data = np.squeeze(var_da.data)
+            assert var_data.shape == self.lat.shape, \
+                f'[Anhalyze] Frame shape {var_data.shape} differs from map shape {self.lat.shape}.'
+
+            if self.pcolormesh:
+                if self.lod_factor > 1:
+                    var_data = apu.coarsen_data(var_data, self.lod_factor)
+                self._artists[0].set_array(np.ma.masked_invalid(var_data))
+            else:
+                # Contours can not be updated, they are drawn again within the same axes.
+                for artist in self._artists:
+                    artist.remove()
+                self._artists = self._plot(var_data)
+
+            self._current = var_da
+
+        if title is not None:
+            self._title.set_text(title)
+
+    def render(self, var_da, savefig, title=None):
+        """ Updates plotted data (see `update`) and saves frame to file.
+
+            Parameters
+            ----------
+            var_da : xarray.DataArray
+                Masked 2D (or top layer) DataArray, on the same grid as the first frame.
+            savefig : str
+                Filename of frame, with format given by its extension (e.g. '.png').
+            title : str, optional
+                Title of frame, e.g. its date.
+
+        """
+
+        self.update(var_da, title=title)
+
+        with METRICS.timer('render_seconds'):
+            self.fig.savefig(savefig, dpi=self.dpi)
+        METRICS.increment('frames_rendered')
+
+    def close(self):
+        """ Removes all artists from figure.
+        """
+
+        self.fig.clear()
+        self._artists = []
+
+    def _plot(self, var_data):
+        """ Plots var data, returns plotted artists.
+        """
+
+        return apu.plot_var_data(self.ax, self.lon, self.lat, var_data, self.attrs, self.cmap, self.vrange,
+                                 self.cnorm, color_range=self.color_range, proj_name=self.proj_name,
+                                 levels=self.levels, extend='both', lod_factor=self.lod_factor)
+
+
+def load_map_data(filename, var='votemper', sel_kwargs=None, mask_filename=None):
+    """ Returns masked top layer of a variable within a region, read into memory, and `AnhaDataset` attributes.
+        Loader used by `Prefetcher` in `render_frames`.
+    """
+
+    ds = open_region(filename, sel_kwargs, mask_filename)
+
+    assert var in list(ds.data_vars), f'[anhalyze] Variable {var} not found in data_vars: {list(ds.data_vars)}'
+
+    return ds._get_map_data_array(var).load(), ds.attrs
+
+
+def render_frames(file_list, output_dir, var='votemper', lat_range=None, lon_range=None, depth_range=None,
+                  mask_filename=None, projection_name='LambertConformal', color_range='default', image_format='png',
+                  dpi=None, full_resolution=False, workers=1, chunk_size=None, memory_limit=None):
+    """ Saves a map of a variable for each file, as frames named `<file name>_<var>.<image_format>`,
+        e.g. to be assembled into an animation. Each worker sets a `MapRenderer` up once, for all its files.
+
+        Parameters
+        ----------
+        file_list : list
+            List of filenames, all on the same grid.
+        output_dir : str
+            Output directory.
+        var : str, optional
+            Variable name. [default: 'votemper']
+        lat_range, lon_range, depth_range : list, optional
+            Region limits, see `AnhaDataset.sel`. Maps show the top layer within depth_range.
+        mask_filename : str, optional
+            Mask filename.
+        projection_name : str, optional
+            Projection name, see `get_projection`. [default: 'LambertConformal']
+        color_range : str | list, optional
+            Color range, see `MapRenderer`. With `local`, it is found over all files from their summary stats
+            sidecars if available (full domain only), otherwise from the first file. [default: 'default']
+        image_format : str, optional
+            Image format, e.g. 'png' or 'jpg'. [default: 'png']
+        dpi : float, optional
+            Resolution of frames. [default: matplotlib 'savefig.dpi']
+        full_resolution : bool, optional
+            If True, plots the grid at full resolution, see `MapRenderer`. [default: False]
+        workers : int, optional
+            Number of worker processes. [default: 1]
+        chunk_size : int, optional
+            Number of files per worker task. [default: files split evenly between workers]
+        memory_limit : int | str, optional
+            Maximum memory of files read ahead by each worker, see `Prefetcher`.
+
+        Returns
+        -------
+        frames : list
+            Frame filenames, in the order of file_list.
+
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    sel_kwargs = {'lat_range': lat_range, 'lon_range': lon_range, 'depth_range': depth_range}
+
+    # Local color range found once, shared by all workers: over the whole run from summary stats sidecars
+    # (full domain only, see `anhalyze.core.summary_stats`), otherwise from the first file.
+    vrange = None
+    if color_range == 'local' and file_list:
+        var_da, attrs = load_map_data(file_list[0], var=var, sel_kwargs=sel_kwargs, mask_filename=mask_filename)
+        stats = None
+        if not any(sel_kwargs.values()):
+            stats = get_run_stats(file_list, var, level=0, mask_filename=mask_filename)
+        vrange = apu.get_plot_config(var, np.squeeze(var_da.data), grid=attrs['grid'], color_range='local',
+                                     stats=stats)[1]
+
+    chunks = map_chunks(_render_chunk, file_list, workers=workers, chunk_size=chunk_size, output_dir=output_dir,
+                         var=var, sel_kwargs=sel_kwargs, mask_filename=mask_filename,
+                         projection_name=projection_name, color_range=color_range, vrange=vrange,
+                         image_format=image_format, dpi=dpi, full_resolution=full_resolution,
+                         memory_limit=memory_limit)
+
+    return [frame for chunk in chunks for frame in chunk]
+
+
+def _render_chunk(file_list, output_dir, var, sel_kwargs, mask_filename, projection_name, color_range, vrange,
+                  image_format, dpi, full_resolution, memory_limit):
+    """ Renders frames of a chunk of files with a single `MapRenderer`, reading the next file while rendering.
+    """
+
+    frames = []
+    renderer = None
+    for filename, (var_da, attrs) in Prefetcher(file_list, loader=load_map_data, memory_limit=memory_limit,
+                                                var=var, sel_kwargs=sel_kwargs, mask_filename=mask_filename):
+        if renderer is None:
+            renderer = MapRenderer(var_da, attrs, color_range=color_range, proj_name=projection_name,
+                                   vrange=vrange, dpi=dpi, full_resolution=full_resolution)
+
+        year, month, day = get_date(filename, how='ymd')
+        frame = os.path.join(output_dir, os.path.basename(filename).replace('.nc', f'_{var}.{image_format}'))
+        renderer.render(var_da, frame, title=f'{year:04d}-{month:02d}-{day:02d}')
+        logger.info('Saving figure: %s', frame)
+        frames.append(frame)
+
+    if renderer is not None:
+        renderer.close()
+
+    return frames
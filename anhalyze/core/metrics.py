@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Counters and timers of a job (files opened, bytes read, cache hits, ...), that can be dumped as JSON.
+
+    Example:
+        from anhalyze.core.metrics import METRICS
+        ...
+        METRICS.dump('job_metrics.json')
+"""
+
+# System-related libraries
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Project-related libraries
+from anhalyze.core import profiling
+
+
+class Metrics:
+    """ Thread-safe counters and timers.
+
+    Counters are integers (e.g. 'files_opened', 'bytes_read', 'file_pool_hits').
+    Timers record number of calls, total and max wall time [in s] of a block (e.g. a whole batch job).
+    Metrics from several processes (e.g. batch workers) are aggregated with `merge`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+
+    def __repr__(self):
+        return f'[Anhalyze] Metrics: {json.dumps(self.to_dict())}'
+
+    def increment(self, name, value=1):
+        """ Increments counter by value.
+        """
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds, calls=1, max_seconds=None):
+        """ Adds wall time [in s] to timer.
+        """
+
+        with self._lock:
+            timer = self.timers.setdefault(name, {'calls': 0, 'seconds': 0., 'max_seconds': 0.})
+            timer['calls'] += calls
+            timer['seconds'] += seconds
+            timer['max_seconds'] = max(timer['max_seconds'], seconds if max_seconds is None else max_seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """ Context manager timing a block.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def merge(self, other):
+        """ Adds metrics from another `Metrics`, or from its `to_dict` output.
+        """
+
+        metrics = other.to_dict() if isinstance(other, Metrics) else other
+        for name, value in metrics.get('counters', {}).items():
+            self.increment(name, value)
+        for name, timer in metrics.get('timers', {}).items():
+            self.add_time(name, timer['seconds'], calls=timer['calls'], max_seconds=timer['max_seconds'])
+
+        return self
+
+    def since(self, snapshot):
+        """ Returns metrics added since a snapshot (`to_dict` output), in `to_dict` format.
+            Timers keep their overall max time.
+        """
+
+        metrics = self.to_dict()
+        for name, value in snapshot.get('counters', {}).items():
+            metrics['counters'][name] = metrics['counters'].get(name, 0) - value
+        for name, timer in snapshot.get('timers', {}).items():
+            metrics['timers'][name]['calls'] -= timer['calls']
+            metrics['timers'][name]['seconds'] -= timer['seconds']
+
+        metrics['counters'] = {name: value for name, value in metrics['counters'].items() if value}
+        metrics['timers'] = {name: timer for name, timer in metrics['timers'].items() if timer['calls']}
+
+        return metrics
+
+    def reset(self):
+        """ Removes all counters and timers.
+        """
+
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+
+    def to_dict(self):
+        """ Returns {'counters': {...}, 'timers': {...}}.
+        """
+
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'timers': {name: dict(timer) for name, timer in self.timers.items()}}
+
+    def dump(self, filename=None):
+        """ Returns metrics as JSON string, including phase stats if profiling is enabled,
+            and saves it if a filename is given.
+        """
+
+        metrics = self.to_dict()
+        if profiling.get_stats().to_dict():
+            metrics['phases'] = profiling.get_stats().to_dict()
+
+        metrics_json = json.dumps(metrics, indent=1, sort_keys=True)
+        if filename:
+            with open(filename, 'w') as f:
+                f.write(metrics_json)
+
+        return metrics_json
+
+
+# Metrics of this process.
+METRICS = Metrics()
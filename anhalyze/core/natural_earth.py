@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Natural Earth background layers (land, ocean) of maps, read from local shapefiles,
+    clipped to the map extent and projected once, then cached in memory and on disk.
+
+    Example:
+        from anhalyze.core.natural_earth import get_feature_geometries
+        geometries = get_feature_geometries('land', '50m', ccrs.NorthPolarStereo(), [-82, -78, 51, 55])
+"""
+
+# System-related libraries
+import os
+import glob
+import pickle
+import hashlib
+import logging
+import threading
+
+# Project-related libraries
+import anhalyze as ah
+import anhalyze.config as config
+from anhalyze.core.anhalyze_utils import atomic_write
+from anhalyze.core.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Environment variables with an alternate directory of Natural Earth shapefiles, and of cached geometries.
+NATURAL_EARTH_DIR_ENV = 'ANHALYZE_NATURAL_EARTH_DIR'
+CACHE_DIR_ENV = 'ANHALYZE_CACHE_DIR'
+
+# Default directory of Natural Earth shapefiles, and of cached geometries.
+NATURAL_EARTH_DIR = os.path.join(ah.PACKAGE_DATA_DIR, 'natural_earth')
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'anhalyze')
+
+# Margin kept around the map extent when clipping [in degrees], so that the map edges stay covered.
+EXTENT_MARGIN = 2.
+
+# Extent is rounded to this step [in degrees] in cache keys, so that close regions share geometries.
+EXTENT_STEP = 0.5
+
+# Version of cached geometries files, to be increased when their content changes.
+CACHE_VERSION = 1
+
+# Cache of geometries, keyed by `_get_key`. Oldest geometries are removed above `GEOMETRIES_CACHE_SIZE`.
+_GEOMETRIES_CACHE = {}
+GEOMETRIES_CACHE_SIZE = 16
+_cache_lock = threading.Lock()
+
+# Shapefiles already reported as missing.
+_missing = set()
+
+
+def get_shapefile_dirs():
+    """ Returns directories searched for Natural Earth shapefiles, in order:
+        environment variable `ANHALYZE_NATURAL_EARTH_DIR`, `<package root path>/anhalyze/package_data/natural_earth/`,
+        and cartopy data directories (pre-existing and download directories).
+    """
+
+    import cartopy
+
+    dirs = [os.environ.get(NATURAL_EARTH_DIR_ENV), NATURAL_EARTH_DIR]
+    for key in ['pre_existing_data_dir', 'data_dir']:
+        if cartopy.config.get(key):
+            dirs.append(os.path.join(cartopy.config[key], 'shapefiles', 'natural_earth'))
+
+    return [path for path in dirs if path]
+
+
+def find_shapefile(feature, resolution, category='physical'):
+    """ Returns filename of a local Natural Earth shapefile, None if not found.
+        Shapefiles are named `ne_<resolution>_<feature>.shp`, directly in the searched directories
+        or in a `<category>` subdirectory (cartopy layout), see `get_shapefile_dirs`.
+
+        Parameters
+        ----------
+        feature : str
+            Natural Earth feature, e.g. 'land' or 'ocean'.
+        resolution : str
+            Available resolutions '10m', '50m', or '110m'.
+        category : str, optional
+            Natural Earth category. [default: 'physical']
+
+    """
+
+    name = f'ne_{resolution}_{feature}.shp'
+    for path in get_shapefile_dirs():
+        for filename in [os.path.join(path, name), os.path.join(path, category, name)]:
+            if os.path.isfile(filename):
+                return filename
+
+    if config.package_data['natural_earth']['autodownload_file']:
+        from anhalyze.core.downloader import download_natural_earth
+        return download_natural_earth(feature, resolution, category=category)
+
+    return None
+
+
+def get_feature_geometries(feature, resolution, projection, extent):
+    """ Returns Natural Earth geometries clipped to a map extent (plus `EXTENT_MARGIN`), in map projection
+        coordinates. Geometries are built once per (feature, resolution, projection, extent),
+        then read from memory or from the disk cache.
+
+        Parameters
+        ----------
+        feature : str
+            Natural Earth feature, e.g. 'land' or 'ocean'.
+        resolution : str
+            Available resolutions '10m', '50m', or '110m'.
+        projection : cartopy.crs.Projection
+            Map projection.
+        extent : list
+            Map extent as [lon_min, lon_max, lat_min, lat_max]. [in degrees]
+
+        Returns
+        -------
+        geometries : list | None
+            List of shapely geometries, None if the shapefile is not available locally.
+
+    """
+
+    shapefile = find_shapefile(feature, resolution)
+    if shapefile is None:
+        if (feature, resolution) not in _missing:
+            _missing.add((feature, resolution))
+            logger.warning("Natural Earth shapefile 'ne_%s_%s.shp' not found in %s, map drawn without %s. "
+                           "See `anhalyze.core.downloader.download_natural_earth`.",
+                           resolution, feature, get_shapefile_dirs(), feature)
+        return None
+
+    key = _get_key(shapefile, projection, extent)
+
+    with _cache_lock:
+        if key in _GEOMETRIES_CACHE:
+            METRICS.increment('geometry_cache_hits')
+            return _GEOMETRIES_CACHE[key]
+
+    cache_filename = os.path.join(os.environ.get(CACHE_DIR_ENV, CACHE_DIR), 'natural_earth', f'{key}.pkl')
+    geometries = _read_cache(cache_filename)
+
+    if geometries is None:
+        METRICS.increment('geometry_cache_misses')
+        geometries = _build_geometries(shapefile, projection, extent)
+        _write_cache(cache_filename, geometries)
+    else:
+        METRICS.increment('geometry_cache_hits')
+
+    with _cache_lock:
+        if key not in _GEOMETRIES_CACHE and len(_GEOMETRIES_CACHE) >= GEOMETRIES_CACHE_SIZE:
+            _GEOMETRIES_CACHE.pop(next(iter(_GEOMETRIES_CACHE)))
+        _GEOMETRIES_CACHE[key] = geometries
+
+    return geometries
+
+
+def clear_cache(disk=False):
+    """ Removes cached geometries from memory, and from disk if `disk` is True.
+    """
+
+    with _cache_lock:
+        _GEOMETRIES_CACHE.clear()
+    _missing.clear()
+
+    if disk:
+        for filename in glob.glob(os.path.join(os.environ.get(CACHE_DIR_ENV, CACHE_DIR), 'natural_earth', '*.pkl')):
+            os.remove(filename)
+
+
+def _get_extent(extent):
+    """ Returns extent with margin, rounded outwards to `EXTENT_STEP`, and limited to valid lon-lat values.
+    """
+
+    import numpy as np
+
+    lon_min, lon_max, lat_min, lat_max = [float(value) for value in extent]
+
+    lon_min, lat_min = [np.floor((value - EXTENT_MARGIN) / EXTENT_STEP) * EXTENT_STEP for value in [lon_min, lat_min]]
+    lon_max, lat_max = [np.ceil((value + EXTENT_MARGIN) / EXTENT_STEP) * EXTENT_STEP for value in [lon_max, lat_max]]
+
+    return [max(lon_min, -180.), min(lon_max, 180.), max(lat_min, -90.), min(lat_max, 90.)]
+
+
+def _get_key(shapefile, projection, extent):
+    """ Returns cache key of geometries, from shapefile (name, size and modification time),
+        projection (proj4 parameters and limits) and extent.
+    """
+
+    stat = os.stat(shapefile)
+    description = repr((CACHE_VERSION, os.path.basename(shapefile), stat.st_size, stat.st_mtime_ns,
+                        projection.proj4_init, projection.x_limits, projection.y_limits, _get_extent(extent)))
+
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def _build_geometries(shapefile, projection, extent):
+    """ Returns geometries of shapefile within extent (plus margin), in projection coordinates.
+    """
+
+    import shapely
+    from cartopy import crs as ccrs
+    from cartopy.io import shapereader
+
+    lon_min, lon_max, lat_min, lat_max = _get_extent(extent)
+    box = shapely.box(lon_min, lat_min, lon_max, lat_max)
+
+    geometries = []
+    plate_carree = ccrs.PlateCarree()
+    for geometry in shapereader.Reader(shapefile).geometries():
+        if not geometry.intersects(box):
+            continue
+        geometry = geometry.intersection(box)
+        if geometry.is_empty:
+            continue
+
+        geometry = projection.project_geometry(geometry, plate_carree)
+        if not geometry.is_empty:
+            geometries.append(geometry)
+
+    return geometries
+
+
+def _read_cache(filename):
+    """ Returns geometries saved in cache file, None if not found or unreadable.
+    """
+
+    if not os.path.isfile(filename):
+        return None
+
+    import shapely
+
+    try:
+        with open(filename, 'rb') as f:
+            return list(shapely.from_wkb(pickle.load(f)))
+    except Exception as e:
+        logger.warning('Cached geometries could not be read from %s: %s', filename, e)
+        return None
+
+
+def _write_cache(filename, geometries):
+    """ Saves geometries (as WKB) to cache file, through a temporary file renamed at the end.
+        Cache is skipped if the directory is not writable.
+    """
+
+    import shapely
+
+    try:
+        with atomic_write(filename) as tmp_filename, open(tmp_filename, 'wb') as f:
+            pickle.dump([shapely.to_wkb(geometry) for geometry in geometries], f)
+    except OSError as e:
+        logger.warning('Cached geometries could not be saved to %s: %s', filename, e)
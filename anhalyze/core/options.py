@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Global options of `anhalyze`.
+
+    Example:
+        import anhalyze as ah
+        ah.set_options(memory_limit='4GB', headless=True)
+
+        # Or only within a block
+        with ah.set_options(memory_limit='500MB'):
+            ds.to_netcdf(path='cuts/')
+"""
+
+# Project-related libraries
+from anhalyze.core.anhalyze_utils import parse_bytes
+
+# Global options, see `set_options`.
+OPTIONS = {'memory_limit': None, 'headless': False}
+
+
+class set_options:
+    """ Sets global options, for the whole session or within a `with` block.
+
+    Parameters
+    ----------
+    memory_limit : int | str, optional
+        Memory budget of a single operation, e.g. '4GB'. When set, masking (`_get_var_data_array`),
+        reductions (`get_timeseries`, `get_climatology`), export (`to_netcdf`) and plotting
+        process data in depth (or time) blocks fitting within this budget. None to disable. [default: None]
+    headless : bool, optional
+        If True, maps (`show_var_data_map`) are only saved, never displayed: drawn with the Agg backend
+        on a figure reused between maps, without pyplot, e.g. for batch jobs and servers. [default: False]
+
+    """
+
+    def __init__(self, **kwargs):
+        """ Initializing object, setting options.
+        """
+
+        for name in kwargs:
+            assert name in OPTIONS, f'[Anhalyze] Option {name} not found in: {list(OPTIONS)}'
+
+        self._previous = dict(OPTIONS)
+
+        if kwargs.get('memory_limit') is not None:
+            kwargs['memory_limit'] = parse_bytes(kwargs['memory_limit'])
+            assert kwargs['memory_limit'] > 0, '[Anhalyze] memory_limit should be positive.'
+
+        OPTIONS.update(kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        OPTIONS.clear()
+        OPTIONS.update(self._previous)
+
+
+def get_options():
+    """ Returns copy of global options.
+    """
+
+    return dict(OPTIONS)
+
+
+def init_worker(options):
+    """ Initializer of process pool workers, applying options of the parent process.
+    """
+
+    set_options(**options)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import threading
+from collections import deque
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_utils import parse_bytes
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.options import OPTIONS
+
+
+def load_anha_dataset(filename, variables=None, mask_filename=None):
+    """ Opens `AnhaDataset` and reads its data into memory.
+        Default loader for `Prefetcher`.
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        variables : list, optional
+            Variables to read, others are kept lazy. If None, all variables are read.
+        mask_filename : str, optional
+            Mask filename.
+
+    """
+
+    ds = AnhaDataset(filename, mask_filename=mask_filename)
+
+    # Reading (and decompressing) data
+    if variables is None:
+        ds._xr_dataset.load()
+    else:
+        for var in variables:
+            ds.data_vars[var].load()
+
+    return ds
+
+
+class Prefetcher:
+    """ Iterator over a list of files, that reads the next file(s) in a background
+    thread while the current file is being processed. Useful for any sequential loop
+    over a run (e.g. time series, climatology, batch cuts), to hide I/O latency.
+
+    Parameters
+    ----------
+    file_list : list
+        List of filenames.
+    loader : callable, optional
+        Function returning the loaded data given a filename.
+        [default: `load_anha_dataset`]
+    depth : int, optional
+        Number of files read ahead of the current one. [default: 1]
+    memory_limit : int | str, optional
+        Maximum memory used by files read ahead (e.g. '2GB'). At least one file is
+        always read ahead, even if larger. [default: global `memory_limit` option, see `anhalyze.set_options`]
+    **loader_kwargs
+        Additional options passed to loader, e.g. `variables` or `mask_filename`.
+
+    Examples
+    --------
+    >>> for filename, ds in Prefetcher(file_list, depth=2, variables=['votemper']):
+    ...     ds.sel(lat_range=[50, 65], lon_range=[-93, -75])
+
+    """
+
+    def __init__(self, file_list, loader=None, depth=1, memory_limit=None, **loader_kwargs):
+        """ Initializing object.
+        """
+
+        assert depth >= 1, '[Anhalyze] Prefetcher depth should be at least 1.'
+
+        self.file_list = list(file_list)
+        self.loader = loader if loader else load_anha_dataset
+        self.loader_kwargs = loader_kwargs
+        self.depth = depth
+        self.memory_limit = parse_bytes(memory_limit) if memory_limit else OPTIONS['memory_limit']
+
+        # Files read ahead, as (filename, data, nbytes, error)
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def __iter__(self):
+        """ Yields (filename, data) for each file in file_list.
+        """
+
+        self._start()
+
+        try:
+            for _ in self.file_list:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._queue)
+                    filename, data, nbytes, error = self._queue.popleft()
+                    self._queued_bytes -= nbytes
+                    self._condition.notify_all()
+
+                if error:
+                    raise error
+
+                yield filename, data
+        finally:
+            self.close()
+
+    def __len__(self):
+        """ Returns number of files.
+        """
+
+        return len(self.file_list)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Stops background thread.
+        """
+
+        with self._condition:
+            self._stop = True
+            self._queue.clear()
+            self._queued_bytes = 0
+            self._condition.notify_all()
+
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _start(self):
+        """ Starts background thread.
+        """
+
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _has_room(self):
+        """ Returns True if there is room to read another file ahead.
+        """
+
+        if self._stop or not self._queue:
+            return True
+        if len(self._queue) >= self.depth:
+            return False
+        if self.memory_limit and self._queued_bytes >= self.memory_limit:
+            return False
+
+        return True
+
+    def _run(self):
+        """ Reads files in order, waiting for room in the queue.
+        """
+
+        for filename in self.file_list:
+            with self._condition:
+                self._condition.wait_for(self._has_room)
+                if self._stop:
+                    return
+
+            data, nbytes, error = None, 0, None
+            try:
+                data = self.loader(filename, **self.loader_kwargs)
+                nbytes = get_nbytes(data)
+                METRICS.increment('bytes_read', nbytes)
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                if self._stop:
+                    return
+                self._queue.append((filename, data, nbytes, error))
+                self._queued_bytes += nbytes
+                self._condition.notify_all()
+
+            # No need to read further after an error.
+            if error:
+                return
+
+
+def get_nbytes(data):
+    """ Returns memory size (in bytes) of data loaded by a `Prefetcher` loader.
+    """
+
+    if isinstance(data, AnhaDataset):
+        data = data._xr_dataset
+
+    if isinstance(data, (tuple, list)):
+        return sum(get_nbytes(item) for item in data)
+
+    # Only counting variables read into memory for xarray objects.
+    if hasattr(data, 'variables'):
+        return int(sum(var.nbytes for var in data.variables.values() if var._in_memory))
+
+    return int(getattr(data, 'nbytes', 0))
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Optional phase-level instrumentation of `AnhaDataset` hot paths.
+
+    Example:
+        from anhalyze.core import profiling
+        profiling.enable_profiling()
+        ds = ah.AnhaDataset(filename).sel(lat_range=[50, 65], lon_range=[-93, -75])
+        print(profiling.get_stats())
+
+        # Memory tracing, with the largest temporaries
+        with profiling.trace_memory():
+            ds._get_var_data_array('votemper').values
+        print(profiling.get_memory_report())
+
+        # Peak memory of common operations on synthetic files, against reference budgets
+        print(profiling.check_memory_budgets(write_synthetic_run(tmp_dir, n_files=1)))
+"""
+
+# System-related libraries
+import os
+import re
+import sys
+import time
+import heapq
+import subprocess
+import tempfile
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+# Profiling options, see `enable_profiling`.
+_options = {'enabled': False, 'allocations': False, 'memory': False}
+
+# Number of calls kept in the memory report, those with the largest temporaries.
+MEMORY_REPORT_SIZE = 50
+
+# Reference peak memory budgets of `AnhaDataset` operations, as multiples of the size of one full 3D variable
+# (e.g. votemper), measured with tracemalloc on synthetic files (`anhalyze.core.synthetic`), plus a ~25% margin.
+# Peaks found in tiny to medium sizes: open 0.5-0.9 (fixed costs in small files), read 2.0 (netCDF decoding),
+# apply_mask 2.5-2.6, regional operations 0.1-0.5, plot_config 0.0.
+# A peak above budget usually means a new hidden full-size temporary.
+MEMORY_BUDGETS = {'open': 1.1,  # Open file with mask (mask, coordinates)
+                  'read': 2.5,  # Read a 3D variable (.values)
+                  'apply_mask': 3.2,  # Read a masked 3D variable
+                  'sel_apply_mask': 0.6,  # Read a masked 3D variable in a region (within sel)
+                  'region_mean': 0.6,  # Depth profile of mean in a region
+                  'to_netcdf': 0.6,  # Export of a region
+                  'plot_config': 0.1}  # Color range from data (divergent variable)
+
+# Region of selections in `measure_peaks` (Baffin Bay like).
+BUDGET_LAT_RANGE = [60, 78]
+BUDGET_LON_RANGE = [-80, -40]
+
+# Import time targets [in ms], for modules used by CLI calls and process pool workers.
+IMPORT_TIME_TARGETS = {'anhalyze': 50,
+                       'anhalyze.cli': 50}
+
+# Heavy dependencies that importing `anhalyze` should not load.
+HEAVY_MODULES = ['xarray', 'pandas', 'scipy', 'matplotlib', 'cartopy', 'cmocean', 'IPython', 'requests']
+
+# Files skipped when looking for the caller of a phase.
+_SKIPPED_FILES = (os.path.normcase(__file__), os.path.normcase(sys.modules['contextlib'].__file__))
+
+
+class PhaseStats:
+    """ Statistics for each phase: number of calls, wall time [in s],
+        bytes read [from /proc/self/io, Linux only], net memory allocated [in bytes, with tracemalloc],
+        and largest peak memory of a call above memory at its start [in bytes, memory tracing only].
+
+        Stats from several processes (e.g. batch workers) are aggregated with `merge`.
+    """
+
+    FIELDS = ('calls', 'seconds', 'bytes_read', 'allocated', 'peak')
+
+    def __init__(self, phases=None):
+        self._lock = threading.Lock()
+        self._phases = {}
+        if phases:
+            self.merge(phases)
+
+    def __repr__(self):
+        lines = [f'[Anhalyze] {"phase":<28}{"calls":>8}{"seconds":>12}{"MB read":>12}{"MB alloc":>12}'
+                 f'{"MB peak":>12}']
+        for name, values in sorted(self._phases.items()):
+            lines.append(f'[Anhalyze] {name:<28}{values["calls"]:>8}{values["seconds"]:>12.4f}'
+                         f'{values["bytes_read"] / 1e6:>12.2f}{values["allocated"] / 1e6:>12.2f}'
+                         f'{values["peak"] / 1e6:>12.2f}')
+        return '\n'.join(lines)
+
+    def __getitem__(self, name):
+        return dict(self._phases[name])
+
+    def __contains__(self, name):
+        return name in self._phases
+
+    def add(self, name, seconds=0., bytes_read=0, allocated=0, peak=0, calls=1):
+        """ Adds one (or several) calls of a phase.
+        """
+
+        with self._lock:
+            values = self._phases.setdefault(name, dict.fromkeys(self.FIELDS, 0))
+            values['calls'] += calls
+            values['seconds'] += seconds
+            values['bytes_read'] += bytes_read
+            values['allocated'] += allocated
+            values['peak'] = max(values['peak'], peak)
+
+    def merge(self, other):
+        """ Adds stats from another `PhaseStats`, or from its `to_dict` output.
+        """
+
+        phases = other.to_dict() if isinstance(other, PhaseStats) else other
+        for name, values in phases.items():
+            self.add(name, **{field: values.get(field, 0) for field in self.FIELDS})
+
+        return self
+
+    def reset(self):
+        """ Removes all stats.
+        """
+
+        with self._lock:
+            self._phases = {}
+
+    def to_dict(self):
+        """ Returns stats as {phase: {calls, seconds, bytes_read, allocated, peak}}, e.g. to send between processes.
+        """
+
+        with self._lock:
+            return {name: dict(values) for name, values in self._phases.items()}
+
+    def to_dataframe(self):
+        """ Returns stats as `pandas.DataFrame`, one row per phase, with mean time per call.
+        """
+
+        import pandas as pd
+
+        df = pd.DataFrame.from_dict(self.to_dict(), orient='index', columns=list(self.FIELDS))
+        df.index.name = 'phase'
+        df['seconds_per_call'] = df['seconds'] / df['calls']
+
+        return df.sort_index()
+
+
+# Stats of this process.
+STATS = PhaseStats()
+
+# Calls with the largest temporaries, as heap of (temporary, n, record), see `get_memory_report`.
+_memory_records = []
+_memory_lock = threading.Lock()
+
+# Phases being run in each thread, for memory tracing of nested phases.
+_local = threading.local()
+
+
+def enable_profiling(allocations=False, memory=False):
+    """ Enables phase-level instrumentation.
+
+        Parameters
+        ----------
+        allocations : bool, optional
+            If True, also tracks net memory allocated by each phase with `tracemalloc` (slower). [default: False]
+        memory : bool, optional
+            If True, also tracks peak memory of each call with `tracemalloc`, and keeps calls with the largest
+            temporaries (peak minus memory kept at the end), see `get_memory_report`. [default: False]
+
+    """
+
+    _options['enabled'] = True
+    _options['allocations'] = allocations or memory
+    _options['memory'] = memory
+    if _options['allocations'] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable_profiling():
+    """ Disables phase-level instrumentation. Collected stats are kept.
+    """
+
+    if _options['allocations'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _options['enabled'] = False
+    _options['allocations'] = False
+    _options['memory'] = False
+
+
+def is_enabled():
+    """ Returns True if instrumentation is enabled.
+    """
+
+    return _options['enabled']
+
+
+def get_stats():
+    """ Returns `PhaseStats` of this process.
+    """
+
+    return STATS
+
+
+@contextmanager
+def trace_memory():
+    """ Context manager enabling memory tracing (see `enable_profiling`) within a block,
+        starting from an empty memory report. Previous options are restored at the end.
+    """
+
+    previous = dict(_options)
+    was_tracing = tracemalloc.is_tracing()
+    with _memory_lock:
+        _memory_records.clear()
+
+    enable_profiling(allocations=True, memory=True)
+    try:
+        yield
+    finally:
+        _options.update(previous)
+        if not was_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def get_memory_report(top=10):
+    """ Returns calls with the largest temporaries, recorded with memory tracing.
+
+        Parameters
+        ----------
+        top : int, optional
+            Number of calls. [default: 10]
+
+        Returns
+        -------
+        report : pandas.DataFrame
+            One row per call, sorted by temporary size, with columns: phase, caller (file:line, function),
+            peak (peak memory above memory at start), retained (memory kept at the end),
+            and temporary (peak minus retained) [in bytes].
+
+    """
+
+    import pandas as pd
+
+    with _memory_lock:
+        records = [record for _, _, record in sorted(_memory_records, reverse=True)[:top]]
+
+    return pd.DataFrame(records, columns=['phase', 'caller', 'peak', 'retained', 'temporary'])
+
+
+def measure_peak(function, *args, **kwargs):
+    """ Returns output of function, and its peak and retained memory [in bytes] with `tracemalloc`.
+
+        Returns
+        -------
+        output, peak, retained :
+            Output of function, peak memory above memory at start, and memory kept at the end.
+
+    """
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+
+    _update_peaks()
+    start = tracemalloc.get_traced_memory()[0]
+    try:
+        output = function(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return output, max(peak, current) - start, current - start
+
+
+@contextmanager
+def phase(name):
+    """ Context manager recording a phase in `STATS`, if profiling is enabled.
+
+        Parameters
+        ----------
+        name : str
+            Phase name, e.g. 'init.mask'.
+
+    """
+
+    if not _options['enabled']:
+        yield
+        return
+
+    tracing = _options['allocations'] and tracemalloc.is_tracing()
+    memory = tracing and _options['memory']
+
+    if memory:
+        frame = _enter_memory_frame()
+    start_allocated = tracemalloc.get_traced_memory()[0] if tracing else 0
+    start_read = _get_bytes_read()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        allocated = (tracemalloc.get_traced_memory()[0] - start_allocated) if tracing else 0
+        peak = _exit_memory_frame(frame, name, allocated) if memory else 0
+
+        STATS.add(name,
+                  seconds=seconds,
+                  bytes_read=_get_bytes_read() - start_read,
+                  allocated=allocated,
+                  peak=peak)
+
+
+def profile_phase(name):
+    """ Decorator recording each call of a function as a phase, see `phase`.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def measure_peaks(files, var='votemper'):
+    """ Returns peak memory [in bytes] of each operation in `MEMORY_BUDGETS`, and size of var [in bytes].
+
+        Parameters
+        ----------
+        files : dict
+            Synthetic files, as {'mask': mask_filename, 'gridT': [filenames]},
+            see `anhalyze.core.synthetic.write_synthetic_run`.
+        var : str, optional
+            3D variable name. [default: 'votemper']
+
+        Returns
+        -------
+        peaks, var_nbytes : dict, int
+
+    """
+
+    from anhalyze.core.anhalyze import AnhaDataset
+    from anhalyze.core.anhalyze_plot_utils import get_plot_config
+
+    filename, mask_filename = files['gridT'][0], files['mask']
+
+    def open_dataset():
+        return AnhaDataset(filename, mask_filename=mask_filename, use_file_pool=False)
+
+    def region_mean(ds):
+        var_da = ds.sel(lat_range=BUDGET_LAT_RANGE, lon_range=BUDGET_LON_RANGE)._get_var_data_array(var)
+        return var_da.mean(dim=[ds.attrs['dim_y'], ds.attrs['dim_x']]).values
+
+    def to_netcdf(ds):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ds.sel(lat_range=BUDGET_LAT_RANGE, lon_range=BUDGET_LON_RANGE).to_netcdf(path=tmp_dir, filename='region.nc')
+
+    values = open_dataset().data_vars[var].values
+
+    # Operations on a dataset just opened, without data cached by xarray.
+    operations = {'open': lambda ds: open_dataset(),
+                  'read': lambda ds: ds.data_vars[var].values,
+                  'apply_mask': lambda ds: ds._get_var_data_array(var).values,
+                  'sel_apply_mask': lambda ds: ds.sel(lat_range=BUDGET_LAT_RANGE,
+                                                      lon_range=BUDGET_LON_RANGE)._get_var_data_array(var).values,
+                  'region_mean': region_mean,
+                  'to_netcdf': to_netcdf,
+                  # Divergent color range, as for currents.
+                  'plot_config': lambda ds: get_plot_config('vozocrtx', values, grid='gridU',
+                                                            color_range='local')}
+
+    peaks = {}
+    for name, operation in operations.items():
+        # First call excluded, with one-time imports and caches.
+        operation(open_dataset())
+        _, peaks[name], _ = measure_peak(operation, open_dataset())
+
+    return peaks, values.nbytes
+
+
+def check_memory_budgets(files, budgets=None):
+    """ Returns dict of {operation: (peak, budget, passed)}, with peak and budget
+        as multiples of the size of one 3D variable, see `MEMORY_BUDGETS`.
+    """
+
+    budgets = MEMORY_BUDGETS if budgets is None else budgets
+    peaks, var_nbytes = measure_peaks(files)
+
+    return {name: (peaks[name] / var_nbytes, budget, peaks[name] / var_nbytes <= budget)
+            for name, budget in budgets.items()}
+
+
+def get_import_times(module):
+    """ Returns dict of cumulative import time [in ms] of each module imported by `import <module>`,
+        from a fresh interpreter with `python -X importtime`.
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+
+    import_times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)', line)
+        if match:
+            import_times[match.group(4)] = int(match.group(2)) / 1000
+
+    return import_times
+
+
+def get_heavy_modules(module):
+    """ Returns list of `HEAVY_MODULES` loaded by `import <module>`.
+    """
+
+    code = f'import sys, {module}; print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+
+    return result.stdout.split()
+
+
+def _update_peaks():
+    """ Updates peak of running phases with the tracemalloc peak, and resets it.
+        The tracemalloc peak is global, so it is reset at the start of each phase,
+        with its value kept by the phases still running.
+    """
+
+    peak = tracemalloc.get_traced_memory()[1]
+    for frame in getattr(_local, 'frames', []):
+        frame['peak'] = max(frame['peak'], peak)
+    tracemalloc.reset_peak()
+
+
+def _enter_memory_frame():
+    """ Starts memory tracing of a phase.
+    """
+
+    _update_peaks()
+
+    frame = {'start': tracemalloc.get_traced_memory()[0]}
+    frame['peak'] = frame['start']
+    frame['caller'] = _get_caller()
+
+    if not hasattr(_local, 'frames'):
+        _local.frames = []
+    _local.frames.append(frame)
+
+    return frame
+
+
+def _exit_memory_frame(frame, name, allocated):
+    """ Ends memory tracing of a phase, and returns its peak above memory at its start.
+    """
+
+    _update_peaks()
+    _local.frames.remove(frame)
+
+    peak = frame['peak'] - frame['start']
+    record = {'phase': name, 'caller': frame['caller'],
+              'peak': peak, 'retained': allocated, 'temporary': peak - max(allocated, 0)}
+
+    with _memory_lock:
+        item = (record['temporary'], id(record), record)
+        if len(_memory_records) < MEMORY_REPORT_SIZE:
+            heapq.heappush(_memory_records, item)
+        else:
+            heapq.heappushpop(_memory_records, item)
+
+    return peak
+
+
+def _get_caller():
+    """ Returns 'file:line (function)' of the code calling the current phase.
+    """
+
+    frame = sys._getframe(1)
+    while frame and os.path.normcase(frame.f_code.co_filename) in _SKIPPED_FILES:
+        frame = frame.f_back
+
+    if frame is None:
+        return ''
+
+    return f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} ({frame.f_code.co_name})'
+
+
+def _get_bytes_read():
+    """ Returns bytes read by this process so far (including from page cache), 0 if not available.
+    """
+
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return 0
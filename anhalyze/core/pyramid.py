@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Multi-resolution pyramid of ANHA files: coarsened levels (e.g. 2x, 4x, 8x) of selected variables,
+    computed once per file with mask-aware block means (wet cells only, blocks mostly on land masked),
+    and saved as compact files next to each file, as `<file name>_x<factor>.nc`.
+    Levels are read with `AnhaDataset(filename, resolution=factor)`, e.g. for quick-look analysis and plots
+    at basin scale.
+
+    Example:
+        from anhalyze.core.pyramid import build_pyramid
+        build_pyramid(file_list, variables=['votemper', 'sossheig'], factors=[2, 4, 8], workers=8)
+
+        ds = ah.AnhaDataset(file_list[0], resolution=4)
+"""
+
+# System-related libraries
+import os
+import logging
+import numpy as np
+
+# Data-related libraries
+import xarray as xr
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_run import map_chunks
+from anhalyze.core.anhalyze_utils import atomic_write, get_grid_variables
+from anhalyze.core.blocks import iter_masked_blocks
+from anhalyze.core.encoding import get_encoding
+from anhalyze.core.file_pool import open_dataset
+from anhalyze.core.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Environment variable with an alternate directory for pyramid levels (e.g. read-only data directories).
+PYRAMID_DIR_ENV = 'ANHALYZE_PYRAMID_DIR'
+
+# Default coarsening factors of pyramid levels.
+DEFAULT_FACTORS = (2, 4, 8)
+
+# Version of pyramid levels, to be increased when their content changes.
+PYRAMID_VERSION = 1
+
+
+def get_pyramid_path(filename, factor, pyramid_dir=None):
+    """ Returns filename of a pyramid level of an ANHA file, `<file name>_x<factor>.nc`, located in `pyramid_dir`,
+        the directory in environment variable `ANHALYZE_PYRAMID_DIR`, or next to the file.
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        factor : int
+            Coarsening factor.
+        pyramid_dir : str, optional
+            Directory of pyramid levels.
+
+    """
+
+    if not pyramid_dir:
+        pyramid_dir = os.environ.get(PYRAMID_DIR_ENV, os.path.dirname(os.path.realpath(filename)))
+
+    return os.path.join(pyramid_dir, os.path.basename(filename).replace('.nc', f'_x{int(factor)}.nc'))
+
+
+def find_pyramid_level(filename, factor, pyramid_dir=None):
+    """ Returns filename of a pyramid level of an ANHA file, None if missing, or older than the file
+        (different size or modification time).
+        See `get_pyramid_path` for parameters.
+    """
+
+    level_filename = get_pyramid_path(filename, factor, pyramid_dir=pyramid_dir)
+    if not os.path.isfile(level_filename):
+        return None
+
+    stat = os.stat(filename)
+    attrs = open_dataset(level_filename).attrs
+    source = [attrs.get(key) for key in ['pyramid_version', 'pyramid_source_size', 'pyramid_source_mtime_ns']]
+
+    if source != [PYRAMID_VERSION, stat.st_size, stat.st_mtime_ns]:
+        logger.debug('Pyramid level out of date: %s', level_filename)
+        return None
+
+    return level_filename
+
+
+def coarsen_dataset(ds, factor, variables=None):
+    """ Returns `xarray.Dataset` with masked variables of an `AnhaDataset` coarsened by block means of
+        factor x factor cells (see `coarsen_data`), read in blocks within the global memory limit
+        (see `anhalyze.set_options`).
+        Means are over wet cells only, blocks with less than half wet cells are masked.
+        The coarsened mask (`mask`) and the wet fraction of each block (`wet_fraction`) are included.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset, with mask.
+        factor : int
+            Coarsening factor.
+        variables : list, optional
+            Variable names. [default: all variables on the horizontal grid]
+
+    """
+
+    from anhalyze.core.anhalyze_plot_utils import coarsen_coords, coarsen_data
+
+    dim_y, dim_x = ds.attrs['dim_y'], ds.attrs['dim_x']
+    coord_lat, coord_lon = ds.attrs['coord_lat'], ds.attrs['coord_lon']
+
+    if variables is None:
+        variables = get_grid_variables(ds)
+
+    # Coordinates: grid coordinates averaged on the sphere, others (depth, time) kept.
+    lon, lat = coarsen_coords(ds.coords[coord_lon].values, ds.coords[coord_lat].values, factor, geographic=True)
+    coords = {coord_lat: ((dim_y, dim_x), lat.astype(np.float32), ds.coords[coord_lat].attrs),
+              coord_lon: ((dim_y, dim_x), lon.astype(np.float32), ds.coords[coord_lon].attrs)}
+    coords |= {name: coord for name, coord in ds._xr_dataset.coords.items()
+               if name not in [coord_lat, coord_lon] and not {dim_y, dim_x} & set(coord.dims)}
+
+    # Wet fraction of each block, and mask of blocks kept.
+    mask_da = ds.data_vars['mask']
+    wet_fraction = coarsen_data((mask_da.values == 1).astype(np.float64), factor)
+    data_vars = {'wet_fraction': (mask_da.dims, wet_fraction.astype(np.float32),
+                                  {'long_name': 'Fraction of wet cells'}),
+                 'mask': (mask_da.dims, (wet_fraction >= 0.5).astype(np.int8), mask_da.attrs)}
+
+    for var in variables:
+        var_da = ds.data_vars[var]
+        assert var_da.dims[-2:] == (dim_y, dim_x), \
+            f'[Anhalyze] Variable {var} dimensions {var_da.dims} should end with ({dim_y}, {dim_x}).'
+
+        coarse_shape = var_da.shape[:-2] + wet_fraction.shape[-2:]
+        coarse_data = np.full(coarse_shape, np.nan, dtype=np.float32)
+
+        for block, block_da in iter_masked_blocks(ds, var):
+            index = tuple(block.get(dim, slice(None)) for dim in var_da.dims[:-2])
+            coarse_data[index] = coarsen_data(block_da.values, factor)
+
+        data_vars[var] = (var_da.dims, coarse_data, var_da.attrs)
+
+    # Variables without horizontal grid (e.g. time bounds) kept.
+    data_vars |= {var: var_da for var, var_da in ds._xr_dataset.data_vars.items()
+                  if var not in data_vars and not {dim_y, dim_x} & set(var_da.dims)}
+
+    return xr.Dataset(data_vars, coords=coords, attrs=dict(ds._xr_dataset.attrs))
+
+
+def write_pyramid_level(filename, factor, variables=None, mask_filename=None, pyramid_dir=None, preset='archive',
+                        overwrite=False):
+    """ Computes a pyramid level of a file (see `coarsen_dataset`), and saves it through a temporary file
+        renamed at the end. Returns level filename. Up-to-date levels are kept, unless overwrite is True.
+        See `build_pyramid` for parameters.
+    """
+
+    level_filename = get_pyramid_path(filename, factor, pyramid_dir=pyramid_dir)
+
+    if not overwrite and find_pyramid_level(filename, factor, pyramid_dir=pyramid_dir):
+        logger.debug('Pyramid level up to date: %s', level_filename)
+        return level_filename
+
+    ds = AnhaDataset(filename, mask_filename=mask_filename)
+    level = coarsen_dataset(ds, factor, variables=variables)
+
+    stat = os.stat(filename)
+    level.attrs |= {'pyramid_version': PYRAMID_VERSION, 'pyramid_factor': int(factor),
+                    'pyramid_source': os.path.basename(filename),
+                    'pyramid_source_size': stat.st_size, 'pyramid_source_mtime_ns': stat.st_mtime_ns}
+    # Attributes kept as netCDF attributes, the mask is included in the level.
+    level.attrs = {key: value for key, value in level.attrs.items()
+                   if isinstance(value, (str, int, float, np.number)) and key != 'mask_filename'}
+
+    encoding = get_encoding(level, preset=preset, dims={'x': ds.attrs['dim_x'], 'y': ds.attrs['dim_y'],
+                                                        'z': ds.attrs.get('dim_z')})
+
+    with atomic_write(level_filename) as tmp_filename:
+        level.to_netcdf(tmp_filename, encoding=encoding)
+
+    METRICS.increment('pyramid_levels_written')
+    logger.info('Saving pyramid level: %s', level_filename)
+
+    return level_filename
+
+
+def build_pyramid(file_list, variables=None, factors=DEFAULT_FACTORS, mask_filename=None, pyramid_dir=None,
+                  preset='archive', overwrite=False, workers=1, chunk_size=None):
+    """ Saves pyramid levels of all files, in a process pool if workers > 1.
+        Data are read in blocks within the global memory limit (see `anhalyze.set_options`).
+
+        Parameters
+        ----------
+        file_list : list
+            List of filenames.
+        variables : list, optional
+            Variable names. [default: all variables on the horizontal grid]
+        factors : list, optional
+            Coarsening factors of levels. [default: (2, 4, 8)]
+        mask_filename : str, optional
+            Mask filename.
+        pyramid_dir : str, optional
+            Directory of pyramid levels, see `get_pyramid_path`.
+        preset : str, optional
+            Encoding preset of levels, see `AnhaDataset.to_netcdf`. [default: 'archive']
+        overwrite : bool, optional
+            If True, recomputes up-to-date levels. [default: False]
+        workers : int, optional
+            Number of worker processes. [default: 1]
+        chunk_size : int, optional
+            Number of files per worker task. [default: files split evenly between workers]
+
+        Returns
+        -------
+        levels : list
+            Level filenames, for each file in the order of file_list, and each factor.
+
+    """
+
+    for factor in factors:
+        assert int(factor) == factor and factor > 1, f'[Anhalyze] Coarsening factor {factor} should be an int > 1.'
+
+    chunks = map_chunks(_pyramid_chunk, file_list, workers=workers, chunk_size=chunk_size, variables=variables,
+                         factors=[int(factor) for factor in factors], mask_filename=mask_filename,
+                         pyramid_dir=pyramid_dir, preset=preset, overwrite=overwrite)
+
+    return [level_filename for chunk in chunks for level_filename in chunk]
+
+
+def _pyramid_chunk(file_list, variables, factors, mask_filename, pyramid_dir, preset, overwrite):
+    """ Saves pyramid levels of a chunk of files, returns their filenames.
+    """
+
+    return [write_pyramid_level(filename, factor, variables=variables, mask_filename=mask_filename,
+                                pyramid_dir=pyramid_dir, preset=preset, overwrite=overwrite)
+            for filename in file_list for factor in factors]
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Summary statistics sidecars of ANHA files: per-level min, max, mean, count of valid values, and smallest
+    nonzero absolute value of each masked variable. Computed once (e.g. in a batch job), saved next to each file
+    as `<file name>.stats.json`, and then read instead of scanning data, e.g. for local color ranges of maps
+    and run-wide color ranges.
+
+    Example:
+        from anhalyze.core.summary_stats import build_summary_stats, get_run_stats
+        build_summary_stats(file_list, workers=8)
+        stats = get_run_stats(file_list, 'votemper', level=0)
+"""
+
+# System-related libraries
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset, get_default_mask_filename
+from anhalyze.core.anhalyze_run import map_chunks
+from anhalyze.core.anhalyze_utils import atomic_write, get_grid_variables
+from anhalyze.core.blocks import iter_masked_blocks
+from anhalyze.core.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Environment variable with an alternate directory for sidecars (e.g. read-only data directories).
+STATS_DIR_ENV = 'ANHALYZE_STATS_DIR'
+
+# Suffix of sidecar files, added to the data filename.
+SIDECAR_SUFFIX = '.stats.json'
+
+# Version of sidecar files, to be increased when their content changes.
+SIDECAR_VERSION = 2
+
+# Statistics of each level in sidecars.
+STATS_FIELDS = ('min', 'max', 'mean', 'count', 'nonzero_min')
+
+# Sidecars read, keyed by sidecar filename, with the source and mask files they were checked against.
+_SIDECAR_CACHE = {}
+_cache_lock = threading.Lock()
+
+
+def get_sidecar_path(filename, stats_dir=None):
+    """ Returns sidecar filename of an ANHA file, `<file name>.stats.json`, located in `stats_dir`,
+        the directory in environment variable `ANHALYZE_STATS_DIR`, or next to the file.
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        stats_dir : str, optional
+            Directory of sidecars.
+
+    """
+
+    if not stats_dir:
+        stats_dir = os.environ.get(STATS_DIR_ENV, os.path.dirname(os.path.realpath(filename)))
+
+    return os.path.join(stats_dir, os.path.basename(filename) + SIDECAR_SUFFIX)
+
+
+def compute_summary_stats(filename, variables=None, mask_filename=None):
+    """ Returns summary statistics of masked variables of a file, per level (depth), read in blocks
+        within the global memory limit (see `anhalyze.set_options`).
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        variables : list, optional
+            Variable names. [default: all variables on the horizontal grid]
+        mask_filename : str, optional
+            Mask filename.
+
+        Returns
+        -------
+        sidecar : dict
+            With source and mask file info (name, size, modification time), and for each variable: level dimension
+            (None for 2D variables), shape, and lists of per-level min, max, mean, count and nonzero_min (NaN as None).
+
+    """
+
+    ds = AnhaDataset(filename, mask_filename=mask_filename)
+    dim_z = ds.attrs.get('dim_z')
+
+    sidecar = {'version': SIDECAR_VERSION,
+               'source': _get_source(filename),
+               'mask': _get_source(ds._xr_dataset.attrs['mask_filename']),
+               'all_variables': variables is None,
+               'variables': {}}
+
+    if variables is None:
+        variables = get_grid_variables(ds)
+
+    for var in variables:
+        var_da = ds.data_vars[var]
+        level_dim = dim_z if dim_z in var_da.dims else None
+        n_levels = var_da.sizes[level_dim] if level_dim else 1
+
+        levels = {'min': np.full(n_levels, np.inf), 'max': np.full(n_levels, -np.inf), 'sum': np.zeros(n_levels),
+                  'count': np.zeros(n_levels, dtype=np.int64), 'nonzero_min': np.full(n_levels, np.inf)}
+
+        for block, block_da in iter_masked_blocks(ds, var):
+            block_data = block_da.values
+            index = block.get(level_dim, slice(None)) if level_dim else slice(None)
+
+            # Reducing all dimensions but the level one.
+            axes = tuple(axis for axis, dim in enumerate(block_da.dims) if dim != level_dim)
+            valid = np.isfinite(block_data)
+            nonzero = valid & (block_data != 0)
+
+            levels['min'][index] = np.minimum(levels['min'][index],
+                                              np.min(block_data, axis=axes, where=valid, initial=np.inf))
+            levels['max'][index] = np.maximum(levels['max'][index],
+                                              np.max(block_data, axis=axes, where=valid, initial=-np.inf))
+            levels['sum'][index] += np.sum(block_data, axis=axes, where=valid, dtype=np.float64)
+            levels['count'][index] += np.count_nonzero(valid, axis=axes)
+            levels['nonzero_min'][index] = np.minimum(levels['nonzero_min'][index],
+                                                      np.min(np.abs(block_data), axis=axes, where=nonzero,
+                                                             initial=np.inf))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            levels['mean'] = levels['sum'] / levels['count']
+
+        sidecar['variables'][var] = {'dim': level_dim, 'shape': list(var_da.shape),
+                                     **{field: _to_list(levels[field]) for field in STATS_FIELDS}}
+
+    return sidecar
+
+
+def write_summary_stats(filename, variables=None, mask_filename=None, stats_dir=None, overwrite=False):
+    """ Computes summary statistics of a file (see `compute_summary_stats`), and saves them as sidecar,
+        through a temporary file renamed at the end. Returns sidecar filename.
+        Up-to-date sidecars (same file and mask) with the requested variables are kept, unless overwrite is True.
+        Variables missing from an up-to-date sidecar are computed and added to it.
+    """
+
+    sidecar_path = get_sidecar_path(filename, stats_dir=stats_dir)
+
+    old_sidecar = None if overwrite else read_summary_stats(filename, stats_dir=stats_dir,
+                                                           mask_filename=mask_filename)
+    if old_sidecar is not None and (old_sidecar['all_variables'] if variables is None
+                                    else set(variables) <= set(old_sidecar['variables'])):
+        logger.debug('Summary stats up to date: %s', sidecar_path)
+        return sidecar_path
+
+    if old_sidecar is not None and variables is not None:
+        variables = [var for var in variables if var not in old_sidecar['variables']]
+    sidecar = compute_summary_stats(filename, variables=variables, mask_filename=mask_filename)
+    if old_sidecar is not None:
+        sidecar['all_variables'] |= old_sidecar['all_variables']
+        sidecar['variables'] = old_sidecar['variables'] | sidecar['variables']
+
+    with atomic_write(sidecar_path) as tmp_filename, open(tmp_filename, 'w') as f:
+        json.dump(sidecar, f)
+    with _cache_lock:
+        _SIDECAR_CACHE.pop(sidecar_path, None)
+
+    METRICS.increment('stats_sidecars_written')
+    logger.info('Saving summary stats: %s', sidecar_path)
+
+    return sidecar_path
+
+
+def build_summary_stats(file_list, variables=None, mask_filename=None, stats_dir=None, overwrite=False,
+                        workers=1, chunk_size=None):
+    """ Saves summary statistics sidecars of all files, in a process pool if workers > 1.
+        Data are read in blocks within the global memory limit (see `anhalyze.set_options`).
+
+        Parameters
+        ----------
+        file_list : list
+            List of filenames.
+        variables : list, optional
+            Variable names. [default: all variables on the horizontal grid]
+        mask_filename : str, optional
+            Mask filename.
+        stats_dir : str, optional
+            Directory of sidecars, see `get_sidecar_path`.
+        overwrite : bool, optional
+            If True, recomputes up-to-date sidecars. [default: False]
+        workers : int, optional
+            Number of worker processes. [default: 1]
+        chunk_size : int, optional
+            Number of files per worker task. [default: files split evenly between workers]
+
+        Returns
+        -------
+        sidecars : list
+            Sidecar filenames, in the order of file_list.
+
+    """
+
+    chunks = map_chunks(_stats_chunk, file_list, workers=workers, chunk_size=chunk_size, variables=variables,
+                         mask_filename=mask_filename, stats_dir=stats_dir, overwrite=overwrite)
+
+    return [sidecar_path for chunk in chunks for sidecar_path in chunk]
+
+
+def read_summary_stats(filename, stats_dir=None, mask_filename=None):
+    """ Returns sidecar of a file (see `compute_summary_stats`), None if missing, unreadable,
+        older than the file or computed with another mask (different name, size or modification time).
+        The mask is the default one of `AnhaDataset` if mask_filename is not given.
+    """
+
+    sidecar_path = get_sidecar_path(filename, stats_dir=stats_dir)
+
+    try:
+        source = (_get_source(filename), _get_source(mask_filename or get_default_mask_filename()))
+
+        with _cache_lock:
+            if sidecar_path in _SIDECAR_CACHE and _SIDECAR_CACHE[sidecar_path][0] == source:
+                return _SIDECAR_CACHE[sidecar_path][1]
+
+        with open(sidecar_path) as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if sidecar.get('version') != SIDECAR_VERSION or (sidecar['source'], sidecar['mask']) != source:
+        logger.debug('Summary stats out of date or with another mask: %s', sidecar_path)
+        return None
+
+    with _cache_lock:
+        _SIDECAR_CACHE[sidecar_path] = (source, sidecar)
+
+    return sidecar
+
+
+def get_summary_stats(filename, var, level=None, stats_dir=None, mask_filename=None):
+    """ Returns summary statistics of a variable from the sidecar of a file, without reading data.
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        var : str
+            Variable name.
+        level : int, optional
+            Level (depth) index. [default: all levels combined]
+        stats_dir : str, optional
+            Directory of sidecars, see `get_sidecar_path`.
+        mask_filename : str, optional
+            Mask filename, sidecars computed with another mask are not used. [default: default mask]
+
+        Returns
+        -------
+        stats : dict | None
+            Min, max, mean, count and nonzero_min (NaN if no valid values), None if not available.
+
+    """
+
+    sidecar = read_summary_stats(filename, stats_dir=stats_dir, mask_filename=mask_filename)
+    if sidecar is None or var not in sidecar['variables']:
+        METRICS.increment('stats_sidecar_misses')
+        return None
+
+    METRICS.increment('stats_sidecar_hits')
+    var_stats = sidecar['variables'][var]
+    levels = {field: np.array(var_stats[field], dtype=np.float64) for field in STATS_FIELDS}
+
+    if level is not None:
+        levels = {field: values[[level]] for field, values in levels.items()}
+
+    return _combine(levels)
+
+
+def get_run_stats(file_list, var, level=None, stats_dir=None, mask_filename=None):
+    """ Returns summary statistics of a variable over all files of a run, from their sidecars,
+        e.g. for a color range shared by all maps of a run. None if a sidecar is not available.
+        See `get_summary_stats` for parameters.
+    """
+
+    levels = {field: [] for field in STATS_FIELDS}
+    for filename in file_list:
+        stats = get_summary_stats(filename, var, level=level, stats_dir=stats_dir, mask_filename=mask_filename)
+        if stats is None:
+            return None
+        for field in STATS_FIELDS:
+            levels[field].append(stats[field])
+
+    return _combine({field: np.array(values, dtype=np.float64) for field, values in levels.items()})
+
+
+def _combine(levels):
+    """ Returns statistics combined over levels (or files).
+    """
+
+    count = np.nansum(levels['count'])
+    if not count:
+        return dict.fromkeys(STATS_FIELDS, np.nan) | {'count': 0}
+
+    # NaN (levels without valid values) ignored, without warnings.
+    return {'min': np.fmin.reduce(levels['min']),
+            'max': np.fmax.reduce(levels['max']),
+            'mean': np.nansum(levels['mean'] * levels['count']) / count,
+            'count': int(count),
+            'nonzero_min': np.fmin.reduce(levels['nonzero_min'])}
+
+
+def _get_source(filename):
+    """ Returns name, size and modification time of a file, identifying its content.
+    """
+
+    stat = os.stat(filename)
+
+    return {'filename': os.path.basename(filename), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _stats_chunk(file_list, variables, mask_filename, stats_dir, overwrite):
+    """ Saves sidecars of a chunk of files, returns their filenames.
+    """
+
+    return [write_summary_stats(filename, variables=variables, mask_filename=mask_filename, stats_dir=stats_dir,
+                                overwrite=overwrite) for filename in file_list]
+
+
+def _to_list(values):
+    """ Returns list of numbers, with NaN and infinite values (levels without valid values) as None, for JSON.
+    """
+
+    return [value.item() if np.isfinite(value) else None for value in values]
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Synthetic ANHA-shaped files, for tests and benchmarks without downloading model outputs.
+
+    Files follow ANHA/NEMO conventions: filename pattern, curvilinear `nav_lat`/`nav_lon` on a polar
+    stereographic grid containing the North Pole, depth levels stretched with depth, land points
+    filled with zeros, and a matching mask file with `tmask`, `umask` and `vmask`.
+
+    Example:
+        from anhalyze.core.synthetic import write_synthetic_run
+        files = write_synthetic_run('/tmp/anha', grids=['gridT', 'icemod'], n_files=12, size='small')
+        ds = ah.AnhaDataset(files['gridT'][0], mask_filename=files['mask'])
+"""
+
+# System-related libraries
+import os
+import numpy as np
+
+# Data-related libraries
+import xarray as xr
+
+# Project-related libraries
+from anhalyze.core.anhalyze_utils import atomic_write
+
+# Grid sizes as (ny, nx, nz). 'anha4' is the full ANHA4 domain.
+GRID_SIZES = {'tiny': (80, 56, 10),
+              'small': (200, 136, 25),
+              'medium': (400, 272, 50),
+              'anha4': (800, 544, 50)}
+
+# Model run used in filenames.
+MODEL_RUN = 'ANHA4-SYN001'
+
+# Days between outputs (5-day means).
+OUTPUT_PERIOD_DAYS = 5
+
+# Variables of each grid, as {grid: {var: (long_name, units, is_3d)}}, and depth dimension name.
+GRID_VARIABLES = {
+    'gridT': {'votemper': ('Temperature', 'degC', True),
+              'vosaline': ('Salinity', 'PSU', True),
+              'sossheig': ('Sea Surface Height', 'm', False),
+              'somxl010': ('Mixed Layer Depth 0.01 ref.10m', 'm', False)},
+    'gridU': {'vozocrtx': ('Zonal Current', 'm/s', True)},
+    'gridV': {'vomecrty': ('Meridional Current', 'm/s', True)},
+    'icemod': {'ileadfra': ('Ice concentration', '', False),
+               'iicethic': ('Ice thickness', 'm', False),
+               'iicevelu': ('Ice velocity along i-axis at I-point', 'm/s', False),
+               'iicevelv': ('Ice velocity along j-axis at I-point', 'm/s', False)},
+}
+DEPTH_DIMS = {'gridT': 'deptht', 'gridU': 'depthu', 'gridV': 'depthv'}
+DESCRIPTIONS = {'gridT': 'ocean T grid variables', 'gridU': 'ocean U grid variables',
+                'gridV': 'ocean V grid variables', 'icemod': 'ice variables'}
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def get_grid_size(size):
+    """ Returns (ny, nx, nz) given a name in `GRID_SIZES` or a tuple.
+    """
+
+    if isinstance(size, str):
+        assert size in GRID_SIZES, f'[Anhalyze] Grid size {size} not found in: {list(GRID_SIZES)}'
+        return GRID_SIZES[size]
+
+    assert len(size) == 3, '[Anhalyze] Grid size should be (ny, nx, nz).'
+    return tuple(size)
+
+
+def make_grid(ny, nx):
+    """ Returns curvilinear (lat, lon) [in degrees, float32] of a polar stereographic grid,
+        similar to ANHA4: from ~30N in the Atlantic/Pacific to the North Pole, centered at 60W.
+
+        Parameters
+        ----------
+        ny, nx : int
+            Grid size.
+
+    """
+
+    # Plane coordinates [in km], pole at 3/4 of the rows, half a cell away from any grid point.
+    x = np.linspace(-3500, 3500, nx) + 3500 / nx
+    y = np.linspace(-6000, 2000, ny) + 4000 / ny
+    xx, yy = np.meshgrid(x, y)
+
+    r = np.hypot(xx, yy)
+    lat = 90 - np.degrees(2 * np.arctan(r / (2 * EARTH_RADIUS_KM)))
+    lon = (np.degrees(np.arctan2(xx, yy)) - 60 + 180) % 360 - 180
+
+    return lat.astype('float32'), lon.astype('float32')
+
+
+def make_depth(nz):
+    """ Returns NEMO-like depth levels [in m, float32], stretched with depth: from ~1 m
+        (~5 m with 10 levels) to ~5000 m.
+    """
+
+    levels = np.arange(nz) + 0.5
+    depth = 5727.9 * (np.exp(6 * levels / nz) - 1) / (np.exp(6) - 1)
+
+    return depth.astype('float32')
+
+
+def make_bathymetry(lat, lon):
+    """ Returns bathymetry [in m], 0 on land: continents south of 55-65N and a Greenland-like island.
+    """
+
+    depth = 200 + 4800 * np.clip((lat - 40) / 30, 0, 1) * np.clip((90 - lat) / 10, 0.3, 1)
+
+    land = ((lon > -130) & (lon < -65) & (lat < 60 + 5 * np.sin(np.radians(lon) * 4))) \
+        | ((lon > -55) & (lon < -20) & (lat > 60) & (lat < 82)) \
+        | ((lon > 10) & (lon < 60) & (lat < 68))
+
+    return np.where(land, 0, depth).astype('float32')
+
+
+def make_mask_dataset(size='small'):
+    """ Returns mask `xarray.Dataset` with `tmask`, `umask` and `vmask` (t, z, y, x) for given grid size.
+    """
+
+    ny, nx, nz = get_grid_size(size)
+    lat, lon = make_grid(ny, nx)
+    bathymetry = make_bathymetry(lat, lon)
+
+    tmask = (make_depth(nz)[:, None, None] < bathymetry[None]).astype('int8')[None]
+
+    # u and v points are ocean if both neighbouring t points are ocean.
+    umask = tmask.copy()
+    umask[..., :-1] &= tmask[..., 1:]
+    vmask = tmask.copy()
+    vmask[..., :-1, :] &= tmask[..., 1:, :]
+
+    dims = ('t', 'z', 'y', 'x')
+    return xr.Dataset({'tmask': (dims, tmask), 'umask': (dims, umask), 'vmask': (dims, vmask)},
+                      coords={'nav_lat': (('y', 'x'), lat), 'nav_lon': (('y', 'x'), lon)})
+
+
+def make_anha_dataset(grid='gridT', date='1980-01-05', size='small', seed=None):
+    """ Returns synthetic ANHA `xarray.Dataset` for given grid and date.
+
+        Parameters
+        ----------
+        grid : str, optional
+            Grid type: 'gridT', 'gridU', 'gridV' or 'icemod'. [default: 'gridT']
+        date : str, optional
+            Date in filename (last day of output period). [default: '1980-01-05']
+        size : str | tuple, optional
+            Name in `GRID_SIZES`, or (ny, nx, nz). [default: 'small']
+        seed : int, optional
+            Random seed of noise. [default: from date]
+
+    """
+
+    assert grid in GRID_VARIABLES, f'[Anhalyze] Grid {grid} not found in: {list(GRID_VARIABLES)}'
+
+    ny, nx, nz = get_grid_size(size)
+    lat, lon = make_grid(ny, nx)
+    depth = make_depth(nz)
+    ocean = make_mask_dataset((ny, nx, nz))['tmask'].values[0].astype(bool)
+
+    date = np.datetime64(date, 'D')
+    day_of_year = (date - date.astype('datetime64[Y]')).astype(int)
+    season = np.cos(2 * np.pi * (day_of_year - 220) / 365)
+    rng = np.random.default_rng(int(day_of_year) if seed is None else seed)
+
+    # Time at the middle of the output period.
+    time_counter = np.array([date - np.timedelta64(OUTPUT_PERIOD_DAYS // 2, 'D')], dtype='datetime64[ns]')
+    depth_dim = DEPTH_DIMS.get(grid)
+
+    data_vars = {}
+    for var, (long_name, units, is_3d) in GRID_VARIABLES[grid].items():
+        var_data = _make_var_data(var, lat, depth if is_3d else depth[:1], season, rng)
+        var_ocean = ocean if is_3d else ocean[:1]
+        var_data = np.where(var_ocean, var_data, 0).astype('float32')
+
+        if is_3d:
+            dims = ('time_counter', depth_dim, 'y', 'x')
+            var_data = var_data[None]
+        else:
+            dims = ('time_counter', 'y', 'x')
+            var_data = var_data[None, 0]
+
+        data_vars[var] = (dims, var_data, {'long_name': long_name, 'units': units})
+
+    coords = {'nav_lat': (('y', 'x'), lat, {'units': 'degrees_north'}),
+              'nav_lon': (('y', 'x'), lon, {'units': 'degrees_east'}),
+              'time_counter': ('time_counter', time_counter)}
+    if depth_dim:
+        coords[depth_dim] = (depth_dim, depth, {'units': 'm', 'positive': 'down'})
+        data_vars[f'{depth_dim}_bounds'] = ((depth_dim, 'axis_nbounds'),
+                                            np.stack([np.r_[0, depth[:-1]], depth], axis=1))
+
+    return xr.Dataset(data_vars, coords=coords,
+                      attrs={'name': f'{MODEL_RUN}_{grid}', 'description': DESCRIPTIONS[grid],
+                             'title': DESCRIPTIONS[grid], 'Conventions': 'CF-1.6',
+                             'source': 'anhalyze.core.synthetic'})
+
+
+def write_synthetic_run(path, grids=('gridT',), n_files=1, start='1980-01-05', size='small',
+                        model_run=MODEL_RUN, complevel=1, overwrite=False):
+    """ Writes synthetic ANHA files of a run, and the matching mask file.
+
+        Parameters
+        ----------
+        path : str
+            Output directory.
+        grids : list, optional
+            Grid types, see `GRID_VARIABLES`. [default: ('gridT',)]
+        n_files : int, optional
+            Number of files (outputs every 5 days) for each grid. [default: 1]
+        start : str, optional
+            Date of first file. [default: '1980-01-05']
+        size : str | tuple, optional
+            Name in `GRID_SIZES`, or (ny, nx, nz). [default: 'small']
+        model_run : str, optional
+            Model run in filenames. [default: 'ANHA4-SYN001']
+        complevel : int, optional
+            zlib compression level, 0 for no compression. [default: 1]
+        overwrite : bool, optional
+            If False, existing files are kept. [default: False]
+
+        Returns
+        -------
+        files : dict
+            Filenames, as {'mask': mask_filename, grid: [filenames]}.
+
+    """
+
+    os.makedirs(path, exist_ok=True)
+    ny, nx, nz = get_grid_size(size)
+
+    files = {'mask': os.path.join(path, f'{model_run.split("-")[0]}_mask_{ny}x{nx}x{nz}.nc')}
+    if overwrite or not os.path.isfile(files['mask']):
+        _write(make_mask_dataset((ny, nx, nz)), files['mask'], complevel)
+
+    dates = np.datetime64(start, 'D') + np.arange(n_files) * np.timedelta64(OUTPUT_PERIOD_DAYS, 'D')
+    for grid in grids:
+        files[grid] = []
+        for date in dates:
+            year, month, day = str(date).split('-')
+            filename = os.path.join(path, f'{model_run}_y{year}m{month}d{day}_{grid}.nc')
+            if overwrite or not os.path.isfile(filename):
+                _write(make_anha_dataset(grid, date, (ny, nx, nz)), filename, complevel)
+            files[grid].append(filename)
+
+    return files
+
+
+def _make_var_data(var, lat, depth, season, rng):
+    """ Returns smooth (z, y, x) field with noise, with realistic values for each variable.
+    """
+
+    lat = lat[None].astype('float64')
+    depth = depth[:, None, None].astype('float64')
+    noise = rng.normal(0, 1, (depth.shape[0],) + lat.shape[1:])
+    polar = np.clip((lat - 30) / 60, 0, 1)
+
+    if var == 'votemper':
+        surface = 20 - 21.8 * polar + 2 * season * (1 - polar)
+        return 2 + (surface - 2) * np.exp(-depth / 300) + 0.2 * noise
+    elif var == 'vosaline':
+        return 35 - 4 * polar * np.exp(-depth / 100) + 0.05 * noise
+    elif var == 'sossheig':
+        return 0.5 * np.cos(np.radians(lat) * 6) + 0.05 * noise
+    elif var == 'somxl010':
+        return 20 + 100 * polar * (1 - season) + 5 * np.abs(noise)
+    elif var in ['vozocrtx', 'vomecrty', 'iicevelu', 'iicevelv']:
+        return 0.2 * np.sin(np.radians(lat) * 8) * np.exp(-depth / 500) + 0.05 * noise
+    elif var == 'ileadfra':
+        return np.clip((lat - 70 - 8 * season) / 5, 0, 1) * np.ones_like(depth)
+    elif var == 'iicethic':
+        return 3 * np.clip((lat - 70 - 8 * season) / 10, 0, 1) * np.ones_like(depth)
+
+    return noise
+
+
+def _write(xr_dataset, filename, complevel=1):
+    """ Saves dataset, compressing float variables like model outputs, through a temporary file.
+    """
+
+    encoding = {var: {'zlib': True, 'complevel': complevel}
+                for var, var_da in xr_dataset.data_vars.items() if complevel and var_da.dtype.kind == 'f'}
+
+    with atomic_write(filename) as tmp_filename:
+        xr_dataset.to_netcdf(tmp_filename, encoding=encoding)
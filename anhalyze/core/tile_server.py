@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Local server of map tiles (XYZ, Web Mercator, 256x256 PNG) of ANHA variables, for interactive browsing
+    of a run (e.g. in QGIS or Leaflet). Tiles are rendered on demand without cartopy: each tile pixel is matched
+    to the nearest cell of the grid coarsened for its zoom level, colored with the `get_plot_config` colormaps,
+    and saved in an on-disk LRU tile cache, so that panning across a run reads tiles already rendered.
+
+    Example:
+        from anhalyze.core.tile_server import serve_tiles
+        serve_tiles(file_list, variables=['votemper'], port=8080)
+
+        # Tiles at http://localhost:8080/{var}/{date}/{z}/{x}/{y}.png, with date as in filenames (e.g. y1998m01d05),
+        # and run variables and dates at http://localhost:8080/index.json
+"""
+
+# System-related libraries
+import os
+import io
+import json
+import glob
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Project-related libraries
+import anhalyze.core.anhalyze_plot_utils as apu
+from anhalyze.core.anhalyze import AnhaDataset, get_date
+from anhalyze.core.anhalyze_colocation import EARTH_RADIUS_KM, GridIndex, get_cell_sizes
+from anhalyze.core.anhalyze_utils import atomic_write, get_grid_variables, parse_bytes
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.natural_earth import CACHE_DIR, CACHE_DIR_ENV
+from anhalyze.core.summary_stats import get_run_stats
+
+logger = logging.getLogger(__name__)
+
+# Environment variable with an alternate directory of cached tiles.
+TILE_CACHE_DIR_ENV = 'ANHALYZE_TILE_CACHE_DIR'
+
+# Tile size [in pixels].
+TILE_SIZE = 256
+
+# Version of cached tiles, to be increased when their rendering changes.
+TILE_CACHE_VERSION = 1
+
+# Default maximum size of the tile cache.
+DEFAULT_TILE_CACHE_SIZE = '1GB'
+
+# Number of coarsened fields, and of tile pixel lookups, kept in memory.
+FIELD_CACHE_SIZE = 16
+TILE_LOOKUP_CACHE_SIZE = 1024
+
+
+def get_tile_coords(z, x, y, size=TILE_SIZE):
+    """ Returns latitudes and longitudes of pixel centers of an XYZ tile (Web Mercator, y from the north).
+
+        Parameters
+        ----------
+        z, x, y : int
+            Zoom level, and tile column and row.
+        size : int, optional
+            Tile size. [in pixels, default: 256]
+
+        Returns
+        -------
+        lat, lon : ndarray
+            2D arrays (size x size) of pixel latitudes and longitudes. [in degrees]
+
+    """
+
+    n_tiles = 2 ** z
+    assert 0 <= x < n_tiles and 0 <= y < n_tiles, f'[Anhalyze] Tile {z}/{x}/{y} out of range.'
+
+    pixels = (np.arange(size) + 0.5) / size
+    lon = (x + pixels) / n_tiles * 360. - 180.
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1. - 2. * (y + pixels) / n_tiles))))
+
+    lon, lat = np.meshgrid(lon, lat)
+
+    return lat, lon
+
+
+def get_zoom_factor(cell_size, lat, z, size=TILE_SIZE):
+    """ Returns coarsening factor (power of 2) of a grid for a tile, so that grid cells are about
+        the size of tile pixels. 1 if the grid is not finer.
+
+        Parameters
+        ----------
+        cell_size : float
+            Typical grid cell size. [in km]
+        lat : float
+            Latitude of the tile center. [in degrees]
+        z : int
+            Zoom level.
+        size : int, optional
+            Tile size. [in pixels, default: 256]
+
+    """
+
+    pixel_size = 2 * np.pi * EARTH_RADIUS_KM * np.cos(np.radians(lat)) / (size * 2 ** z)
+
+    return 2 ** max(0, int(np.floor(np.log2(max(pixel_size / cell_size, 1.)))))
+
+
+def render_tile(values, cmap, cnorm, size=TILE_SIZE):
+    """ Returns PNG image of tile values, transparent where missing.
+
+        Parameters
+        ----------
+        values : ndarray
+            2D array (size x size) with tile values, NaN where missing.
+        cmap : matplotlib.colors.Colormap
+            Colormap, see `get_plot_config`.
+        cnorm : matplotlib.colors.Normalize
+            Color normalization, see `get_plot_config`.
+        size : int, optional
+            Tile size. [in pixels, default: 256]
+
+    """
+
+    from matplotlib import image
+
+    values = np.ma.masked_invalid(values)
+    rgba = cmap(cnorm(values), bytes=True)
+    rgba[np.ma.getmaskarray(values)] = 0
+
+    buffer = io.BytesIO()
+    image.imsave(buffer, rgba.reshape(size, size, 4), format='png')
+
+    return buffer.getvalue()
+
+
+class TileCache:
+    """ On-disk LRU cache of tiles, shared between server threads (and runs of the server).
+    When the cache is above its maximum size, the least recently used tiles are removed.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Directory of cached tiles.
+        [default: environment variable `ANHALYZE_TILE_CACHE_DIR`, or `~/.cache/anhalyze/tiles`]
+    max_size : int | str, optional
+        Maximum size of cached tiles, e.g. '1GB'. [default: '1GB']
+
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_TILE_CACHE_SIZE):
+        """ Initializing object, indexing tiles already cached from the oldest to the most recently used.
+        """
+
+        if cache_dir is None:
+            cache_dir = os.environ.get(TILE_CACHE_DIR_ENV,
+                                      os.path.join(os.environ.get(CACHE_DIR_ENV, CACHE_DIR), 'tiles'))
+
+        self.cache_dir = cache_dir
+        self.max_size = parse_bytes(max_size)
+
+        self._lock = threading.Lock()
+        self._tiles = OrderedDict()
+        self.size = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        tiles = [(os.stat(filename), filename) for filename in glob.glob(os.path.join(cache_dir, '*', '*.png'))]
+        for stat, filename in sorted(tiles, key=lambda tile: tile[0].st_mtime_ns):
+            self._tiles[os.path.basename(filename)[:-4]] = stat.st_size
+            self.size += stat.st_size
+
+        with self._lock:
+            self._evict()
+
+    def __repr__(self):
+        """ Return string representation of object
+        """
+
+        return f'[Anhalyze] TileCache: {len(self)} tiles, {self.size} bytes in {self.cache_dir}'
+
+    def __len__(self):
+        """ Returns number of cached tiles.
+        """
+
+        return len(self._tiles)
+
+    def get(self, key):
+        """ Returns cached tile, None if not cached.
+        """
+
+        with self._lock:
+            if key not in self._tiles:
+                return None
+            self._tiles.move_to_end(key)
+
+        filename = self._get_filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+            # Last use kept as modification time, for the order of tiles when the cache is indexed again.
+            os.utime(filename)
+        except OSError:
+            with self._lock:
+                self.size -= self._tiles.pop(key, 0)
+            return None
+
+        return data
+
+    def put(self, key, data):
+        """ Saves tile to cache, through a temporary file renamed at the end, and removes least recently used tiles
+            if above the maximum size.
+        """
+
+        filename = self._get_filename(key)
+        try:
+            with atomic_write(filename) as tmp_filename, open(tmp_filename, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning('Tile could not be saved to %s: %s', filename, e)
+            return
+
+        with self._lock:
+            self.size += len(data) - self._tiles.pop(key, 0)
+            self._tiles[key] = len(data)
+            self._evict()
+
+    def clear(self):
+        """ Removes all cached tiles.
+        """
+
+        with self._lock:
+            while self._tiles:
+                self._remove(*self._tiles.popitem())
+
+    def _evict(self):
+        """ Removes least recently used tiles while above the maximum size.
+        """
+
+        while self._tiles and self.size > self.max_size:
+            self._remove(*self._tiles.popitem(last=False))
+            METRICS.increment('tile_cache_evictions')
+
+    def _remove(self, key, nbytes):
+        """ Removes tile file.
+        """
+
+        self.size -= nbytes
+        try:
+            os.remove(self._get_filename(key))
+        except FileNotFoundError:
+            pass
+
+    def _get_filename(self, key):
+        """ Returns filename of tile, in a subdirectory named after the first key characters.
+        """
+
+        return os.path.join(self.cache_dir, key[:2], f'{key}.png')
+
+
+class TileSource:
+    """ Tiles of the variables of a run (one grid), rendered on demand for each date and cached.
+    Tiles show the top layer of 3D variables, with land and cells outside the domain transparent.
+
+    Parameters
+    ----------
+    file_list : list
+        List of filenames of a run, all on the same grid, one per date.
+    variables : list, optional
+        Variable names. [default: all variables on the horizontal grid]
+    mask_filename : str, optional
+        Mask filename.
+    color_range : str | list, optional
+        Color range either `default` limits, `local` data values or a two items list [vmin, vmax],
+        see `get_plot_config`. With `local`, the color range is found over all files from their summary stats
+        sidecars if available, otherwise from the first file. Kept for all dates. [default: 'default']
+    tile_cache : TileCache, optional
+        Tile cache. [default: `TileCache()`]
+
+    """
+
+    def __init__(self, file_list, variables=None, mask_filename=None, color_range='default', tile_cache=None):
+        """ Initializing object, reading grid coordinates from the first file.
+        """
+
+        assert file_list, '[Anhalyze] No files given for tiles.'
+
+        self.files = {get_date(filename): filename for filename in file_list}
+        self.mask_filename = mask_filename
+        self.color_range = color_range
+        self.tile_cache = tile_cache if tile_cache is not None else TileCache()
+
+        ds = AnhaDataset(file_list[0], mask_filename=mask_filename)
+        self.attrs = ds.attrs
+        if variables is None:
+            variables = get_grid_variables(ds)
+        self.variables = list(variables)
+
+        var_da = ds._get_map_data_array(self.variables[0])
+        self.lat = np.squeeze(var_da.coords[ds.attrs['coord_lat']].values)
+        self.lon = np.squeeze(var_da.coords[ds.attrs['coord_lon']].values)
+        self.cell_size = float(np.median(get_cell_sizes(self.lat, self.lon)))
+
+        self._lock = threading.Lock()
+        self._color_configs = {}
+        self._zoom_grids = {}
+        self._lookups = OrderedDict()
+        self._fields = OrderedDict()
+
+    def __repr__(self):
+        """ Return string representation of object
+        """
+
+        return f'[Anhalyze] TileSource: {len(self.files)} dates, variables {self.variables}'
+
+    def get_index(self):
+        """ Returns run variables and dates, and tile URL template.
+        """
+
+        return {'variables': self.variables, 'dates': sorted(self.files), 'grid': self.attrs['grid'],
+                'tiles': '/{var}/{date}/{z}/{x}/{y}.png'}
+
+    def get_tile(self, var, date, z, x, y):
+        """ Returns PNG image of a tile, from the tile cache or rendered.
+
+            Parameters
+            ----------
+            var : str
+                Variable name.
+            date : str
+                Date as in filenames, e.g. 'y1998m01d05'.
+            z, x, y : int
+                Zoom level, and tile column and row.
+
+        """
+
+        assert var in self.variables, f'[Anhalyze] Variable {var} not found in tile variables: {self.variables}'
+        assert date in self.files, f'[Anhalyze] Date {date} not found in tile dates.'
+
+        filename = self.files[date]
+        cmap, vrange, cnorm = self.get_color_config(var)
+
+        stat = os.stat(filename)
+        key = hashlib.sha1(repr((TILE_CACHE_VERSION, os.path.basename(filename), stat.st_size, stat.st_mtime_ns,
+                                 self.mask_filename and os.path.basename(self.mask_filename), var, cmap.name,
+                                 [float(v) for v in vrange], type(cnorm).__name__, z, x, y)).encode()).hexdigest()
+
+        data = self.tile_cache.get(key)
+        if data is not None:
+            METRICS.increment('tile_cache_hits')
+            return data
+
+        METRICS.increment('tile_cache_misses')
+        with METRICS.timer('tile_render_seconds'):
+            factor, row, col, valid = self._get_lookup(z, x, y)
+
+            values = np.full(valid.shape, np.nan)
+            if valid.any():
+                field = self._get_field(filename, var, factor)
+                values[valid] = field[row[valid], col[valid]]
+
+            data = render_tile(values, cmap, cnorm)
+
+        METRICS.increment('tiles_rendered')
+        self.tile_cache.put(key, data)
+
+        return data
+
+    def get_color_config(self, var):
+        """ Returns colormap, color range and normalization of a variable, found once for all dates.
+        """
+
+        with self._lock:
+            if var in self._color_configs:
+                return self._color_configs[var]
+
+        stats = None
+        if self.color_range == 'local':
+            stats = get_run_stats(list(self.files.values()), var, level=0, mask_filename=self.mask_filename)
+
+        var_data = None
+        if stats is None:
+            var_data = self._get_field(self.files[min(self.files)], var, 1)
+
+        color_config = apu.get_plot_config(var, var_data, grid=self.attrs['grid'], color_range=self.color_range,
+                                           stats=stats)
+
+        with self._lock:
+            self._color_configs[var] = color_config
+
+        return color_config
+
+    def _get_field(self, filename, var, factor):
+        """ Returns masked top layer of a variable, coarsened by factor, kept in memory for the next tiles.
+        """
+
+        key = (filename, var, factor)
+        with self._lock:
+            if key in self._fields:
+                self._fields.move_to_end(key)
+                return self._fields[key]
+
+        if factor > 1:
+            field = apu.coarsen_data(self._get_field(filename, var, 1), factor)
+        else:
+            ds = AnhaDataset(filename, mask_filename=self.mask_filename)
+            field = np.squeeze(ds._get_map_data_array(var).values).astype(np.float64)
+
+        with self._lock:
+            self._fields[key] = field
+            while len(self._fields) > FIELD_CACHE_SIZE:
+                self._fields.popitem(last=False)
+
+        return field
+
+    def _get_zoom_grid(self, factor):
+        """ Returns spatial index and cell sizes of the grid coarsened by factor.
+        """
+
+        with self._lock:
+            if factor in self._zoom_grids:
+                return self._zoom_grids[factor]
+
+        lon, lat = apu.coarsen_coords(self.lon, self.lat, factor, geographic=True)
+        zoom_grid = (GridIndex(lat, lon), get_cell_sizes(lat, lon))
+
+        with self._lock:
+            self._zoom_grids[factor] = zoom_grid
+
+        return zoom_grid
+
+    def _get_lookup(self, z, x, y):
+        """ Returns coarsening factor of a tile, and nearest grid cell (row, col) of each pixel,
+            valid if within a cell size (i.e. not outside the domain). Shared by all variables and dates.
+        """
+
+        with self._lock:
+            if (z, x, y) in self._lookups:
+                self._lookups.move_to_end((z, x, y))
+                return self._lookups[(z, x, y)]
+
+        lat, lon = get_tile_coords(z, x, y)
+        factor = get_zoom_factor(self.cell_size, lat[TILE_SIZE // 2, 0], z)
+
+        grid_index, cell_sizes = self._get_zoom_grid(factor)
+        row, col, distance = grid_index.query(lat, lon)
+        lookup = (factor, row, col, distance <= cell_sizes[row, col])
+
+        with self._lock:
+            self._lookups[(z, x, y)] = lookup
+            while len(self._lookups) > TILE_LOOKUP_CACHE_SIZE:
+                self._lookups.popitem(last=False)
+
+        return lookup
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """ Handler of tile requests `/{var}/{date}/{z}/{x}/{y}.png`, and of `/index.json`.
+    """
+
+    def do_GET(self):
+        """ Sends tile, or run index.
+        """
+
+        source = self.server.tile_source
+        parts = self.path.split('?')[0].strip('/').split('/')
+
+        if parts == ['index.json']:
+            return self._send(200, 'application/json', json.dumps(source.get_index()).encode())
+
+        if len(parts) != 5 or not parts[4].endswith('.png'):
+            return self._send(404, 'text/plain', b'Not found, tiles are /{var}/{date}/{z}/{x}/{y}.png')
+
+        var, date = parts[:2]
+        if var not in source.variables or date not in source.files:
+            return self._send(404, 'text/plain', f'Variable {var} or date {date} not found.'.encode())
+
+        try:
+            z, x, y = int(parts[2]), int(parts[3]), int(parts[4][:-4])
+            assert 0 <= x < 2 ** z and 0 <= y < 2 ** z
+        except (ValueError, AssertionError):
+            return self._send(400, 'text/plain', f'Invalid tile {"/".join(parts[2:])}.'.encode())
+
+        try:
+            data = source.get_tile(var, date, z, x, y)
+        except Exception as e:
+            logger.exception('Tile %s could not be rendered: %s', self.path, e)
+            return self._send(500, 'text/plain', str(e).encode())
+
+        self._send(200, 'image/png', data)
+
+    def log_message(self, format, *args):
+        """ Requests logged as debug messages.
+        """
+
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+    def _send(self, status, content_type, body):
+        """ Sends response.
+        """
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_tile_server(file_list, variables=None, mask_filename=None, color_range='default', host='127.0.0.1',
+                     port=8080, cache_dir=None, cache_size=DEFAULT_TILE_CACHE_SIZE):
+    """ Returns HTTP server of tiles of a run (not started), see `serve_tiles` for parameters.
+    """
+
+    server = ThreadingHTTPServer((host, port), TileRequestHandler)
+    server.tile_source = TileSource(file_list, variables=variables, mask_filename=mask_filename,
+                                    color_range=color_range, tile_cache=TileCache(cache_dir, max_size=cache_size))
+
+    return server
+
+
+def serve_tiles(file_list, variables=None, mask_filename=None, color_range='default', host='127.0.0.1', port=8080,
+                cache_dir=None, cache_size=DEFAULT_TILE_CACHE_SIZE):
+    """ Serves tiles of a run at `http://<host>:<port>/{var}/{date}/{z}/{x}/{y}.png`, until interrupted.
+
+        Parameters
+        ----------
+        file_list : list
+            List of filenames of a run, all on the same grid, one per date.
+        variables : list, optional
+            Variable names. [default: all variables on the horizontal grid]
+        mask_filename : str, optional
+            Mask filename.
+        color_range : str | list, optional
+            Color range, see `TileSource`. [default: 'default']
+        host : str, optional
+            Server address. [default: '127.0.0.1']
+        port : int, optional
+            Server port. [default: 8080]
+        cache_dir : str, optional
+            Directory of cached tiles, see `TileCache`.
+        cache_size : int | str, optional
+            Maximum size of cached tiles, e.g. '1GB'. [default: '1GB']
+
+    """
+
+    server = make_tile_server(file_list, variables=variables, mask_filename=mask_filename, color_range=color_range,
+                              host=host, port=port, cache_dir=cache_dir, cache_size=cache_size)
+    host, port = server.server_address[:2]
+
+    logger.info('Serving tiles of %s dates at http://%s:%s/{var}/{date}/{z}/{x}/{y}.png (index at /index.json)',
+                len(server.tile_source.files), host, port)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
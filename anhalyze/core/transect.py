@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Vertical sections along arbitrary transects: great-circle segments between waypoints, sampled at about
+    the grid spacing. Grid cells and bilinear interpolation weights of the transect points are computed once per
+    (grid, waypoints), kept as a sparse matrix, so sections of any variable and time step are a sparse
+    matrix product of each block of depth levels.
+
+    Example:
+        from anhalyze.core.anhalyze_plot_utils import show_section
+        from anhalyze.core.transect import get_section
+
+        ds = ah.AnhaDataset(filename)
+        section = get_section(ds, 'votemper', waypoints=[(66.5, -62), (64, -52)])
+        show_section(section, savefig='davis_strait_votemper.png')
+"""
+
+# System-related libraries
+import hashlib
+import numpy as np
+
+# Data-related libraries
+import xarray as xr
+from scipy import sparse
+
+# Project-related libraries
+from anhalyze.core.anhalyze_colocation import EARTH_RADIUS_KM, get_cell_sizes, get_grid_index, lat_lon_to_xyz
+from anhalyze.core.blocks import iter_masked_blocks
+from anhalyze.core.metrics import METRICS
+
+# Cache of transects, keyed by a hash of the grid coordinates, waypoints and spacing.
+# Oldest transects are removed above `TRANSECT_CACHE_SIZE`.
+_TRANSECT_CACHE = {}
+TRANSECT_CACHE_SIZE = 16
+
+# Tolerance of bilinear coordinates of points on cell edges.
+BILINEAR_TOLERANCE = 1e-6
+
+# Newton iterations of inverse bilinear interpolation, converging in a few iterations on ocean grids.
+BILINEAR_ITERATIONS = 8
+
+
+class Transect:
+    """ Points along great-circle segments between waypoints, with bilinear interpolation weights
+    of the grid cells around them.
+
+    Parameters
+    ----------
+    lat : ndarray
+        2D array with grid latitudes (e.g. `nav_lat`). [in degrees]
+    lon : ndarray
+        2D array with grid longitudes (e.g. `nav_lon`). [in degrees]
+    waypoints : list
+        List of (lat, lon) waypoints, at least 2. [in degrees]
+    spacing : float, optional
+        Distance between transect points. [in km, default: grid cell size around the waypoints]
+
+    Attributes
+    ----------
+    lat, lon : ndarray
+        Transect points. [in degrees]
+    distance : ndarray
+        Distance of transect points from the first waypoint. [in km]
+    waypoint_distance : ndarray
+        Distance of waypoints from the first waypoint. [in km]
+    cells : ndarray
+        Grid cells used by the transect, flattened in C order.
+    window : tuple
+        Row and column slices of the smallest part of the grid with all cells used.
+    weights : scipy.sparse.csr_matrix
+        Interpolation weights (points x cells), rows without weights for points outside the grid.
+
+    """
+
+    def __init__(self, lat, lon, waypoints, spacing=None):
+        """ Initializing object.
+        """
+
+        waypoints = np.asarray(waypoints, dtype=np.float64)
+        assert waypoints.ndim == 2 and waypoints.shape[0] >= 2 and waypoints.shape[1] == 2, \
+            '[Anhalyze] Waypoints should be a list of at least 2 (lat, lon) pairs.'
+
+        self.shape = np.shape(lat)
+        grid_index = get_grid_index(lat, lon)
+
+        if spacing is None:
+            rows, cols, _ = grid_index.query(waypoints[:, 0], waypoints[:, 1])
+            spacing = float(np.median(get_cell_sizes(lat, lon)[rows, cols]))
+        assert spacing > 0, f'[Anhalyze] Transect spacing {spacing} should be > 0.'
+
+        self.lat, self.lon, self.distance, self.waypoint_distance = get_great_circle_points(waypoints, spacing)
+        weights = get_bilinear_weights(lat, lon, self.lat, self.lon, grid_index=grid_index)
+
+        # Only cells around the transect are read from data, from the whole grid or the window around them.
+        self.cells = np.unique(weights.indices)
+        self.weights = weights[:, self.cells].tocsr()
+        assert self.cells.size, '[Anhalyze] Transect is outside the grid.'
+
+        rows, cols = np.unravel_index(self.cells, self.shape)
+        self.window = (slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1))
+        self._window_shape = (rows.max() + 1 - rows.min(), cols.max() + 1 - cols.min())
+        self._window_cells = np.ravel_multi_index((rows - rows.min(), cols - cols.min()), self._window_shape)
+
+    def interp(self, var_data):
+        """ Returns values at transect points of gridded data, with a single sparse matrix product for all
+            leading dimensions (e.g. depth levels). Weights are renormalized over valid (wet) cells,
+            points with less than half of their weight on valid cells are NaN.
+
+            Parameters
+            ----------
+            var_data : ndarray
+                Data with the grid, or its window (see `Transect.window`), as last two dimensions,
+                NaN where masked.
+
+            Returns
+            -------
+            values : ndarray
+                Values with dimensions (..., points).
+
+        """
+
+        var_data = np.asarray(var_data)
+        assert var_data.shape[-2:] in [self.shape, self._window_shape], \
+            f'[Anhalyze] Data grid {var_data.shape[-2:]} does not match transect grid {self.shape}.'
+
+        cells = self.cells if var_data.shape[-2:] == self.shape else self._window_cells
+        leading_shape = var_data.shape[:-2]
+        columns = var_data.reshape(leading_shape + (-1,))[..., cells].reshape(-1, len(cells)).T
+        valid = np.isfinite(columns)
+        n_columns = columns.shape[1]
+
+        # Weighted sums of values and of valid cells, in one product.
+        sums = self.weights @ np.hstack([np.where(valid, columns, 0.), valid]).astype(np.float64)
+        values, valid_weights = sums[:, :n_columns], sums[:, n_columns:]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(valid_weights >= 0.5, values / valid_weights, np.nan)
+
+        return values.T.reshape(leading_shape + (self.weights.shape[0],))
+
+
+def get_transect(lat, lon, waypoints, spacing=None):
+    """ Returns cached `Transect` for given grid coordinates and waypoints,
+        computing interpolation weights only the first time they are seen.
+        See `Transect` for parameters.
+    """
+
+    lat = np.ascontiguousarray(lat)
+    lon = np.ascontiguousarray(lon)
+    waypoints = np.ascontiguousarray(waypoints, dtype=np.float64)
+
+    key = hashlib.sha1(lat.tobytes() + lon.tobytes() + waypoints.tobytes() + repr(spacing).encode()).hexdigest()
+    if key in _TRANSECT_CACHE:
+        METRICS.increment('transect_hits')
+        return _TRANSECT_CACHE[key]
+
+    METRICS.increment('transect_misses')
+    transect = Transect(lat, lon, waypoints, spacing=spacing)
+
+    # Oldest transects removed first.
+    if len(_TRANSECT_CACHE) >= TRANSECT_CACHE_SIZE:
+        _TRANSECT_CACHE.pop(next(iter(_TRANSECT_CACHE)))
+    _TRANSECT_CACHE[key] = transect
+
+    return transect
+
+
+def get_great_circle_points(waypoints, spacing):
+    """ Returns points along great-circle segments between waypoints, evenly spaced on each segment
+        at no more than spacing, waypoints included.
+
+        Parameters
+        ----------
+        waypoints : ndarray
+            Array of (lat, lon) waypoints. [in degrees]
+        spacing : float
+            Maximum distance between points. [in km]
+
+        Returns
+        -------
+        lat, lon : ndarray
+            Points. [in degrees]
+        distance : ndarray
+            Distance of points from the first waypoint. [in km]
+        waypoint_distance : ndarray
+            Distance of waypoints from the first waypoint. [in km]
+
+    """
+
+    xyz = lat_lon_to_xyz(waypoints[:, 0], waypoints[:, 1])
+
+    points, distances, waypoint_distance = [xyz[:1]], [np.zeros(1)], [0.]
+    for start, end in zip(xyz[:-1], xyz[1:]):
+        angle = np.arccos(np.clip(np.dot(start, end), -1, 1))
+        n_steps = max(1, int(np.ceil(angle * EARTH_RADIUS_KM / spacing)))
+        fractions = np.arange(1, n_steps + 1) / n_steps
+
+        # Spherical linear interpolation, segments between identical waypoints are single points.
+        if angle > 0:
+            segment = (np.sin((1 - fractions) * angle)[:, np.newaxis] * start
+                       + np.sin(fractions * angle)[:, np.newaxis] * end) / np.sin(angle)
+        else:
+            segment = np.repeat(end[np.newaxis], n_steps, axis=0)
+
+        points.append(segment)
+        distances.append(waypoint_distance[-1] + fractions * angle * EARTH_RADIUS_KM)
+        waypoint_distance.append(distances[-1][-1])
+
+    points = np.concatenate(points)
+    lat = np.rad2deg(np.arcsin(np.clip(points[:, 2], -1, 1)))
+    lon = np.rad2deg(np.arctan2(points[:, 1], points[:, 0]))
+
+    return lat, lon, np.concatenate(distances), np.array(waypoint_distance)
+
+
+def get_bilinear_weights(lat, lon, point_lat, point_lon, grid_index=None):
+    """ Returns sparse matrix of bilinear interpolation weights of points on a curvilinear grid.
+        The cell around each point is searched among the 4 cells sharing the nearest grid point,
+        with bilinear coordinates found by Newton iterations on the plane tangent at the point.
+        Points in no cell (e.g. along the grid edges) use their nearest grid point if within
+        a cell size, points farther from the grid have no weights.
+
+        Parameters
+        ----------
+        lat, lon : ndarray
+            2D arrays with grid latitudes and longitudes. [in degrees]
+        point_lat, point_lon : ndarray
+            Points. [in degrees]
+        grid_index : GridIndex, optional
+            Spatial index of the grid. [default: see `get_grid_index`]
+
+        Returns
+        -------
+        weights : scipy.sparse.csr_matrix
+            Weights (points x grid cells), grid cells flattened in C order.
+
+    """
+
+    if grid_index is None:
+        grid_index = get_grid_index(lat, lon)
+
+    ny, nx = np.shape(lat)
+    n_points = len(point_lat)
+    rows, cols, distance = grid_index.query(point_lat, point_lon)
+
+    grid_xyz = lat_lon_to_xyz(lat, lon)
+    fill = (lat == 0) & (lon == 0)
+    point_xyz = lat_lon_to_xyz(point_lat, point_lon)
+    east, north = _get_tangent_basis(point_lat, point_lon)
+
+    found = np.zeros(n_points, dtype=bool)
+    weights = np.zeros((n_points, 4))
+    corners = np.zeros((n_points, 4), dtype=np.int64)
+
+    for row_offset, col_offset in [(0, 0), (-1, 0), (0, -1), (-1, -1)]:
+        row0, col0 = rows + row_offset, cols + col_offset
+        inside = ~found & (row0 >= 0) & (row0 < ny - 1) & (col0 >= 0) & (col0 < nx - 1)
+        row0, col0 = np.clip(row0, 0, ny - 2), np.clip(col0, 0, nx - 2)
+
+        # Corners A, B (next x), C (next y), D, on the tangent plane (gnomonic projection) around each point.
+        corner_index = [(row0, col0), (row0, col0 + 1), (row0 + 1, col0), (row0 + 1, col0 + 1)]
+        plane = []
+        for row, col in corner_index:
+            xyz = grid_xyz[row, col]
+            dot = np.sum(xyz * point_xyz, axis=-1)
+            inside &= (dot > 0) & ~fill[row, col]
+            xyz = xyz / np.where(dot > 0, dot, 1)[:, np.newaxis] - point_xyz
+            plane.append(np.stack([np.sum(xyz * east, axis=-1), np.sum(xyz * north, axis=-1)], axis=-1))
+
+        s, t = _inverse_bilinear(*plane)
+        inside &= (s >= -BILINEAR_TOLERANCE) & (s <= 1 + BILINEAR_TOLERANCE)
+        inside &= (t >= -BILINEAR_TOLERANCE) & (t <= 1 + BILINEAR_TOLERANCE)
+
+        s, t = np.clip(s, 0, 1), np.clip(t, 0, 1)
+        weights[inside] = np.stack([(1 - s) * (1 - t), s * (1 - t), (1 - s) * t, s * t], axis=-1)[inside]
+        corners[inside] = np.stack([row * nx + col for row, col in corner_index], axis=-1)[inside]
+        found |= inside
+
+    # Nearest grid point of points in no cell, if close enough.
+    nearest = ~found & (distance <= get_cell_sizes(lat, lon)[rows, cols])
+    weights[nearest] = [1., 0., 0., 0.]
+    corners[nearest, 0] = rows[nearest] * nx + cols[nearest]
+
+    point_index = np.repeat(np.arange(n_points), 4)
+    weights, corners = weights.ravel(), corners.ravel()
+    keep = weights > 0
+
+    return sparse.csr_matrix((weights[keep], (point_index[keep], corners[keep])), shape=(n_points, ny * nx))
+
+
+def get_section(ds, var, waypoints, spacing=None, time_index=0, memory_limit=None):
+    """ Returns vertical section (or 1D transect of 2D variables) of a masked variable along waypoints,
+        read in blocks within the memory limit (see `anhalyze.set_options`).
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset, whole grid or region containing the transect (see `AnhaDataset.sel`).
+        var : str
+            Variable name.
+        waypoints : list
+            List of (lat, lon) waypoints, joined by great circles. [in degrees]
+        spacing : float, optional
+            Distance between transect points. [in km, default: grid cell size around the waypoints]
+        time_index : int, optional
+            Time step. [default: 0]
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+        Returns
+        -------
+        section : xarray.DataArray
+            Values with dimensions (depth, distance), or (distance), with transect points coordinates
+            `lat` and `lon`, waypoint distances in `distance` attribute `waypoint_distance`, and grid name in
+            attribute `grid`.
+
+    """
+
+    var_da = ds.data_vars[var]
+    dim_z = ds.attrs.get('dim_z')
+
+    transect = get_transect(ds.coords[ds.attrs['coord_lat']].values, ds.coords[ds.attrs['coord_lon']].values,
+                            waypoints, spacing=spacing)
+
+    # Only the window of the grid around the transect is read.
+    indexers = {ds.attrs['dim_y']: transect.window[0], ds.attrs['dim_x']: transect.window[1]}
+    if 'time_counter' in var_da.dims:
+        indexers['time_counter'] = time_index
+    has_depth = dim_z in var_da.dims
+    section = np.full((var_da.sizes[dim_z] if has_depth else 1, transect.weights.shape[0]), np.nan)
+
+    for block, block_da in iter_masked_blocks(ds, var, indexers=indexers, memory_limit=memory_limit):
+        section[block.get(dim_z, slice(None))] = transect.interp(block_da.values).reshape(-1, section.shape[1])
+
+    attrs = dict(var_da.attrs) | {'grid': ds.attrs['grid']}
+    coords = {'distance': ('distance', transect.distance,
+                           {'units': 'km', 'waypoint_distance': transect.waypoint_distance}),
+              'lat': ('distance', transect.lat, {'units': 'degrees_north'}),
+              'lon': ('distance', transect.lon, {'units': 'degrees_east'})}
+
+    if not has_depth:
+        return xr.DataArray(section[0], dims=('distance',), coords=coords, name=var, attrs=attrs)
+
+    depth_da = ds._xr_dataset[dim_z]
+    coords['depth'] = ('depth', depth_da.values, depth_da.attrs)
+
+    return xr.DataArray(section, dims=('depth', 'distance'), coords=coords, name=var, attrs=attrs)
+
+
+def _get_tangent_basis(lat, lon):
+    """ Returns unit vectors pointing east and north, at lat-lon points.
+    """
+
+    lat = np.deg2rad(np.asarray(lat, dtype=float))
+    lon = np.deg2rad(np.asarray(lon, dtype=float))
+
+    east = np.stack([-np.sin(lon), np.cos(lon), np.zeros_like(lon)], axis=-1)
+    north = np.stack([-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)], axis=-1)
+
+    return east, north
+
+
+def _inverse_bilinear(a, b, c, d):
+    """ Returns bilinear coordinates (s, t) of the origin in quadrilaterals with corners a, b, c, d
+        ((s, t) = (0, 0), (1, 0), (0, 1), (1, 1)), NaN if iterations don't converge.
+    """
+
+    s, t = np.full(len(a), 0.5), np.full(len(a), 0.5)
+    e, f, g = b - a, c - a, a - b - c + d
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        for _ in range(BILINEAR_ITERATIONS):
+            residual = a + s[:, np.newaxis] * e + t[:, np.newaxis] * f + (s * t)[:, np.newaxis] * g
+            ds_ = e + t[:, np.newaxis] * g
+            dt_ = f + s[:, np.newaxis] * g
+            det = ds_[:, 0] * dt_[:, 1] - ds_[:, 1] * dt_[:, 0]
+            s = s - (residual[:, 0] * dt_[:, 1] - residual[:, 1] * dt_[:, 0]) / det
+            t = t - (ds_[:, 0] * residual[:, 1] - ds_[:, 1] * residual[:, 0]) / det
+
+        residual = a + s[:, np.newaxis] * e + t[:, np.newaxis] * f + (s * t)[:, np.newaxis] * g
+        converged = np.linalg.norm(residual, axis=-1) <= BILINEAR_TOLERANCE * np.linalg.norm(e, axis=-1)
+
+    return np.where(converged, s, np.nan), np.where(converged, t, np.nan)
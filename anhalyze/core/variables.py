@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Variable identity table. Used for plotting (`get_plot_config`) and
+# for trimming precision on export (`AnhaDataset.to_netcdf`).
+#   cmap: Colormap name, 'cmo.*' for cmocean colormaps, otherwise matplotlib.
+#   vrange: Physical based color range [vmin, vmax].
+#   divergent: If True, color range is centered at zero.
+#   log: If True, logarithmic color scale.
+#   tolerance: Absolute tolerance kept when trimming precision. [in var units]
+#   keepbits: Mantissa bits kept when trimming precision (relative precision).
+VARIABLES = {
+    'votemper': {'cmap': 'cmo.thermal', 'vrange': [-2, 30], 'tolerance': 1e-3},  # Temperature [degC]
+    'vosaline': {'cmap': 'cmo.haline', 'vrange': [25, 38], 'tolerance': 1e-3},  # Salinity [PSU]
+    'ileadfra': {'cmap': 'cmo.ice', 'vrange': [0, 1], 'tolerance': 1e-3},  # Sea ice concentration
+    'chl': {'cmap': 'cmo.algae', 'vrange': [10, 1000], 'log': True, 'keepbits': 7},  # Chlorophyll
+    'iicevelu': {'cmap': 'cmo.balance', 'vrange': [-1.5, 1.5], 'divergent': True, 'tolerance': 1e-4},
+    'iicevelv': {'cmap': 'cmo.balance', 'vrange': [-1.5, 1.5], 'divergent': True, 'tolerance': 1e-4},
+}
+
+# Grid defaults, used for variables not found in `VARIABLES`.
+GRIDS = {
+    'gridU': {'cmap': 'cmo.balance', 'vrange': [-1.5, 1.5], 'divergent': True, 'tolerance': 1e-4},
+    'gridV': {'cmap': 'cmo.balance', 'vrange': [-1.5, 1.5], 'divergent': True, 'tolerance': 1e-4},
+    'icebergs': {'cmap': 'cmo.thermal', 'vrange': [0.00000001, 0.001], 'log': True, 'keepbits': 7},
+}
+
+# Default for any other variable, color range from data and precision not trimmed.
+DEFAULT = {'cmap': 'spring', 'vrange': None}
+
+
+def get_var_info(var, grid=None):
+    """ Returns identity information for given variable, from `VARIABLES`, `GRIDS` or `DEFAULT`.
+
+        Parameters
+        ----------
+        var : str
+            Variable name.
+        grid : str, optional
+            Grid name stored in AnhaDataset.attrs['grid']
+
+        Returns
+        -------
+        var_info : dict
+            Dict with keys: cmap, vrange, divergent, log, tolerance, keepbits.
+
+    """
+
+    if var in VARIABLES:
+        var_info = VARIABLES[var]
+    elif grid in GRIDS:
+        var_info = GRIDS[grid]
+    else:
+        var_info = DEFAULT
+
+    # Filling missing keys, and copying vrange so table is not modified by users.
+    var_info = {'divergent': False, 'log': False, 'tolerance': None, 'keepbits': None} | var_info
+    if var_info['vrange']:
+        var_info['vrange'] = list(var_info['vrange'])
+
+    return var_info
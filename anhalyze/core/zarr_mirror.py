@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Zarr mirror of a run (one grid): variables copied once into a compressed Zarr store chunked along time,
+    so time series and climatologies of a point or small region read a few chunks instead of thousands of files.
+    Run-level functions (`get_timeseries`, `get_climatology`) read from the mirror when it is up to date
+    with the files (same size and modification time), and from the files otherwise.
+
+    Example:
+        from anhalyze.core.zarr_mirror import build_zarr_mirror
+        build_zarr_mirror(file_list, variables=['votemper'], workers=8)
+
+        timeseries = get_timeseries(file_list, var='votemper', lat_range=[51, 54.7], lon_range=[-82.5, -78.5])
+"""
+
+# System-related libraries
+import os
+import logging
+import warnings
+import numpy as np
+
+# Data-related libraries
+import xarray as xr
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset, get_date
+from anhalyze.core.anhalyze_colocation import get_file_time
+from anhalyze.core.anhalyze_run import map_chunks
+from anhalyze.core.blocks import BLOCK_MEMORY_FACTOR, get_blocks
+from anhalyze.core.file_pool import open_dataset
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.options import OPTIONS
+
+logger = logging.getLogger(__name__)
+
+# Default chunks of a mirror: one year of 5-day outputs, all depths, and small horizontal tiles.
+TIME_CHUNK = 73
+SPATIAL_CHUNK = (32, 32)
+
+# Environment variable with an alternate directory for mirrors.
+MIRROR_DIR_ENV = 'ANHALYZE_MIRROR_DIR'
+
+# Version of the mirror layout, mirrors of other versions are not used.
+MIRROR_VERSION = 2
+
+
+def get_mirror_path(filename, mirror_dir=None):
+    """ Returns path of the Zarr mirror for the run and grid of a given ANHA file.
+        The mirror is named `<model_run>_<grid>.zarr`, and located in `mirror_dir`,
+        the directory in environment variable `ANHALYZE_MIRROR_DIR`, or next to the file.
+
+        Parameters
+        ----------
+        filename : str
+            Filename given with format */*/ANHA?-??????_y????m??d??_grid?.nc
+        mirror_dir : str, optional
+            Directory of mirror.
+
+    """
+
+    model_run, grid = _get_run_grid(filename)
+
+    if not mirror_dir:
+        mirror_dir = os.environ.get(MIRROR_DIR_ENV, os.path.dirname(os.path.realpath(filename)))
+
+    return os.path.join(mirror_dir, f'{model_run}_{grid}.zarr')
+
+
+def build_zarr_mirror(file_list, mirror_path=None, variables=None, time_chunk=TIME_CHUNK,
+                      spatial_chunk=SPATIAL_CHUNK, compression_level=5, workers=1, memory_limit=None):
+    """ Copies a run (one grid) into a compressed Zarr store chunked for long time axes,
+        so time series at a point or small region read a few chunks instead of thousands of files.
+
+        Data are copied one variable and time chunk at a time, each file read once.
+        If a time chunk doesn't fit in the memory limit, it is copied in bands of rows
+        (whole spatial chunks), each file then read once per band.
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files, all from the same run and grid.
+        mirror_path : str, optional
+            Path of Zarr store. [default: `get_mirror_path(file_list[0])`]
+        variables : list, optional
+            Variables to copy. If None, all variables on the horizontal grid with a time dimension.
+        time_chunk : int, optional
+            Chunk size along time. [default: 73, i.e. one year of 5-day outputs]
+        spatial_chunk : tuple, optional
+            Chunk size along (y, x). Depth is not chunked. [default: (32, 32)]
+        compression_level : int, optional
+            Blosc/zstd compression level. [default: 5]
+        workers : int, optional
+            Number of processes copying time chunks in parallel. [default: 1]
+        memory_limit : int, optional
+            Memory budget of each process [in bytes]. [default: global `memory_limit` option]
+
+        Returns
+        -------
+        mirror_path : str
+            Path of Zarr store.
+
+    """
+
+    import zarr
+
+    # Making sure files are from the same run and grid, and sorted by time.
+    run_grid = {_get_run_grid(filename) for filename in file_list}
+    assert len(run_grid) == 1, f'[Anhalyze] Files should be from a single run and grid, found: {run_grid}'
+    file_list = sorted(file_list, key=get_file_time)
+
+    if not mirror_path:
+        mirror_path = get_mirror_path(file_list[0])
+
+    # Use first file as template
+    template = open_dataset(file_list[0])
+    time_dim = 'time_counter'
+    if variables is None:
+        variables = [var for var in template.data_vars
+                     if template[var].dims[:1] == (time_dim,) and template[var].ndim >= 3]
+
+    # Writing coordinates with xarray, so they are encoded as xarray expects.
+    times = np.array([get_file_time(filename) for filename in file_list])
+    coords = {name: template.coords[name].variable for name in template.coords
+              if time_dim not in template.coords[name].dims}
+    time_attrs = {key: value for key, value in template[time_dim].attrs.items() if key != 'bounds'}
+    coords[time_dim] = xr.Variable(time_dim, times, time_attrs)
+    xr.Dataset(coords=coords).to_zarr(mirror_path, mode='w', consolidated=False)
+
+    # Creating empty data arrays
+    group = zarr.open_group(mirror_path, mode='a')
+    compressor = zarr.codecs.BloscCodec(cname='zstd', clevel=compression_level, shuffle='shuffle')
+    tasks = []
+    for var in variables:
+        var_da = template[var]
+        assert var_da.dims[0] == time_dim, f'[Anhalyze] Variable {var} first dimension should be {time_dim}.'
+
+        shape = (len(file_list),) + var_da.shape[1:]
+        chunks = (time_chunk,) + var_da.shape[1:-2] + tuple(spatial_chunk)
+        chunks = tuple(min(c, s) for c, s in zip(chunks, shape))
+
+        attrs = {key: value for key, value in var_da.attrs.items() if key not in ['_FillValue', 'missing_value']}
+        attrs['coordinates'] = ' '.join([name for name in coords
+                                         if name in var_da.coords and name not in var_da.dims])
+        # Same type as read from files, so results don't depend on the mirror.
+        fill_value = np.nan if var_da.dtype.kind == 'f' else 0
+        group.create_array(var, shape=shape, chunks=chunks, dtype=var_da.dtype, fill_value=fill_value,
+                           compressors=compressor, dimension_names=var_da.dims,
+                           attributes=_to_json(attrs))
+
+        # One task per time chunk, split in bands of rows if needed.
+        ny = var_da.shape[-2]
+        row_step = _get_row_step(var_da, chunks[0], chunks[-2], memory_limit)
+        tasks += [(var, slice(t0, min(t0 + time_chunk, len(file_list))), slice(y0, min(y0 + row_step, ny)))
+                  for t0 in range(0, len(file_list), time_chunk) for y0 in range(0, ny, row_step)]
+
+    # Copying data, tasks write separate chunks.
+    with METRICS.timer('zarr_mirror'):
+        map_chunks(_copy_chunk, tasks, workers, mirror_path=mirror_path, source_files=file_list)
+
+    # Store size and modification time of files, so readers can check the mirror is up to date.
+    group.attrs.update({'mirror_version': MIRROR_VERSION,
+                        'model_run': run_grid.pop()[0],
+                        'sources': [_get_source(filename) for filename in file_list]})
+
+    logger.info('Zarr mirror saved: %s', mirror_path)
+
+    return mirror_path
+
+
+def open_mirror(mirror_path):
+    """ Opens Zarr mirror as `xarray.Dataset` (lazily, without dask).
+
+        Parameters
+        ----------
+        mirror_path : str
+            Path of Zarr store.
+
+    """
+
+    return xr.open_dataset(mirror_path, engine='zarr', chunks=None, consolidated=False)
+
+
+def find_mirror(file_list, variables=None, mirror_path=None):
+    """ Returns Zarr mirror covering given files and variables, and time index of each file in the mirror.
+        None if no mirror is found, or if it doesn't cover all files and variables,
+        or if a file changed since the mirror was built (different size or modification time).
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files, all from the same run and grid.
+        variables : list, optional
+            Variables needed.
+        mirror_path : str, optional
+            Path of Zarr store. [default: `get_mirror_path(file_list[0])`]
+
+        Returns
+        -------
+        mirror : xarray.Dataset
+            Mirror, see `open_mirror`.
+        time_index : list | slice
+            Index of each file along time in the mirror, in order of file_list.
+
+    """
+
+    if not file_list:
+        return None
+
+    if not mirror_path:
+        mirror_path = get_mirror_path(file_list[0])
+
+    if not os.path.isdir(mirror_path):
+        return None
+
+    try:
+        ds = open_mirror(mirror_path)
+        sources = {source[0]: (i, tuple(source)) for i, source in enumerate(ds.attrs.get('sources', []))}
+        file_sources = [_get_source(filename) for filename in file_list]
+    except (OSError, ValueError) as error:
+        logger.debug('Zarr mirror not readable: %s (%s)', mirror_path, error)
+        return None
+
+    if ds.attrs.get('mirror_version') != MIRROR_VERSION or \
+            any(sources.get(source[0], (None, None))[1] != source for source in file_sources) or \
+            (variables and not set(variables) <= set(ds.data_vars)):
+        logger.debug('Zarr mirror out of date or not covering files: %s', mirror_path)
+        METRICS.increment('mirror_misses')
+        return None
+
+    METRICS.increment('mirror_hits')
+
+    # Contiguous files are read with a slice.
+    time_index = [sources[source[0]][0] for source in file_sources]
+    if time_index == list(range(time_index[0], time_index[0] + len(time_index))):
+        time_index = slice(time_index[0], time_index[0] + len(time_index))
+
+    return ds, time_index
+
+
+def open_mirror_dataset(file_list, var, sel_kwargs=None, mask_filename=None, mirror_path=None):
+    """ Returns `AnhaDataset` of a variable over all files, read from an up-to-date Zarr mirror,
+        with mask and attributes of the first file, within a region if sel_kwargs are given.
+        None if no mirror covers the files, see `find_mirror`.
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files, all from the same run and grid.
+        var : str
+            Variable name.
+        sel_kwargs : dict, optional
+            Selection, with keys of `AnhaDataset.sel` (lat_range, lon_range, depth_range).
+        mask_filename : str, optional
+            Mask filename.
+        mirror_path : str, optional
+            Path of Zarr store. [default: `get_mirror_path(file_list[0])`]
+
+    """
+
+    mirror = find_mirror(file_list, [var], mirror_path=mirror_path)
+    if mirror is None:
+        return None
+
+    mirror_ds, time_index = mirror
+    first_ds = AnhaDataset(file_list[0], mask_filename=mask_filename)
+
+    xr_dataset = mirror_ds[[var]].isel(time_counter=time_index).assign(mask=first_ds.data_vars['mask'].variable)
+    attrs = first_ds.attrs | {'file_category': 'mirror'}
+    ds = AnhaDataset('', _xr_dataset=xr_dataset, _attrs=attrs)
+
+    if sel_kwargs and any(sel_kwargs.values()):
+        ds = ds.sel(**sel_kwargs)
+
+    return ds
+
+
+def iter_time_blocks(ds, var, memory_limit=None):
+    """ Yields (time slice, masked DataArray) of a variable read from a mirror (see `open_mirror_dataset`),
+        one time chunk of the mirror at a time, or less within the memory limit.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset read from a mirror.
+        var : str
+            Variable name.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+    """
+
+    var_da = ds.data_vars[var]
+    n_times = var_da.sizes['time_counter']
+    time_step = var_da.encoding.get('preferred_chunks', {}).get('time_counter', TIME_CHUNK)
+
+    for t0 in range(0, n_times, time_step):
+        chunk = slice(t0, min(t0 + time_step, n_times))
+        for block in get_blocks(var_da.isel(time_counter=chunk), ['time_counter'], memory_limit=memory_limit):
+            block = block.get('time_counter', slice(0, chunk.stop - chunk.start))
+            time_slice = slice(t0 + block.start, t0 + block.stop)
+            yield time_slice, ds._get_var_data_block(var, indexers={'time_counter': time_slice})
+
+
+def get_mirror_stats(ds, var, memory_limit=None):
+    """ Returns statistics of a masked variable at each time step, read from a mirror (see `open_mirror_dataset`).
+        Same statistics as `anhalyze.core.blocks.get_var_stats` for each file.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset read from a mirror.
+        var : str
+            Variable name.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+        Returns
+        -------
+        stats : dict
+            Arrays of mean, std, min, max (NaN if no valid values) and count of valid values, along time.
+
+    """
+
+    var_da = ds.data_vars[var]
+    n_times = var_da.sizes['time_counter']
+    stats = {key: np.full(n_times, np.nan) for key in ['mean', 'std']}
+    stats |= {key: np.full(n_times, np.nan, dtype=var_da.dtype) for key in ['min', 'max']}
+    stats['count'] = np.zeros(n_times, dtype=int)
+
+    for time_slice, block_da in iter_time_blocks(ds, var, memory_limit=memory_limit):
+        block_data = block_da.values.reshape(time_slice.stop - time_slice.start, -1)
+        count = np.count_nonzero(np.isfinite(block_data), axis=1)
+
+        # Time steps without valid values are left as NaN.
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = np.nansum(block_data, axis=1, dtype=np.float64) / count
+            stats['mean'][time_slice] = mean
+            stats['std'][time_slice] = np.sqrt(np.nansum((block_data - mean[:, None]) ** 2, axis=1) / count)
+            stats['min'][time_slice] = np.nanmin(block_data, axis=1)
+            stats['max'][time_slice] = np.nanmax(block_data, axis=1)
+        stats['count'][time_slice] = count
+
+    return stats
+
+
+def get_mirror_sums(ds, var, months, memory_limit=None):
+    """ Returns monthly sums and counts of valid values of a masked variable, read from a mirror
+        (see `open_mirror_dataset`), in the format of `anhalyze.core.anhalyze_run.get_climatology` tasks.
+
+        Parameters
+        ----------
+        ds : AnhaDataset
+            Dataset read from a mirror.
+        var : str
+            Variable name.
+        months : list
+            Month of each time step.
+        memory_limit : int, optional
+            Memory budget [in bytes]. [default: global `memory_limit` option]
+
+        Returns
+        -------
+        sums : dict
+            {month: (sum, count, number of files, template DataArray)}
+
+    """
+
+    template = ds._get_var_data_block(var, mask_data=False, indexers={'time_counter': 0})
+
+    sums = {}
+    for time_slice, block_da in iter_time_blocks(ds, var, memory_limit=memory_limit):
+        block_data = block_da.values
+        for i, month in enumerate(months[time_slice]):
+            valid = np.isfinite(block_data[i])
+            if month not in sums:
+                sums[month] = (np.zeros(valid.shape, dtype=block_data.dtype), np.zeros(valid.shape, dtype=int),
+                               0, template)
+            month_sum, month_count, n_files, _ = sums[month]
+            month_sum += np.where(valid, block_data[i], 0)
+            month_count += valid
+            sums[month] = (month_sum, month_count, n_files + 1, template)
+
+    return sums
+
+
+def open_run_dataset(file_list, variables=None, indexers=None, use_mirror=True, mirror_path=None):
+    """ Returns `xarray.Dataset` with given files concatenated along time.
+
+        If an up-to-date Zarr mirror covering all files and variables is found (see `find_mirror`),
+        data are read from it, otherwise from each file.
+
+        Parameters
+        ----------
+        file_list : list
+            List of ANHA files, all from the same run and grid.
+        variables : list, optional
+            Variables to return. If None, all variables with a time dimension.
+        indexers : dict, optional
+            Selection applied before concatenation, as `xarray.Dataset.isel` indexers,
+            e.g. {'y': 120, 'x': slice(300, 310)} for a small region.
+        use_mirror : bool, optional
+            If True, read from Zarr mirror when available. [default: True]
+        mirror_path : str, optional
+            Path of Zarr store. [default: `get_mirror_path(file_list[0])`]
+
+    """
+
+    file_list = sorted(file_list, key=get_file_time)
+    indexers = indexers if indexers else {}
+
+    mirror = find_mirror(file_list, variables, mirror_path=mirror_path) if use_mirror else None
+    if mirror is not None:
+        ds, time_index = mirror
+        ds = ds.isel({'time_counter': time_index} | indexers)
+        return ds[variables] if variables else ds
+
+    # Reading from files
+    datasets = []
+    for filename in file_list:
+        ds = open_dataset(filename)
+        if variables is None:
+            variables = [var for var in ds.data_vars if 'time_counter' in ds[var].dims]
+        datasets.append(ds[variables].isel(indexers))
+
+    return xr.concat(datasets, dim='time_counter', coords='minimal', compat='override')
+
+
+def _copy_chunk(tasks, mirror_path, source_files):
+    """ Copies (variable, time slice, row slice) tasks from files to the mirror, each file read once per task.
+    """
+
+    import zarr
+
+    group = zarr.open_group(mirror_path, mode='r+')
+    for var, time_slice, y_slice in tasks:
+        array = group[var]
+        block = np.empty((time_slice.stop - time_slice.start,) + array.shape[1:-2]
+                         + (y_slice.stop - y_slice.start, array.shape[-1]), dtype=array.dtype)
+        for i, filename in enumerate(source_files[time_slice]):
+            block[i] = open_dataset(filename)[var][0, ..., y_slice, :].values
+
+        array[time_slice, ..., y_slice, :] = block
+        METRICS.increment('mirror_chunks_written')
+
+
+def _get_row_step(var_da, time_chunk, row_chunk, memory_limit=None):
+    """ Returns number of rows copied at once: all rows, or whole spatial chunks fitting in the memory limit.
+    """
+
+    if memory_limit is None:
+        memory_limit = OPTIONS['memory_limit']
+
+    ny = var_da.shape[-2]
+    row_nbytes = time_chunk * var_da[0].size // ny * var_da.dtype.itemsize
+    if not memory_limit or row_nbytes * ny * BLOCK_MEMORY_FACTOR <= memory_limit:
+        return ny
+
+    return max(1, memory_limit // (BLOCK_MEMORY_FACTOR * row_nbytes * row_chunk)) * row_chunk
+
+
+def _get_source(filename):
+    """ Returns (basename, size, modification time) of a file.
+    """
+
+    stat = os.stat(filename)
+
+    return os.path.basename(filename), stat.st_size, stat.st_mtime_ns
+
+
+def _get_run_grid(filename):
+    """ Returns model run and grid from filename.
+    """
+
+    filename = os.path.basename(filename)
+    get_date(filename)  # Checking filename format
+
+    model_run = filename.split('_')[0]
+    grid = filename.split('_')[2].replace('.nc', '')
+
+    return model_run, grid
+
+
+def _to_json(attrs):
+    """ Returns attrs with numpy values converted, so they can be stored as Zarr attributes.
+    """
+
+    return {key: value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+            for key, value in attrs.items()}
@@ -0,0 +1,31 @@
+
+# Library imports
+import logging
+import tempfile
+import unittest
+
+from anhalyze.core.anhalyze_utils import set_log_level
+from anhalyze.core.file_pool import FILE_POOL
+from anhalyze.core.synthetic import write_synthetic_run
+
+
+class SyntheticRunTestCase(unittest.TestCase):
+    """ Test case with a synthetic run (`cls.files`, see `write_synthetic_run`) written once in a temporary
+        directory (`cls.tmp_dir`), and messages below ERROR hidden. Subclasses set `grids` and `n_files`.
+    """
+
+    grids = ['gridT']
+    n_files = 1
+
+    @classmethod
+    def setUpClass(cls):
+        cls.log_level = logging.getLogger('anhalyze').level
+        set_log_level('ERROR')
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.files = write_synthetic_run(cls.tmp_dir.name, grids=cls.grids, n_files=cls.n_files, size='tiny')
+
+    @classmethod
+    def tearDownClass(cls):
+        set_log_level(cls.log_level)
+        FILE_POOL.close()
+        cls.tmp_dir.cleanup()
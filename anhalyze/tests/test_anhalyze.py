@@ -0,0 +1,71 @@
+
+# Library imports
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from anhalyze.core import profiling
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class AnhaDatasetTestCase(SyntheticRunTestCase):
+    """ Testing `AnhaDataset` on synthetic ANHA files.
+    """
+
+    def test_load(self):
+        """ Testing variables are read into memory, only within the selected region. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        ds.load(['votemper', 'sossheig'])
+
+        with xr.open_dataset(self.files['gridT'][0]) as source:
+            for var in ['votemper', 'sossheig']:
+                self.assertIsInstance(ds._xr_dataset[var].variable._data, np.ndarray)
+                np.testing.assert_array_equal(ds._xr_dataset[var].values, source[var].values)
+            self.assertNotIsInstance(ds._xr_dataset['vosaline'].variable._data, np.ndarray)
+
+            region_ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask']).isel(x_range=[5, 15])
+            region_ds.load('votemper')
+            np.testing.assert_array_equal(region_ds._xr_dataset['votemper'].values,
+                                          source['votemper'].isel(x=slice(5, 15)).values)
+
+        with self.assertRaises(AssertionError):
+            ds.load(['not_a_variable'])
+
+    def test_profile_init(self):
+        """ Testing only opening files is recorded as 'init', not datasets built by sel and isel. """
+
+        profiling.enable_profiling()
+        profiling.get_stats().reset()
+        try:
+            ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+            ds.sel(lat_range=[60, 75], lon_range=[-80, -40]).isel(x_range=[0, 5])
+            stats = profiling.get_stats()
+        finally:
+            profiling.disable_profiling()
+
+        self.assertEqual(stats['init']['calls'], 1)
+        self.assertEqual(stats['sel']['calls'], 1)
+        self.assertEqual(stats['isel']['calls'], 1)
+        profiling.get_stats().reset()
+
+    def test_mask_2d(self):
+        """ Testing 2D variables of files with a depth dimension are masked with the surface mask layer. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        surface_mask = ds.data_vars['mask'].values[0] == 1
+
+        for region_ds in [ds, ds.sel(lat_range=[60, 75], lon_range=[-80, -40])]:
+            var_da = region_ds._get_var_data_array('sossheig')
+            self.assertEqual(var_da.dims, region_ds.data_vars['sossheig'].dims)
+
+        var_data = ds._get_var_data_array('sossheig').values[0]
+        self.assertFalse(surface_mask.all())
+        self.assertTrue(np.isnan(var_data[~surface_mask]).all())
+        np.testing.assert_array_equal(var_data[surface_mask], ds.data_vars['sossheig'].values[0][surface_mask])
+
+
+if __name__ == '__main__':
+    unittest.main()
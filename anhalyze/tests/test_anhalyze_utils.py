@@ -0,0 +1,51 @@
+# Library imports
+import os
+import unittest
+
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_utils import atomic_write, get_grid_variables, parse_bytes
+from anhalyze.core.synthetic import GRID_VARIABLES
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class UtilsTestCase(SyntheticRunTestCase):
+    """ Testing utilities shared by anhalyze modules.
+    """
+
+    def test_parse_bytes(self):
+        """ Testing size strings. """
+
+        self.assertEqual(parse_bytes('4GB'), 4 * 10 ** 9)
+        self.assertEqual(parse_bytes('2 MiB'), 2 * 2 ** 20)
+        self.assertEqual(parse_bytes(1000), 1000)
+
+    def test_atomic_write(self):
+        """ Testing files are renamed when written, and left unchanged on error. """
+
+        filename = os.path.join(self.tmp_dir.name, 'atomic', 'file.txt')
+
+        with atomic_write(filename) as tmp_filename:
+            with open(tmp_filename, 'w') as file:
+                file.write('first')
+            self.assertFalse(os.path.exists(filename))
+
+        with self.assertRaises(ValueError):
+            with atomic_write(filename) as tmp_filename:
+                with open(tmp_filename, 'w') as file:
+                    file.write('second')
+                raise ValueError
+
+        with open(filename) as file:
+            self.assertEqual(file.read(), 'first')
+        self.assertEqual(os.listdir(os.path.dirname(filename)), ['file.txt'])
+
+    def test_grid_variables(self):
+        """ Testing grid variables, without the mask nor coordinates. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+
+        self.assertEqual(sorted(get_grid_variables(ds)), sorted(GRID_VARIABLES['gridT']))
+
+
+if __name__ == '__main__':
+    unittest.main()
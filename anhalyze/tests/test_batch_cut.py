@@ -0,0 +1,114 @@
+
+# Library imports
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from anhalyze.core.batch_cut import (STATE_FILENAME, _get_log_filename, _load_state, _save_state, batch_cut,
+                                     get_output_filename)
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class BatchCutTestCase(SyntheticRunTestCase):
+    """ Testing batch cuts: resuming from the state file, and invalidating it when parameters change.
+    """
+
+    n_files = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cut_kwargs = {'lat_range': [60, 75], 'lon_range': [-80, -40], 'mask_filename': cls.files['mask']}
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp(dir=self.tmp_dir.name)
+
+    def get_mtimes(self):
+        return [os.stat(get_output_filename(filename, self.output_dir)).st_mtime_ns for filename in self.files['gridT']]
+
+    def test_resume(self):
+        """ Testing files already done are skipped, and redone with overwrite. """
+
+        report = batch_cut(self.files['gridT'][:2], self.output_dir, **self.cut_kwargs)
+        self.assertEqual(list(report['status']), ['done', 'done'])
+
+        # Same file given through another path is the same file.
+        file_list = [os.path.join(self.tmp_dir.name, '.', os.path.basename(self.files['gridT'][0]))]
+        report = batch_cut(file_list + self.files['gridT'][1:], self.output_dir, **self.cut_kwargs)
+        self.assertEqual(list(report['status']), ['skipped', 'skipped', 'done'])
+        self.assertEqual(list(report.index), [os.path.realpath(filename) for filename in self.files['gridT']])
+        mtimes = self.get_mtimes()
+
+        report = batch_cut(self.files['gridT'], self.output_dir, **self.cut_kwargs)
+        self.assertEqual(list(report['status']), ['skipped'] * 3)
+        self.assertEqual(self.get_mtimes(), mtimes)
+
+        report = batch_cut(self.files['gridT'], self.output_dir, overwrite=True, **self.cut_kwargs)
+        self.assertEqual(list(report['status']), ['done'] * 3)
+        self.assertTrue(all(report['mb_per_s'] > 0))
+
+    def test_params_changed(self):
+        """ Testing progress is not used when parameters change, and files without outputs are redone. """
+
+        batch_cut(self.files['gridT'], self.output_dir, **self.cut_kwargs)
+        state = _load_state(os.path.join(self.output_dir, STATE_FILENAME))
+
+        report = batch_cut(self.files['gridT'], self.output_dir, **self.cut_kwargs | {'depth_range': [0, 100]})
+        self.assertEqual(list(report['status']), ['done'] * 3)
+        self.assertNotEqual(_load_state(os.path.join(self.output_dir, STATE_FILENAME))['params_id'],
+                            state['params_id'])
+
+        os.remove(get_output_filename(self.files['gridT'][1], self.output_dir))
+        report = batch_cut(self.files['gridT'], self.output_dir, **self.cut_kwargs | {'depth_range': [0, 100]})
+        self.assertEqual(list(report['status']), ['skipped', 'done', 'skipped'])
+
+    def test_empty(self):
+        """ Testing report of an empty list. """
+
+        report = batch_cut([], self.output_dir)
+        self.assertTrue(report.empty)
+        self.assertIn('status', report)
+
+    def test_save_state(self):
+        """ Testing an interrupted save leaves the previous state file. """
+
+        state_filename = os.path.join(self.output_dir, STATE_FILENAME)
+        _save_state(state_filename, {'params_id': 'a', 'files': {}})
+
+        def interrupted_dump(state, f, **kwargs):
+            f.write('{"params_id": "b", "fi')
+            raise OSError('No space left on device')
+
+        with mock.patch('json.dump', side_effect=interrupted_dump), self.assertRaises(OSError):
+            _save_state(state_filename, {'params_id': 'b', 'files': {}})
+
+        with open(state_filename) as f:
+            self.assertEqual(json.load(f), {'params_id': 'a', 'files': {}})
+
+    def test_progress_log(self):
+        """ Testing files finished after the state was saved are read from the progress log. """
+
+        batch_cut(self.files['gridT'][:2], self.output_dir, **self.cut_kwargs)
+        state_filename = os.path.join(self.output_dir, STATE_FILENAME)
+        log_filename = _get_log_filename(state_filename)
+        self.assertFalse(os.path.isfile(log_filename))
+        state = _load_state(state_filename)
+        self.assertEqual(len(state['files']), 2)
+
+        # Interrupted job: state saved at the start, progress log of another job, and a partial last line.
+        key = os.path.realpath(self.files['gridT'][0])
+        _save_state(state_filename, {'params_id': state['params_id'], 'files': {}})
+        with open(log_filename, 'w') as f:
+            f.write(json.dumps([state['params_id'], key, state['files'][key]]) + '\n')
+            f.write(json.dumps(['other', 'other.nc', {'status': 'done'}]) + '\n')
+            f.write('["' + state['params_id'])
+        self.assertEqual(_load_state(state_filename)['files'], {key: state['files'][key]})
+
+        report = batch_cut(self.files['gridT'][:2], self.output_dir, **self.cut_kwargs)
+        self.assertEqual(list(report['status']), ['skipped', 'done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
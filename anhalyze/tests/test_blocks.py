@@ -0,0 +1,115 @@
+
+# Library imports
+import os
+import unittest
+
+import numpy as np
+import xarray as xr
+
+import anhalyze
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_run import get_climatology, get_timeseries
+from anhalyze.core.blocks import get_blocks, get_var_stats
+from anhalyze.core.options import OPTIONS
+from anhalyze.tests import SyntheticRunTestCase
+
+# Memory limit splitting tiny synthetic 3D variables (180 kB) in several depth blocks.
+MEMORY_LIMIT = '100kB'
+
+
+class BlocksTestCase(SyntheticRunTestCase):
+    """ Testing processing in blocks within a memory limit gives the same results.
+    """
+
+    n_files = 3
+
+    def open(self):
+        return AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+
+    def test_options(self):
+        """ Testing options are parsed, and restored after a with block. """
+
+        with anhalyze.set_options(memory_limit='2GB'):
+            self.assertEqual(OPTIONS['memory_limit'], 2 * 10 ** 9)
+        self.assertIsNone(OPTIONS['memory_limit'])
+
+        with self.assertRaises(AssertionError):
+            anhalyze.set_options(not_an_option=1)
+
+    def test_get_blocks(self):
+        """ Testing blocks cover the whole depth range. """
+
+        var_da = self.open().data_vars['votemper']
+        blocks = get_blocks(var_da, ['deptht'], memory_limit=var_da.nbytes)
+
+        self.assertEqual(get_blocks(var_da, ['deptht']), [{}])
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(sum(block['deptht'].stop - block['deptht'].start for block in blocks),
+                         var_da.sizes['deptht'])
+
+    def test_masked_array(self):
+        """ Testing masking in blocks, of 3D and 2D variables. """
+
+        ds = self.open()
+        with anhalyze.set_options(memory_limit=MEMORY_LIMIT):
+            votemper = ds._get_var_data_array('votemper')
+            sossheig = ds._get_var_data_array('sossheig')
+            top = ds._get_var_data_array('votemper', indexers={'deptht': [0]})
+
+        np.testing.assert_array_equal(votemper.values, ds._get_var_data_array('votemper').values)
+        np.testing.assert_array_equal(sossheig.values, ds._get_var_data_array('sossheig').values)
+        np.testing.assert_array_equal(top.values, votemper.values[:, :1])
+        self.assertEqual(votemper.dims, ds.data_vars['votemper'].dims)
+
+    def test_stats(self):
+        """ Testing statistics in blocks. """
+
+        ds = self.open().sel(lat_range=[60, 75], lon_range=[-80, -40])
+        var_data = ds._get_var_data_array('votemper').values
+
+        with anhalyze.set_options(memory_limit=MEMORY_LIMIT):
+            stats = get_var_stats(ds, 'votemper')
+
+        self.assertAlmostEqual(stats['mean'], np.nanmean(var_data), places=4)
+        self.assertAlmostEqual(stats['std'], np.nanstd(var_data), places=4)
+        self.assertEqual(stats['min'], np.nanmin(var_data))
+        self.assertEqual(stats['count'], np.isfinite(var_data).sum())
+
+    def test_run(self):
+        """ Testing time series and climatology in blocks. """
+
+        kwargs = {'var': 'votemper', 'lat_range': [60, 75], 'lon_range': [-80, -40],
+                  'mask_filename': self.files['mask']}
+        timeseries = get_timeseries(self.files['gridT'], **kwargs)
+        climatology = get_climatology(self.files['gridT'], **kwargs)
+
+        with anhalyze.set_options(memory_limit=MEMORY_LIMIT):
+            np.testing.assert_allclose(get_timeseries(self.files['gridT'], **kwargs)['var_mean'],
+                                       timeseries['var_mean'])
+            xr.testing.assert_allclose(get_climatology(self.files['gridT'], **kwargs), climatology)
+
+    def test_to_netcdf(self):
+        """ Testing saving in blocks, with packing and precision trimming. """
+
+        for preset in [None, 'archive']:
+            # Same filename in two directories, saved in attributes.
+            path, block_path = os.path.join(self.tmp_dir.name, 'full'), os.path.join(self.tmp_dir.name, 'blocks')
+            os.makedirs(path, exist_ok=True)
+            os.makedirs(block_path, exist_ok=True)
+
+            filename = self.open().to_netcdf(path=path, preset=preset, precision=True, overwrite=True)
+            with anhalyze.set_options(memory_limit=MEMORY_LIMIT):
+                block_filename = self.open().to_netcdf(path=block_path, preset=preset, precision=True,
+                                                       overwrite=True)
+
+            with xr.open_dataset(filename) as ds, xr.open_dataset(block_filename) as block_ds:
+                xr.testing.assert_identical(ds, block_ds)
+
+                # Only fields are packed, bounds keep their float dtype.
+                if preset == 'archive':
+                    self.assertEqual(block_ds['votemper'].encoding['dtype'], np.int16)
+                    self.assertEqual(block_ds['deptht_bounds'].encoding['dtype'], np.float32)
+
+
+if __name__ == '__main__':
+    unittest.main()
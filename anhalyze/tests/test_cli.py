@@ -0,0 +1,96 @@
+
+# Library imports
+import contextlib
+import io
+import logging
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from anhalyze.cli import main
+from anhalyze.core.anhalyze_run import get_climatology, get_timeseries
+from anhalyze.core.anhalyze_utils import set_log_level
+from anhalyze.core.batch_cut import get_output_filename
+from anhalyze.core.options import set_options
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class CLITestCase(SyntheticRunTestCase):
+    """ Testing `anhalyze` command on synthetic ANHA files.
+    """
+
+    n_files = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.region = ['--lat-range', '60', '75', '--lon-range', '-80', '-40', '--mask-filename', cls.files['mask']]
+        cls.sel_kwargs = {'lat_range': [60, 75], 'lon_range': [-80, -40], 'mask_filename': cls.files['mask']}
+
+    def run_main(self, *argv):
+        """ Returns exit code and output of the command, leaving global options and log level unchanged. """
+
+        level = logging.getLogger('anhalyze').level
+        stdout = io.StringIO()
+        try:
+            with set_options(), contextlib.redirect_stdout(stdout):
+                exit_code = main(list(argv))
+        finally:
+            set_log_level(level)
+
+        return exit_code, stdout.getvalue()
+
+    def test_list(self):
+        """ Testing files of a run are listed in time order, filtered by month. """
+
+        exit_code, output = self.run_main('list', self.tmp_dir.name)
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(output.split(), self.files['gridT'])
+
+        exit_code, output = self.run_main('list', self.tmp_dir.name, '--months', '2')
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(output, '')
+
+    def test_cut(self):
+        """ Testing cuts are saved for each file, and skipped when done. """
+
+        output_dir = os.path.join(self.tmp_dir.name, 'cuts')
+        exit_code, _ = self.run_main('cut', self.tmp_dir.name, '--output-dir', output_dir, '--variables', 'votemper',
+                                     *self.region)
+        self.assertEqual(exit_code, 0)
+
+        with xr.open_dataset(get_output_filename(self.files['gridT'][0], output_dir)) as ds:
+            self.assertIn('votemper', ds)
+            self.assertNotIn('vosaline', ds)
+            self.assertEqual(ds['votemper'].shape[-2:], (4, 10))
+
+        self.assertEqual(self.run_main('cut', *self.files['gridT'], '--output-dir', output_dir,
+                                       '--variables', 'votemper', *self.region)[0], 0)
+
+    def test_timeseries(self):
+        """ Testing time series and climatology are saved, with the same values as run-level functions. """
+
+        output = os.path.join(self.tmp_dir.name, 'output', 'timeseries.csv')
+        exit_code, _ = self.run_main('timeseries', self.tmp_dir.name, '--var', 'sossheig', '--output', output,
+                                     *self.region)
+        self.assertEqual(exit_code, 0)
+
+        timeseries = pd.read_csv(output, parse_dates=['date'])
+        expected = get_timeseries(self.files['gridT'], var='sossheig', **self.sel_kwargs)
+        pd.testing.assert_frame_equal(timeseries, expected, check_dtype=False, rtol=1e-6)
+
+        output = os.path.join(self.tmp_dir.name, 'output', 'climatology.nc')
+        exit_code, _ = self.run_main('climatology', self.tmp_dir.name, '--output', output, '--workers', '2',
+                                     *self.region)
+        self.assertEqual(exit_code, 0)
+
+        with xr.open_dataset(output) as climatology:
+            np.testing.assert_allclose(climatology['votemper'],
+                                       get_climatology(self.files['gridT'], **self.sel_kwargs), rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
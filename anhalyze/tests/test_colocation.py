@@ -0,0 +1,102 @@
+
+# Library imports
+import numpy as np
+import unittest
+from unittest import mock
+
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_colocation import (GridIndex, colocate, get_cell_sizes, get_file_time, _get_time_weights,
+                                               _interp_depth)
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class ColocationTestCase(unittest.TestCase):
+    """ Testing co-location helpers that don't need ANHA files.
+    """
+
+    def test_file_time(self):
+        """ Testing file time is taken at the middle of the output period. """
+
+        file_time = get_file_time('/some/path/ANHA4-EXP001_y1980m01d05_gridT.nc')
+        self.assertEqual(file_time, np.datetime64('1980-01-03', 'ns'))
+
+    def test_time_weights(self):
+        """ Testing bracketing files and weights in time. """
+
+        file_times = np.array(['1980-01-03', '1980-01-08', '1980-01-13'], dtype='datetime64[ns]')
+        obs_time = np.array(['1980-01-03', '1980-01-09', '1980-01-13', '1980-01-20'], dtype='datetime64[ns]')
+
+        file_0, file_1, weight = _get_time_weights(obs_time, file_times)
+
+        np.testing.assert_array_equal(file_0, [0, 1, 2, -1])
+        np.testing.assert_allclose(weight, [0, 0.2, 0, 0])
+
+        # Nearest file only
+        file_0, _, weight = _get_time_weights(obs_time, file_times, time_interp=False)
+        np.testing.assert_array_equal(file_0, [0, 1, 2, -1])
+        np.testing.assert_array_equal(weight, 0)
+
+    def test_interp_depth(self):
+        """ Testing vertical interpolation of many profiles at once. """
+
+        depth = np.array([1., 10., 20.])
+        profiles = np.array([[1., 5.], [10., 6.], [np.nan, 7.]])
+
+        values = _interp_depth(profiles, depth, np.array([0., 15.]))
+        np.testing.assert_allclose(values, [1., 6.5])
+
+        # Below bottom (NaN) and below deepest level.
+        values = _interp_depth(profiles, depth, np.array([15., 30.]))
+        self.assertTrue(np.isnan(values).all())
+
+    def test_grid_index(self):
+        """ Testing nearest grid cell on a regular grid. """
+
+        lat, lon = np.meshgrid(np.arange(50., 60.), np.arange(-90., -70.), indexing='ij')
+        row, col, distance = GridIndex(lat, lon).query([52.1, 58.9], [-85.1, -71.])
+
+        np.testing.assert_array_equal(row, [2, 9])
+        np.testing.assert_array_equal(col, [5, 19])
+        self.assertTrue((distance < 15).all())
+
+    def test_cell_sizes(self):
+        """ Testing cell sizes next to fill values (lat=lon=0) of land-eliminated blocks. """
+
+        lat, lon = np.meshgrid(np.arange(50., 60.), np.arange(-90., -70.), indexing='ij')
+        expected = get_cell_sizes(lat, lon)
+        lat[3:6, 4:8] = 0
+        lon[3:6, 4:8] = 0
+
+        cell_sizes = get_cell_sizes(lat, lon)
+        np.testing.assert_allclose(cell_sizes[2, 4:8], expected[2, 4:8])
+        np.testing.assert_allclose(cell_sizes[3:6, 3], expected[3:6, 3])
+        np.testing.assert_array_equal(cell_sizes[3:6, 4:8], 0)
+
+
+class ColocateTestCase(SyntheticRunTestCase):
+    """ Testing co-location on synthetic ANHA files.
+    """
+
+    n_files = 2
+
+    def test_colocate(self):
+        """ Testing values of the nearest wet cell, and NaN outside the grid. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        row, col = [index[0] for index in np.nonzero(ds.data_vars['mask'].values[0] == 1)]
+        lat, lon = float(ds.coords['nav_lat'][row, col]), float(ds.coords['nav_lon'][row, col])
+        time = get_file_time(self.files['gridT'][0])
+
+        # Only the file covering the observations is opened, once.
+        with mock.patch('anhalyze.core.anhalyze_colocation.AnhaDataset', wraps=AnhaDataset) as anha_dataset:
+            colocated = colocate({'time': [time, time], 'lat': [lat, -60.], 'lon': [lon, 0.]},
+                                 self.files['gridT'], var='sossheig', mask_filename=self.files['mask'])
+
+        self.assertEqual((colocated['row'][0], colocated['col'][0]), (row, col))
+        self.assertAlmostEqual(colocated['sossheig'][0], float(ds.data_vars['sossheig'][0, row, col]), places=5)
+        self.assertTrue(np.isnan(colocated['sossheig'][1]))
+        self.assertEqual(anha_dataset.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+
+# Library imports
+import numpy as np
+import xarray as xr
+import unittest
+
+from anhalyze.core.encoding import get_encoding, trim_precision
+
+
+class EncodingTestCase(unittest.TestCase):
+    """ Testing encoding presets for `AnhaDataset.to_netcdf`.
+    """
+
+    def setUp(self):
+        """ Small dataset with a 3D and a 2D variable, and depth bounds. """
+
+        self.ds = xr.Dataset({'votemper': (('time_counter', 'deptht', 'y', 'x'), np.random.rand(1, 5, 40, 30) * 30),
+                              'mask': (('deptht', 'y', 'x'), np.ones((5, 40, 30), dtype='int8')),
+                              'deptht_bounds': (('deptht', 'axis_nbounds'),
+                                                np.arange(10, dtype='float32').reshape(5, 2))})
+        self.dims = {'x': 'x', 'y': 'y', 'z': 'deptht'}
+
+    def test_chunks_match_selection(self):
+        """ Testing chunk shapes are limited by the selection size. """
+
+        encoding = get_encoding(self.ds, 'time-series', dims=self.dims)
+        self.assertEqual(encoding['votemper']['chunksizes'], (1, 5, 16, 16))
+
+        encoding = get_encoding(self.ds, 'fast-read', dims=self.dims)
+        self.assertEqual(encoding['votemper']['chunksizes'], (1, 5, 40, 30))
+        self.assertEqual(encoding['mask']['chunksizes'], (5, 40, 30))
+
+    def test_archive_packing(self):
+        """ Testing packed values round trip within precision. """
+
+        encoding = get_encoding(self.ds, 'archive', dims=self.dims)
+        self.assertEqual(encoding['votemper']['dtype'], 'int16')
+        self.assertNotIn('dtype', encoding['mask'])
+        self.assertNotIn('dtype', encoding['deptht_bounds'])
+
+        packed = np.round((self.ds.votemper.values - encoding['votemper']['add_offset'])
+                          / encoding['votemper']['scale_factor'])
+        self.assertLessEqual(np.abs(packed).max(), 32767)
+        unpacked = packed * encoding['votemper']['scale_factor'] + encoding['votemper']['add_offset']
+        np.testing.assert_allclose(unpacked, self.ds.votemper.values, atol=30 / 65532)
+
+    def test_trim_precision(self):
+        """ Testing bit-rounding within tolerance, and NaN kept. """
+
+        var_data = self.ds.votemper.values.astype('float32')
+        var_data[0, 0, 0, 0] = np.nan
+
+        trimmed = trim_precision(var_data, tolerance=1e-3)
+        self.assertTrue(np.isnan(trimmed[0, 0, 0, 0]))
+        self.assertLessEqual(np.nanmax(np.abs(trimmed - var_data)), 1e-3)
+
+        # Trailing mantissa bits are zero
+        trimmed = trim_precision(var_data, keepbits=7)
+        self.assertFalse((trimmed[1:].view('uint32') & (2 ** 16 - 1)).any())
+        np.testing.assert_allclose(trimmed, var_data, rtol=2 ** -8)
+
+    def test_unknown_preset(self):
+        """ Testing error for unknown preset. """
+
+        with self.assertRaises(AssertionError):
+            get_encoding(self.ds, 'smallest')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+
+# Library imports
+import os
+import tempfile
+import numpy as np
+import xarray as xr
+import unittest
+
+from anhalyze.core.file_pool import FilePool
+
+
+class FilePoolTestCase(unittest.TestCase):
+    """ Testing LRU pool of open files.
+    """
+
+    def setUp(self):
+        """ Writing small netCDF files. """
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filenames = []
+        for i in range(3):
+            filename = os.path.join(self.tmp_dir.name, f'file_{i}.nc')
+            xr.Dataset({'var': ('x', np.arange(5.) + i)}).to_netcdf(filename)
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hits_and_evictions(self):
+        """ Testing counters and LRU eviction. """
+
+        pool = FilePool(maxsize=2)
+
+        ds = pool.open_dataset(self.filenames[0])
+        self.assertIs(pool.open_dataset(self.filenames[0]), ds)
+        pool.open_dataset(self.filenames[1])
+        pool.open_dataset(self.filenames[2])
+
+        self.assertEqual(pool.stats, {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 3, 'evictions': 1})
+
+        # Evicted dataset can still be read.
+        self.assertEqual(float(ds['var'].sum()), 10.)
+
+        pool.close()
+        self.assertEqual(len(pool), 0)
+
+    def test_no_pool(self):
+        """ Testing pool is bypassed when maxsize is 0. """
+
+        pool = FilePool(maxsize=0)
+        pool.open_dataset(self.filenames[0])
+
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.misses, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
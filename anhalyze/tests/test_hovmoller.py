@@ -0,0 +1,101 @@
+
+# Library imports
+import os
+import unittest
+
+import numpy as np
+
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_plot_utils import show_hovmoller
+from anhalyze.core.hovmoller import get_cell_areas, get_hovmoller, get_layer_thickness
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class HovmollerTestCase(SyntheticRunTestCase):
+    """ Testing Hovmoller diagrams, one weighted mean profile per file.
+    """
+
+    n_files = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sel_kwargs = {'lat_range': [60, 75], 'lon_range': [-80, -40]}
+
+    def test_cell_areas(self):
+        """ Testing cell areas on a regular 1 degree grid. """
+
+        lon, lat = np.meshgrid(np.arange(0., 5.), np.array([0., 1., 2., 60., 61.]))
+        areas = get_cell_areas(lat, lon)
+
+        self.assertAlmostEqual(areas[1, 2], 111.2 ** 2, delta=20)
+        self.assertAlmostEqual(areas[-1, 2] / areas[1, 2], np.cos(np.radians(61)), delta=0.01)
+
+    def test_depth(self):
+        """ Testing time-depth diagram is the area-weighted mean over wet cells at each depth. """
+
+        hovmoller = get_hovmoller(self.files['gridT'], var='votemper', axis='depth',
+                                  mask_filename=self.files['mask'], **self.sel_kwargs)
+
+        ds = AnhaDataset(self.files['gridT'][1], mask_filename=self.files['mask']).sel(**self.sel_kwargs)
+        var_data = ds._get_var_data_array('votemper').values[0]
+        areas = get_cell_areas(ds.coords['nav_lat'].values, ds.coords['nav_lon'].values)
+        expected = [np.nansum(level * areas) / np.sum(np.where(np.isnan(level), 0, areas)) for level in var_data]
+
+        self.assertEqual(hovmoller.dims, ('time', 'depth'))
+        self.assertEqual(hovmoller.shape, (3, var_data.shape[0]))
+        np.testing.assert_allclose(hovmoller[1], expected, rtol=1e-6)
+
+    def test_lat(self):
+        """ Testing time-latitude diagram bins, and same results in a process pool. """
+
+        hovmoller = get_hovmoller(self.files['gridT'], var='sossheig', axis='lat', bins=1.,
+                                  mask_filename=self.files['mask'], **self.sel_kwargs)
+        edges = hovmoller['lat'].attrs['bin_edges']
+
+        self.assertEqual(hovmoller.shape, (3, len(edges) - 1))
+        np.testing.assert_allclose(np.diff(edges), 1.)
+        np.testing.assert_allclose(hovmoller['lat'], edges[:-1] + 0.5)
+        self.assertTrue(np.isfinite(hovmoller).any())
+
+        pool_hovmoller = get_hovmoller(self.files['gridT'], var='sossheig', axis='lat', bins=1.,
+                                       mask_filename=self.files['mask'], workers=2, **self.sel_kwargs)
+        np.testing.assert_array_equal(pool_hovmoller.values, hovmoller.values)
+
+    def test_layer_thickness(self):
+        """ Testing layer thickness from depth bounds, or from depth levels. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        thickness = get_layer_thickness(ds)
+
+        self.assertEqual(thickness.shape, ds.coords['deptht'].shape)
+        self.assertTrue(np.all(thickness > 0))
+
+        # Without bounds, edges are midpoints between levels and the top level of a depth selection doesn't reach
+        # the surface.
+        ds._xr_dataset = ds._xr_dataset.drop_vars('deptht_bounds')
+        depth = ds.coords['deptht'].values.astype(np.float64)
+        np.testing.assert_allclose(np.cumsum(get_layer_thickness(ds))[:-1], (depth[1:] + depth[:-1]) / 2)
+
+        region_ds = ds.sel(depth_range=[100, 500])
+        region_depth = region_ds.coords['deptht'].values.astype(np.float64)
+        region_thickness = get_layer_thickness(region_ds)
+        self.assertGreater(region_depth.size, 1)
+        self.assertAlmostEqual(region_thickness[0], region_depth[1] - region_depth[0], places=3)
+        self.assertLess(region_thickness[0], region_depth[0])
+
+    def test_show_hovmoller(self):
+        """ Testing diagrams are saved in headless mode. """
+
+        hovmoller = get_hovmoller(self.files['gridT'][:2], var='votemper', axis='lon',
+                                  mask_filename=self.files['mask'], **self.sel_kwargs)
+        savefig = os.path.join(self.tmp_dir.name, 'hovmoller.png')
+
+        # Grid kept for the colormap of the variable.
+        self.assertEqual(hovmoller.attrs['grid'], 'gridT')
+        self.assertEqual(show_hovmoller(hovmoller, savefig=savefig, headless=True), savefig)
+        self.assertGreater(os.path.getsize(savefig), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
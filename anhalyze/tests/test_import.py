@@ -0,0 +1,50 @@
+import subprocess
+import sys
+import unittest
+
+from anhalyze.core.profiling import get_heavy_modules
+
+
+class ImportTestCase(unittest.TestCase):
+    """ Tests for lazy imports of the package.
+    """
+
+    def test_no_heavy_modules(self):
+        """ Heavy dependencies are not loaded by `import anhalyze` or the CLI module.
+        """
+
+        self.assertEqual(get_heavy_modules('anhalyze'), [])
+        self.assertEqual(get_heavy_modules('anhalyze.cli'), [])
+
+    def test_lazy_attributes(self):
+        """ Public objects are loaded on first use.
+        """
+
+        code = ('import sys, anhalyze as ah; ah.AnhaDataset; ah.colocate; import anhalyze.config as config; '
+                'print("xarray" in sys.modules, "AnhaDataset" in dir(ah), "mask" in config.package_data)')
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+
+        self.assertEqual(result.stdout.split(), ['True', 'True', 'True'])
+
+    def test_logging(self):
+        """ Messages are left to the application: no output by default, and propagated to the root logger.
+        """
+
+        code = ('import logging, anhalyze; logger = logging.getLogger("anhalyze"); '
+                'logger.info("message"); print(logger.propagate, type(logger.handlers[0]).__name__)')
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+
+        self.assertEqual(result.stdout.split(), ['True', 'NullHandler'])
+        self.assertEqual(result.stderr, '')
+
+    def test_missing_attribute(self):
+        """ Unknown attributes raise AttributeError.
+        """
+
+        import anhalyze
+        with self.assertRaises(AttributeError):
+            anhalyze.not_an_attribute
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+
+# Library imports
+import os
+import unittest
+
+from anhalyze.core.map_renderer import MapRenderer, load_map_data, render_frames
+from anhalyze.tests import SyntheticRunTestCase
+
+# Region within tiny synthetic files.
+SEL_KWARGS = {'lat_range': [60, 75], 'lon_range': [-80, -40]}
+
+
+class MapRendererTestCase(SyntheticRunTestCase):
+    """ Testing batch rendering of maps, reusing the figure between frames.
+    """
+
+    n_files = 3
+
+    def load(self, filename):
+        return load_map_data(filename, var='votemper', sel_kwargs=SEL_KWARGS, mask_filename=self.files['mask'])
+
+    def test_update(self):
+        """ Testing frames replace plotted data, with a color range kept from the first frame. """
+
+        for color_range in ['local', [-2, 10]]:
+            var_da, attrs = self.load(self.files['gridT'][0])
+            renderer = MapRenderer(var_da, attrs, color_range=color_range)
+            n_artists = len(renderer.ax.get_children())
+            vrange = list(renderer.vrange)
+
+            for filename in self.files['gridT'][1:]:
+                renderer.update(self.load(filename)[0], title=os.path.basename(filename))
+                self.assertEqual(len(renderer.ax.get_children()), n_artists)
+
+            self.assertEqual(list(renderer.vrange), vrange)
+            self.assertEqual(renderer.pcolormesh, isinstance(color_range, list))
+            renderer.close()
+
+    def test_render_frames(self):
+        """ Testing one frame per file, with workers. """
+
+        output_dir = os.path.join(self.tmp_dir.name, 'frames')
+        for workers in [1, 2]:
+            frames = render_frames(self.files['gridT'], output_dir, var='votemper', mask_filename=self.files['mask'],
+                                   color_range='local', workers=workers, dpi=50, **SEL_KWARGS)
+
+            self.assertEqual(len(frames), len(self.files['gridT']))
+            self.assertTrue(all(os.path.getsize(frame) > 0 for frame in frames))
+            self.assertTrue(all(frame.endswith('_votemper.png') for frame in frames))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+
+# Library imports
+import unittest
+
+from anhalyze.core.profiling import MEMORY_BUDGETS, check_memory_budgets
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class MemoryBudgetsTestCase(SyntheticRunTestCase):
+    """ Testing peak memory of `AnhaDataset` operations against reference budgets.
+    """
+
+    def test_budgets(self):
+        """ Testing each operation stays within its peak memory budget. """
+
+        results = check_memory_budgets(self.files)
+
+        self.assertEqual(list(results), list(MEMORY_BUDGETS))
+        for name, (peak, budget, passed) in results.items():
+            with self.subTest(operation=name):
+                self.assertTrue(passed, f'{name}: peak {peak:.2f} x var above budget {budget:.2f}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+
+# Library imports
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import anhalyze
+from anhalyze.core.metrics import Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    """ Testing job counters and timers.
+    """
+
+    def test_counters_and_timers(self):
+        """ Testing counters, timers, and JSON dump. """
+
+        metrics = Metrics()
+        metrics.increment('files_opened')
+        metrics.increment('bytes_read', 100)
+        with metrics.timer('job'):
+            pass
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'metrics.json')
+            metrics.dump(filename)
+            with open(filename) as f:
+                saved = json.load(f)
+
+        self.assertEqual(saved['counters'], {'files_opened': 1, 'bytes_read': 100})
+        self.assertEqual(saved['timers']['job']['calls'], 1)
+
+    def test_merge_since(self):
+        """ Testing metrics of a worker are aggregated. """
+
+        worker = Metrics()
+        worker.increment('files_opened', 2)
+        snapshot = worker.to_dict()
+        worker.increment('files_opened', 3)
+        worker.add_time('job', 2.)
+
+        metrics = Metrics()
+        metrics.increment('files_opened')
+        metrics.merge(worker.since(snapshot))
+
+        self.assertEqual(metrics.counters, {'files_opened': 4})
+        self.assertEqual(metrics.timers['job'], {'calls': 1, 'seconds': 2., 'max_seconds': 2.})
+
+    def test_log_level(self):
+        """ Testing messages are hidden below the log level. """
+
+        logger = logging.getLogger('anhalyze.core.anhalyze')
+        level = logging.getLogger('anhalyze').level
+        try:
+            anhalyze.set_log_level('WARNING')
+            self.assertFalse(logger.isEnabledFor(logging.INFO))
+            with self.assertLogs('anhalyze', level='WARNING') as logs:
+                logger.info('hidden')
+                logger.warning('shown')
+            self.assertEqual(logs.output, ['WARNING:anhalyze.core.anhalyze:shown'])
+        finally:
+            anhalyze.set_log_level(level)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+
+# Library imports
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import matplotlib
+import numpy as np
+import shapefile
+from cartopy import crs as ccrs
+
+from anhalyze.core import natural_earth
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_utils import set_log_level
+from anhalyze.core.file_pool import FILE_POOL
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.synthetic import write_synthetic_run
+
+# James Bay like map extent.
+EXTENT = [-82, -78, 51, 55]
+
+
+def write_shapefile(filename, boxes):
+    """ Writes a polygon shapefile, with one box per [lon_min, lon_max, lat_min, lat_max]. """
+
+    with shapefile.Writer(filename, shapeType=shapefile.POLYGON) as writer:
+        writer.field('name', 'C')
+        for lon_min, lon_max, lat_min, lat_max in boxes:
+            writer.poly([[[lon_min, lat_min], [lon_min, lat_max], [lon_max, lat_max],
+                          [lon_max, lat_min], [lon_min, lat_min]]])
+            writer.record('box')
+
+
+class NaturalEarthTestCase(unittest.TestCase):
+    """ Testing cached Natural Earth geometries, from local shapefiles.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.log_level = logging.getLogger('anhalyze').level
+        set_log_level('ERROR')
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+
+        shapefile_dir = os.path.join(cls.tmp_dir.name, 'natural_earth')
+        os.makedirs(os.path.join(shapefile_dir, 'physical'))
+        # Land around Hudson Bay and far away, ocean over the whole Arctic (cartopy layout).
+        write_shapefile(os.path.join(shapefile_dir, 'ne_50m_land'), [[-85, -75, 45, 52], [100, 120, 10, 20]])
+        write_shapefile(os.path.join(shapefile_dir, 'physical', 'ne_50m_ocean'), [[-180, 180, 40, 90]])
+
+        cls.environ = mock.patch.dict(os.environ, {natural_earth.NATURAL_EARTH_DIR_ENV: shapefile_dir,
+                                                   natural_earth.CACHE_DIR_ENV: os.path.join(cls.tmp_dir.name,
+                                                                                             'cache')})
+        cls.environ.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.environ.stop()
+        natural_earth.clear_cache()
+        set_log_level(cls.log_level)
+        FILE_POOL.close()
+        cls.tmp_dir.cleanup()
+
+    def setUp(self):
+        natural_earth.clear_cache(disk=True)
+        METRICS.reset()
+
+    def test_geometries(self):
+        """ Testing geometries are clipped to the extent, and projected. """
+
+        projection = ccrs.LambertConformal(central_longitude=-80)
+        geometries = natural_earth.get_feature_geometries('land', '50m', projection, EXTENT)
+
+        self.assertEqual(len(geometries), 1)
+        x_min, y_min, x_max, y_max = geometries[0].bounds
+        corners = ccrs.PlateCarree().transform_points(projection, np.array([x_min, x_max]),
+                                                         np.array([y_min, y_max]))
+        self.assertGreaterEqual(corners[:, 0].min(), EXTENT[0] - natural_earth.EXTENT_MARGIN - 1)
+        self.assertLessEqual(corners[:, 0].max(), EXTENT[1] + natural_earth.EXTENT_MARGIN + 1)
+
+        self.assertIsNone(natural_earth.get_feature_geometries('lakes', '50m', projection, EXTENT))
+
+    def test_cache(self):
+        """ Testing geometries are built once, then read from memory or disk. """
+
+        projection = ccrs.NorthPolarStereo()
+        geometries = natural_earth.get_feature_geometries('ocean', '50m', projection, EXTENT)
+
+        self.assertIs(natural_earth.get_feature_geometries('ocean', '50m', projection, EXTENT), geometries)
+        # Close extent within the same rounding step.
+        self.assertIs(natural_earth.get_feature_geometries('ocean', '50m', projection,
+                                                           [-81.9, -78, 51, 54.9]), geometries)
+
+        natural_earth.clear_cache()
+        cached_geometries = natural_earth.get_feature_geometries('ocean', '50m', projection, EXTENT)
+        self.assertTrue(all(cached.equals(geometry) for cached, geometry in zip(cached_geometries, geometries)))
+
+        self.assertEqual(METRICS.counters['geometry_cache_misses'], 1)
+        self.assertEqual(METRICS.counters['geometry_cache_hits'], 3)
+
+        # Other projection.
+        natural_earth.get_feature_geometries('ocean', '50m', ccrs.LambertConformal(), EXTENT)
+        self.assertEqual(METRICS.counters['geometry_cache_misses'], 2)
+
+        # Oldest geometries removed from memory.
+        for lon_min in -100 + 5 * np.arange(natural_earth.GEOMETRIES_CACHE_SIZE):
+            natural_earth.get_feature_geometries('ocean', '50m', projection, [lon_min, lon_min + 4, 51, 55])
+        self.assertEqual(len(natural_earth._GEOMETRIES_CACHE), natural_earth.GEOMETRIES_CACHE_SIZE)
+
+    def test_map(self):
+        """ Testing maps are drawn from local shapefiles only. """
+
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        files = write_synthetic_run(os.path.join(self.tmp_dir.name, 'run'), grids=['gridT'], n_files=1,
+                                    size='tiny')
+        ds = AnhaDataset(files['gridT'][0], mask_filename=files['mask']).sel(lat_range=[60, 75],
+                                                                               lon_range=[-80, -40])
+
+        with mock.patch('cartopy.io.Downloader.acquire_resource', side_effect=AssertionError('download')):
+            ds.show_var_data_map('votemper', savefig=os.path.join(self.tmp_dir.name, 'map.png'))
+        plt.close('all')
+
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name, 'map.png')))
+        self.assertEqual(METRICS.counters['geometry_cache_misses'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
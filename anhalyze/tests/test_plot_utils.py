@@ -0,0 +1,149 @@
+
+# Library imports
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+from cartopy import crs as ccrs
+
+import anhalyze.core.anhalyze_plot_utils as apu
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.options import set_options
+from anhalyze.core.synthetic import get_grid_size, make_grid
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class ProjectionTestCase(unittest.TestCase):
+    """ Testing memoized projections, and cached grid coordinates in projection coordinates.
+    """
+
+    def setUp(self):
+        METRICS.reset()
+        apu._PROJECTED_COORDS_CACHE.clear()
+        ny, nx, _ = get_grid_size('tiny')
+        self.lat, self.lon = make_grid(ny, nx)
+        self.proj_info = apu.get_projection_info({'coord_lon_range': [-80, -40], 'coord_lat_range': [60, 75]})
+
+    def test_get_projection(self):
+        """ Testing projections are built once per projection information. """
+
+        proj_config, y_inline = apu.get_projection('NorthPolarStereo', self.proj_info)
+
+        self.assertIsInstance(proj_config, ccrs.NorthPolarStereo)
+        self.assertTrue(y_inline)
+        self.assertIs(apu.get_projection('NorthPolarStereo', dict(self.proj_info))[0], proj_config)
+        self.assertIsNot(apu.get_projection('LambertConformal', self.proj_info)[0], proj_config)
+
+        with self.assertRaises(AssertionError):
+            apu.get_projection('NotAProjection', self.proj_info)
+
+    def test_projected_coords(self):
+        """ Testing projected coordinates are computed once, and only for grids not wrapped by the projection. """
+
+        projection = apu.get_projection('NorthPolarStereo', self.proj_info)[0]
+        x, y = apu.get_projected_coords(self.lon, self.lat, projection)
+
+        points = projection.transform_points(ccrs.PlateCarree(), self.lon, self.lat)
+        np.testing.assert_allclose(x, points[..., 0])
+        np.testing.assert_allclose(y, points[..., 1])
+
+        self.assertIs(apu.get_projected_coords(self.lon, self.lat, projection)[0], x)
+        self.assertEqual(METRICS.counters['projected_coords_misses'], 1)
+        self.assertEqual(METRICS.counters['projected_coords_hits'], 1)
+
+        # Grid crossing the dateline, wrapped around the boundary of a regional PlateCarree projection.
+        self.assertIsNone(apu.get_projected_coords(self.lon, self.lat,
+                                                   apu.get_projection('PlateCarree', self.proj_info)[0]))
+
+
+class LevelOfDetailTestCase(unittest.TestCase):
+    """ Testing grids are coarsened to the figure resolution, keeping land masked.
+    """
+
+    def test_coarsen_data(self):
+        """ Testing block means exclude land, and blocks mostly on land are masked. """
+
+        var_data = np.arange(25, dtype=float).reshape(5, 5)
+        var_data[:2, :2] = [[np.nan, np.nan], [np.nan, 3]]
+        var_data[2:4, 2:4] = [[np.nan, 1], [1, 1]]
+
+        coarse = apu.coarsen_data(var_data, 2)
+
+        self.assertEqual(coarse.shape, (3, 3))
+        self.assertTrue(np.isnan(coarse[0, 0]))
+        self.assertEqual(coarse[1, 1], 1)
+        # Smaller blocks at the edges.
+        self.assertEqual(coarse[2, 2], 24)
+        self.assertEqual(coarse[0, 2], np.mean([4, 9]))
+
+    def test_coarsen_coords(self):
+        """ Testing geographic block means across the dateline. """
+
+        lon, lat = np.meshgrid([179, -179, 178, -178], [60, 62])
+        coarse_lon, coarse_lat = apu.coarsen_coords(lon, lat, 2, geographic=True)
+
+        np.testing.assert_allclose(np.abs(coarse_lon), 180, atol=1e-6)
+        np.testing.assert_allclose(coarse_lat, 61, atol=0.1)
+
+        x, y = apu.coarsen_coords(lon, lat, 2)
+        np.testing.assert_allclose(x, [[0, 0]])
+
+    def test_lod_factor(self):
+        """ Testing grids are only coarsened when finer than the figure resolution. """
+
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(4, 3), dpi=100)
+        ax = fig.add_subplot(1, 1, 1, projection=ccrs.NorthPolarStereo())
+
+        self.assertEqual(apu.get_lod_factor(ax, (100, 100), dpi=100), 1)
+        self.assertEqual(apu.get_lod_factor(ax, (2400, 1632), dpi=100), 8)
+        self.assertEqual(apu.get_lod_factor(ax, (2400, 1632), dpi=400), 2)
+
+
+class HeadlessTestCase(SyntheticRunTestCase):
+    """ Testing maps saved without display, on a figure reused between maps.
+    """
+
+    def test_headless(self):
+        """ Testing maps are saved with the given format, without pyplot figures left open. """
+
+        import matplotlib.pyplot as plt
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask']).sel(lat_range=[60, 75],
+                                                                                      lon_range=[-80, -40])
+        n_figures = len(plt.get_fignums())
+
+        with set_options(headless=True):
+            for image_format in ['png', 'jpg']:
+                savefig = os.path.join(self.tmp_dir.name, f'map.{image_format}')
+                self.assertEqual(ds.show_var_data_map('votemper', savefig=savefig, dpi=50), savefig)
+                self.assertGreater(os.path.getsize(savefig), 0)
+
+            # Figure reused, and cleared after saving.
+            fig = apu.get_headless_figure()
+            self.assertIs(apu.get_headless_figure(), fig)
+            self.assertEqual(fig.axes, [])
+            self.assertEqual(len(plt.get_fignums()), n_figures)
+
+            with self.assertRaises(AssertionError):
+                ds.show_var_data_map('votemper')
+
+    def test_lod_dpi(self):
+        """ Testing level of detail is computed for the resolution of the saved figure. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        savefig = os.path.join(self.tmp_dir.name, 'map_dpi.png')
+
+        with set_options(headless=True), mock.patch.object(apu, 'get_lod_factor', wraps=apu.get_lod_factor) as lod:
+            ds.show_var_data_map('votemper', savefig=savefig, dpi=50)
+            self.assertEqual(lod.call_args.kwargs['dpi'], 50)
+
+            ds.show_var_data_map('votemper', savefig=savefig, full_resolution=True)
+            self.assertEqual(lod.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
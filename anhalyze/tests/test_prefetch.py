@@ -0,0 +1,55 @@
+
+# Library imports
+import threading
+import time
+import unittest
+
+from anhalyze.core.prefetch import Prefetcher
+
+
+class PrefetcherTestCase(unittest.TestCase):
+    """ Testing background prefetch of files.
+    """
+
+    def test_order_and_read_ahead(self):
+        """ Testing files are yielded in order, and read ahead up to depth. """
+
+        loaded = []
+
+        def loader(filename):
+            loaded.append(filename)
+            return filename.upper()
+
+        file_list = [f'file_{i}' for i in range(6)]
+        output = []
+        for filename, data in Prefetcher(file_list, loader=loader, depth=2):
+            # Wait for the background thread to fill the queue.
+            time.sleep(0.05)
+            self.assertLessEqual(len(loaded), len(output) + 3)
+            output.append((filename, data))
+
+        self.assertEqual(output, [(f, f.upper()) for f in file_list])
+
+    def test_error(self):
+        """ Testing loader errors are raised in the main thread. """
+
+        def loader(filename):
+            raise IOError(filename)
+
+        with self.assertRaises(IOError):
+            for _ in Prefetcher(['file_0', 'file_1'], loader=loader):
+                pass
+
+    def test_early_stop(self):
+        """ Testing background thread stops when leaving the loop. """
+
+        prefetcher = Prefetcher([f'file_{i}' for i in range(10)], loader=lambda f: f)
+        for _ in prefetcher:
+            break
+
+        self.assertFalse(prefetcher._thread.is_alive())
+        self.assertNotIn(prefetcher._thread, threading.enumerate())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+
+# Library imports
+import unittest
+
+from anhalyze.core import profiling
+
+
+class ProfilingTestCase(unittest.TestCase):
+    """ Testing phase-level instrumentation.
+    """
+
+    def tearDown(self):
+        profiling.disable_profiling()
+        profiling.get_stats().reset()
+
+    def test_disabled(self):
+        """ Testing nothing is recorded unless enabled. """
+
+        with profiling.phase('test'):
+            pass
+
+        self.assertNotIn('test', profiling.get_stats())
+
+    def test_phase(self):
+        """ Testing calls, time and allocations are recorded. """
+
+        @profiling.profile_phase('test.function')
+        def function():
+            return [0] * 100000
+
+        profiling.enable_profiling(allocations=True)
+        for _ in range(3):
+            function()
+
+        stats = profiling.get_stats()['test.function']
+        self.assertEqual(stats['calls'], 3)
+        self.assertGreater(stats['seconds'], 0)
+        self.assertGreaterEqual(stats['allocated'], 0)
+
+    def test_merge(self):
+        """ Testing stats from several workers are aggregated. """
+
+        worker_stats = [profiling.PhaseStats({'init': {'calls': 2, 'seconds': 1., 'bytes_read': 10}}),
+                        {'init': {'calls': 1, 'seconds': .5, 'bytes_read': 5}, 'sel': {'calls': 1, 'seconds': .1}}]
+
+        stats = profiling.PhaseStats()
+        for worker in worker_stats:
+            stats.merge(worker)
+
+        self.assertEqual(stats['init'], {'calls': 3, 'seconds': 1.5, 'bytes_read': 15, 'allocated': 0, 'peak': 0})
+        self.assertEqual(stats.to_dataframe().loc['sel', 'calls'], 1)
+
+    def test_memory(self):
+        """ Testing peak memory and temporaries are attributed to nested phases. """
+
+        @profiling.profile_phase('test.temporary')
+        def temporary():
+            return len(bytearray(10 ** 7))
+
+        @profiling.profile_phase('test.outer')
+        def outer():
+            temporary()
+            return bytearray(10 ** 6)
+
+        with profiling.trace_memory():
+            outer()
+
+        self.assertFalse(profiling.is_enabled())
+        self.assertGreaterEqual(profiling.get_stats()['test.outer']['peak'], 10 ** 7)
+
+        report = profiling.get_memory_report()
+        self.assertEqual(report['phase'].iloc[0], 'test.temporary')
+        self.assertIn('(outer)', report['caller'].iloc[0])
+        self.assertGreaterEqual(report['temporary'].iloc[0], 10 ** 7)
+
+        outer_report = report.set_index('phase').loc['test.outer']
+        self.assertGreaterEqual(outer_report['retained'], 10 ** 6)
+        self.assertLess(outer_report['retained'], 2 * 10 ** 6)
+
+    def test_measure_peak(self):
+        """ Testing peak and retained memory of a function. """
+
+        output, peak, retained = profiling.measure_peak(lambda n: len(bytearray(n)), 10 ** 7)
+
+        self.assertEqual(output, 10 ** 7)
+        self.assertGreaterEqual(peak, 10 ** 7)
+        self.assertLess(retained, 10 ** 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
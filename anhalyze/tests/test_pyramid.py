@@ -0,0 +1,82 @@
+
+# Library imports
+import os
+import unittest
+
+import numpy as np
+
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.pyramid import build_pyramid, coarsen_dataset, find_pyramid_level, get_pyramid_path
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class PyramidTestCase(SyntheticRunTestCase):
+    """ Testing coarsened levels of files, and reading them with `AnhaDataset(resolution=...)`.
+    """
+
+    n_files = 2
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.levels = build_pyramid(cls.files['gridT'], variables=['votemper', 'sossheig'], factors=[2, 4],
+                                   mask_filename=cls.files['mask'])
+
+    def test_coarsen_dataset(self):
+        """ Testing block means over wet cells, with blocks mostly on land masked. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        level = coarsen_dataset(ds, 2, variables=['votemper'])
+
+        var_data = ds._get_var_data_array('votemper').values[0, 0, :2, :2]
+        wet = ds.data_vars['mask'].values[0, :2, :2] == 1
+
+        self.assertAlmostEqual(float(level['wet_fraction'][0, 0, 0]), wet.mean())
+        self.assertEqual(int(level['mask'][0, 0, 0]), int(wet.mean() >= 0.5))
+        if wet.mean() >= 0.5:
+            self.assertAlmostEqual(float(level['votemper'][0, 0, 0, 0]), np.nanmean(var_data), places=5)
+        else:
+            self.assertTrue(np.isnan(level['votemper'][0, 0, 0, 0]))
+
+        self.assertEqual(level['votemper'].shape[-2:], (40, 28))
+        self.assertNotIn('sossheig', level)
+
+    def test_resolution(self):
+        """ Testing levels are read with their own mask, and native grid if missing. """
+
+        self.assertEqual(len(self.levels), 4)
+        self.assertEqual(self.levels[1], get_pyramid_path(self.files['gridT'][0], 4))
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        coarse_ds = AnhaDataset(self.files['gridT'][0], resolution=4)
+        var_data = ds._get_var_data_array('votemper').values
+        coarse_data = coarse_ds._get_var_data_array('votemper').values
+
+        self.assertEqual(coarse_ds.attrs['resolution'], 4)
+        self.assertEqual(coarse_data.shape[-2:], (20, 14))
+        np.testing.assert_allclose(np.nanmean(coarse_data), np.nanmean(var_data), rtol=1e-2)
+
+        # Region selection on the coarse grid.
+        region_ds = coarse_ds.sel(lat_range=[50, 80], lon_range=[-100, -20])
+        self.assertEqual(region_ds.attrs['resolution'], 4)
+        self.assertLess(region_ds._get_var_data_array('votemper').shape[-1], coarse_data.shape[-1])
+
+        native_ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'], resolution=8)
+        self.assertEqual(native_ds.attrs['resolution'], 1)
+        self.assertEqual(native_ds.attrs['filename'], os.path.basename(self.files['gridT'][0]))
+
+    def test_out_of_date(self):
+        """ Testing levels of modified files are not used. """
+
+        filename = os.path.join(self.tmp_dir.name, 'ANHA4-SYN001_y1981m01d05_gridT.nc')
+        with open(self.files['gridT'][0], 'rb') as src, open(filename, 'wb') as dst:
+            dst.write(src.read())
+        build_pyramid([filename], variables=['sossheig'], factors=[2], mask_filename=self.files['mask'])
+        self.assertIsNotNone(find_pyramid_level(filename, 2))
+
+        os.utime(filename, ns=(0, 0))
+        self.assertIsNone(find_pyramid_level(filename, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
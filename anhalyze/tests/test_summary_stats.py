@@ -0,0 +1,109 @@
+
+# Library imports
+import os
+import unittest
+
+import numpy as np
+
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_plot_utils import get_plot_config
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.summary_stats import (build_summary_stats, get_run_stats, get_sidecar_path, get_summary_stats,
+                                         read_summary_stats)
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class SummaryStatsTestCase(SyntheticRunTestCase):
+    """ Testing summary statistics sidecars, and their use for color ranges.
+    """
+
+    n_files = 2
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sidecars = build_summary_stats(cls.files['gridT'], mask_filename=cls.files['mask'])
+
+    def open(self, filename=None):
+        return AnhaDataset(filename or self.files['gridT'][0], mask_filename=self.files['mask'])
+
+    def test_stats(self):
+        """ Testing per-level and combined statistics match the masked data. """
+
+        self.assertTrue(all(os.path.isfile(sidecar) for sidecar in self.sidecars))
+        self.assertEqual(self.sidecars[0], get_sidecar_path(self.files['gridT'][0]))
+
+        var_data = self.open()._get_var_data_array('votemper').values
+        stats = get_summary_stats(self.files['gridT'][0], 'votemper', mask_filename=self.files['mask'])
+        top_stats = get_summary_stats(self.files['gridT'][0], 'votemper', level=0, mask_filename=self.files['mask'])
+
+        self.assertAlmostEqual(stats['min'], np.nanmin(var_data), places=5)
+        self.assertAlmostEqual(stats['max'], np.nanmax(var_data), places=5)
+        self.assertAlmostEqual(stats['mean'], np.nanmean(var_data), places=4)
+        self.assertEqual(stats['count'], np.isfinite(var_data).sum())
+        self.assertAlmostEqual(stats['nonzero_min'], np.nanmin(np.abs(var_data[var_data != 0])), places=5)
+        self.assertAlmostEqual(top_stats['max'], np.nanmax(var_data[:, 0]), places=5)
+
+        # Run-wide statistics.
+        run_stats = get_run_stats(self.files['gridT'], 'votemper', level=0, mask_filename=self.files['mask'])
+        self.assertEqual(run_stats['max'], max(get_summary_stats(filename, 'votemper', level=0,
+                                                                 mask_filename=self.files['mask'])['max']
+                                               for filename in self.files['gridT']))
+        self.assertIsNone(get_run_stats(self.files['gridT'], 'not_a_variable', mask_filename=self.files['mask']))
+
+    def test_out_of_date(self):
+        """ Testing sidecars of modified files are not used. """
+
+        filename = os.path.join(self.tmp_dir.name, 'ANHA4-SYN001_y1981m01d05_gridT.nc')
+        with open(self.files['gridT'][0], 'rb') as src, open(filename, 'wb') as dst:
+            dst.write(src.read())
+        build_summary_stats([filename], variables=['sossheig'], mask_filename=self.files['mask'])
+        self.assertIsNotNone(read_summary_stats(filename, mask_filename=self.files['mask']))
+
+        os.utime(filename, ns=(0, 0))
+        self.assertIsNone(read_summary_stats(filename, mask_filename=self.files['mask']))
+
+    def test_mask_variables(self):
+        """ Testing sidecars of another mask are not used, and missing variables are added. """
+
+        filename = os.path.join(self.tmp_dir.name, 'ANHA4-SYN001_y1981m02d05_gridT.nc')
+        mask_filename = os.path.join(self.tmp_dir.name, 'other_mask.nc')
+        for src_filename, dst_filename in [(self.files['gridT'][0], filename), (self.files['mask'], mask_filename)]:
+            with open(src_filename, 'rb') as src, open(dst_filename, 'wb') as dst:
+                dst.write(src.read())
+
+        build_summary_stats([filename], variables=['sossheig'], mask_filename=self.files['mask'])
+        self.assertIsNone(read_summary_stats(filename, mask_filename=mask_filename))
+        self.assertIsNone(get_summary_stats(filename, 'sossheig'))
+
+        build_summary_stats([filename], variables=['sossheig'], mask_filename=mask_filename)
+        self.assertEqual(read_summary_stats(filename, mask_filename=mask_filename)['mask']['filename'],
+                         'other_mask.nc')
+
+        METRICS.reset()
+        build_summary_stats([filename], variables=['sossheig', 'votemper'], mask_filename=mask_filename)
+        sidecar = read_summary_stats(filename, mask_filename=mask_filename)
+        self.assertEqual(set(sidecar['variables']), {'sossheig', 'votemper'})
+        self.assertFalse(sidecar['all_variables'])
+        self.assertEqual(METRICS.counters['stats_sidecars_written'], 1)
+
+        build_summary_stats([filename], mask_filename=mask_filename)
+        self.assertTrue(read_summary_stats(filename, mask_filename=mask_filename)['all_variables'])
+
+    def test_color_range(self):
+        """ Testing local color ranges from sidecars, for full domain datasets only. """
+
+        ds = self.open()
+        stats = ds._get_summary_stats('votemper', level=0)
+        var_data = ds._get_map_data_array('votemper').values
+
+        self.assertIsNotNone(stats)
+        self.assertIsNone(ds.sel(lat_range=[60, 75], lon_range=[-80, -40])._get_summary_stats('votemper', level=0))
+
+        vrange = get_plot_config('votemper', var_data, grid='gridT', color_range='local')[1]
+        np.testing.assert_allclose(get_plot_config('votemper', None, grid='gridT', color_range='local',
+                                                   stats=stats)[1], vrange, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+
+# Library imports
+import os
+import unittest
+
+import numpy as np
+
+from anhalyze.core.anhalyze import AnhaDataset, get_date
+from anhalyze.core.anhalyze_run import get_timeseries
+from anhalyze.core.synthetic import GRID_VARIABLES
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class SyntheticTestCase(SyntheticRunTestCase):
+    """ Testing synthetic ANHA files, and `AnhaDataset` on them.
+    """
+
+    grids = list(GRID_VARIABLES)
+    n_files = 3
+
+    def test_filenames(self):
+        """ Testing filename pattern and dates every 5 days. """
+
+        self.assertEqual(os.path.basename(self.files['gridT'][0]), 'ANHA4-SYN001_y1980m01d05_gridT.nc')
+        self.assertEqual([get_date(f, how='d') for f in self.files['icemod']], [5, 10, 15])
+
+    def test_open_grids(self):
+        """ Testing each grid opens, with land masked. """
+
+        for grid, variables in GRID_VARIABLES.items():
+            ds = AnhaDataset(self.files[grid][0], mask_filename=self.files['mask'])
+            self.assertEqual(ds.attrs['grid'], grid)
+            self.assertEqual(ds.attrs['model_case'], 'SYN001')
+            self.assertGreater(ds.attrs['coord_lat_range'][1], 89)
+
+            for var in variables:
+                var_data = ds._get_var_data_array(var).values
+                self.assertTrue(np.isnan(var_data).any())
+                self.assertTrue(np.isfinite(var_data).any())
+
+    def test_sel(self):
+        """ Testing selection on the curvilinear grid. """
+
+        ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        region = ds.sel(lat_range=[60, 75], lon_range=[-80, -40], depth_range=[0, 500])
+
+        lat = region.coords['nav_lat'].values
+        self.assertLess(region._xr_dataset.sizes['y'], ds._xr_dataset.sizes['y'])
+        self.assertTrue(((lat > 55) & (lat < 80)).any())
+        self.assertLessEqual(region.coords['deptht'].values.max(), 500)
+
+    def test_timeseries(self):
+        """ Testing run-level function over synthetic files. """
+
+        timeseries = get_timeseries(self.files['gridT'], var='votemper', lat_range=[60, 75], lon_range=[-80, -40],
+                                    mask_filename=self.files['mask'])
+
+        self.assertEqual(len(timeseries), 3)
+        self.assertTrue(((timeseries['var_mean'] > -2) & (timeseries['var_mean'] < 30)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+
+# Library imports
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.tile_server import TileCache, get_tile_coords, get_zoom_factor, make_tile_server
+from anhalyze.tests import SyntheticRunTestCase
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class TileCoordsTestCase(unittest.TestCase):
+    """ Testing tile pixel coordinates and zoom levels.
+    """
+
+    def test_tile_coords(self):
+        """ Testing Web Mercator tiles cover the world, from the north. """
+
+        lat, lon = get_tile_coords(0, 0, 0, size=4)
+
+        np.testing.assert_allclose(lon[0], [-135, -45, 45, 135])
+        self.assertTrue(np.all(np.diff(lat[:, 0]) < 0))
+        self.assertAlmostEqual(lat[0, 0], -lat[-1, 0])
+        self.assertLess(lat[0, 0], 85.06)
+
+        with self.assertRaises(AssertionError):
+            get_tile_coords(1, 2, 0)
+
+    def test_zoom_factor(self):
+        """ Testing grids are coarsened at low zoom levels only. """
+
+        self.assertEqual(get_zoom_factor(10., 0., 0), 2 ** 3)
+        self.assertEqual(get_zoom_factor(10., 60., 0), 2 ** 2)
+        self.assertEqual(get_zoom_factor(10., 60., 5), 1)
+
+
+class TileCacheTestCase(unittest.TestCase):
+    """ Testing on-disk LRU cache of tiles.
+    """
+
+    def test_lru(self):
+        """ Testing least recently used tiles are removed, also after indexing the cache again. """
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = TileCache(cache_dir, max_size=250)
+            for key in ['aa1', 'bb2', 'cc3']:
+                cache.put(key, bytes(100))
+                os.utime(os.path.join(cache_dir, key[:2], f'{key}.png'), ns=(0, len(cache) * 10 ** 9))
+
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get('aa1'))
+            self.assertEqual(cache.get('bb2'), bytes(100))
+
+            cache.put('dd4', bytes(100))
+            self.assertIsNone(cache.get('cc3'))
+            self.assertEqual(cache.size, 200)
+
+            # Most recently used tiles kept when the cache is smaller.
+            cache = TileCache(cache_dir, max_size=150)
+            self.assertEqual(len(cache), 1)
+            self.assertIsNotNone(cache.get('dd4'))
+
+
+class TileServerTestCase(SyntheticRunTestCase):
+    """ Testing tiles served over HTTP, rendered once and then read from the tile cache.
+    """
+
+    n_files = 2
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = make_tile_server(cls.files['gridT'], variables=['votemper'], mask_filename=cls.files['mask'],
+                                      port=0, cache_dir=os.path.join(cls.tmp_dir.name, 'tiles'))
+        cls.url = 'http://{}:{}'.format(*cls.server.server_address[:2])
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def get(self, path):
+        with urllib.request.urlopen(self.url + path) as response:
+            return response.read()
+
+    def test_tiles(self):
+        """ Testing tiles are PNG images, rendered once per date. """
+
+        METRICS.reset()
+        index = json.loads(self.get('/index.json'))
+        self.assertEqual(index['variables'], ['votemper'])
+        self.assertEqual(len(index['dates']), 2)
+
+        tiles = [self.get(f'/votemper/{date}/2/1/0.png') for date in index['dates'] + index['dates'][:1]]
+
+        self.assertTrue(all(tile.startswith(PNG_SIGNATURE) for tile in tiles))
+        self.assertEqual(tiles[2], tiles[0])
+        self.assertEqual(METRICS.counters['tiles_rendered'], 2)
+        self.assertEqual(METRICS.counters['tile_cache_hits'], 1)
+
+    def test_errors(self):
+        """ Testing unknown variables, dates or tiles are not found. """
+
+        date = json.loads(self.get('/index.json'))['dates'][0]
+        for path, status in [('/vosaline/{}/0/0/0.png', 404), ('/votemper/y1800m01d05/0/0/0.png', 404),
+                             ('/votemper/{}/1/2/0.png', 400), ('/votemper/{}/0/0', 404)]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(path.format(date))
+            self.assertEqual(context.exception.code, status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+
+# Library imports
+import os
+import unittest
+
+import numpy as np
+
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_colocation import EARTH_RADIUS_KM
+from anhalyze.core.anhalyze_plot_utils import show_section
+from anhalyze.core.metrics import METRICS
+import anhalyze.core.transect as transect_module
+from anhalyze.core.transect import get_great_circle_points, get_section, get_transect
+from anhalyze.tests import SyntheticRunTestCase
+
+# Waypoints within the synthetic grid.
+WAYPOINTS = [(60, 165), (70, 140), (70, 100)]
+
+
+class GreatCircleTestCase(unittest.TestCase):
+    """ Testing points along great-circle segments.
+    """
+
+    def test_points(self):
+        """ Testing points are evenly spaced on each segment, waypoints included. """
+
+        lat, lon, distance, waypoint_distance = get_great_circle_points(np.array([[0, 0], [0, 10], [0, 10]]), 100.)
+        length = np.deg2rad(10) * EARTH_RADIUS_KM
+
+        np.testing.assert_allclose(lat, 0, atol=1e-9)
+        np.testing.assert_allclose(lon[[0, -1]], [0, 10])
+        np.testing.assert_allclose(waypoint_distance, [0, length, length])
+        np.testing.assert_allclose(np.diff(distance[:-1]), length / 12)
+        self.assertEqual(len(lat), 12 + 1 + 1)
+
+
+class TransectTestCase(SyntheticRunTestCase):
+    """ Testing interpolation weights of transects, and vertical sections.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ds = AnhaDataset(cls.files['gridT'][0], mask_filename=cls.files['mask'])
+        cls.lat = cls.ds.coords['nav_lat'].values
+        cls.lon = cls.ds.coords['nav_lon'].values
+
+    def test_weights(self):
+        """ Testing bilinear weights sum to 1, and interpolate grid coordinates at transect points. """
+
+        transect = get_transect(self.lat, self.lon, WAYPOINTS)
+
+        np.testing.assert_allclose(transect.weights.sum(axis=1), 1)
+        self.assertLessEqual(transect.weights.getnnz(axis=1).max(), 4)
+        np.testing.assert_allclose(transect.interp(self.lat), transect.lat, atol=0.05)
+        np.testing.assert_allclose(transect.interp(self.lon[transect.window]), transect.lon, atol=0.05)
+
+        # Points outside the grid have no values.
+        partly_outside = get_transect(self.lat, self.lon, [(70, 100), (-60, 100)], spacing=500.)
+        self.assertTrue(np.isnan(partly_outside.interp(self.lat)[-1]))
+        with self.assertRaises(AssertionError):
+            get_transect(self.lat, self.lon, [(-60, 0), (-50, 10)])
+
+    def test_cache(self):
+        """ Testing oldest transects are removed from the cache. """
+
+        transect_module._TRANSECT_CACHE.clear()
+        for spacing in 100. + np.arange(transect_module.TRANSECT_CACHE_SIZE + 1):
+            get_transect(self.lat, self.lon, WAYPOINTS, spacing=spacing)
+
+        self.assertEqual(len(transect_module._TRANSECT_CACHE), transect_module.TRANSECT_CACHE_SIZE)
+
+        METRICS.reset()
+        get_transect(self.lat, self.lon, WAYPOINTS, spacing=100.)
+        self.assertEqual(METRICS.counters['transect_misses'], 1)
+
+    def test_section(self):
+        """ Testing weights are computed once per grid and waypoints, with masked cells excluded. """
+
+        METRICS.reset()
+        section = get_section(self.ds, 'votemper', WAYPOINTS, spacing=50.)
+        get_section(self.ds, 'vosaline', WAYPOINTS, spacing=50.)
+
+        transect = get_transect(self.lat, self.lon, WAYPOINTS, spacing=50.)
+        expected = transect.interp(self.ds._get_var_data_array('votemper').values[0])
+
+        self.assertEqual(section.dims, ('depth', 'distance'))
+        self.assertEqual(section.shape, (self.ds.coords['deptht'].size, len(transect.lat)))
+        np.testing.assert_allclose(section.values, expected)
+        self.assertTrue(np.isnan(section.values[-1]).any())
+        self.assertEqual(METRICS.counters['transect_misses'], 1)
+        self.assertEqual(METRICS.counters['transect_hits'], 2)
+
+        self.assertEqual(get_section(self.ds, 'sossheig', WAYPOINTS).dims, ('distance',))
+
+    def test_show_section(self):
+        """ Testing sections are saved in headless mode. """
+
+        savefig = os.path.join(self.tmp_dir.name, 'section.png')
+        section = get_section(self.ds, 'votemper', WAYPOINTS)
+
+        # Grid kept for the colormap of the variable.
+        self.assertEqual(section.attrs['grid'], 'gridT')
+        self.assertEqual(show_section(section, savefig=savefig, headless=True), savefig)
+        self.assertGreater(os.path.getsize(savefig), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+
+# Library imports
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from anhalyze.core.anhalyze_run import get_climatology, get_timeseries
+from anhalyze.core.file_pool import open_dataset
+from anhalyze.core.metrics import METRICS
+from anhalyze.core.zarr_mirror import build_zarr_mirror, find_mirror, open_mirror, open_run_dataset
+from anhalyze.tests import SyntheticRunTestCase
+
+
+class ZarrMirrorTestCase(SyntheticRunTestCase):
+    """ Testing Zarr mirrors of a run, and run-level functions reading from them.
+    """
+
+    n_files = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sel_kwargs = {'lat_range': [60, 75], 'lon_range': [-80, -40]}
+
+    def setUp(self):
+        # Small chunks, so that copies and reads span several chunks.
+        self.mirror_path = build_zarr_mirror(self.files['gridT'], variables=['votemper', 'sossheig'],
+                                             time_chunk=2, spatial_chunk=(16, 16))
+
+    def test_build(self):
+        """ Testing mirror values are the values of the files, one time chunk written per task. """
+
+        METRICS.reset()
+        build_zarr_mirror(self.files['gridT'], variables=['votemper', 'sossheig'], time_chunk=2,
+                          spatial_chunk=(16, 16))
+        self.assertEqual(METRICS.counters['mirror_chunks_written'], 2 * 3)
+
+        mirror = open_mirror(self.mirror_path)
+        self.assertEqual(mirror['votemper'].encoding['preferred_chunks']['time_counter'], 2)
+        for i, filename in enumerate(self.files['gridT']):
+            for var in ['votemper', 'sossheig']:
+                np.testing.assert_array_equal(mirror[var][i].values,
+                                              open_dataset(filename)[var][0].values.astype('float32'))
+
+        ds = open_run_dataset(self.files['gridT'][1:3], ['sossheig'], indexers={'y': 10, 'x': slice(5, 8)})
+        self.assertEqual(ds['sossheig'].shape, (2, 3))
+
+    def test_run_functions(self):
+        """ Testing time series and climatology from the mirror are the same as from files. """
+
+        METRICS.reset()
+        for var in ['votemper', 'sossheig']:
+            timeseries = get_timeseries(self.files['gridT'], var=var, mask_filename=self.files['mask'],
+                                        **self.sel_kwargs)
+            pd.testing.assert_frame_equal(timeseries,
+                                          get_timeseries(self.files['gridT'], var=var, use_mirror=False,
+                                                         mask_filename=self.files['mask'], **self.sel_kwargs),
+                                          rtol=1e-6)
+
+        climatology = get_climatology(self.files['gridT'], mask_filename=self.files['mask'], **self.sel_kwargs)
+        file_climatology = get_climatology(self.files['gridT'], use_mirror=False, mask_filename=self.files['mask'],
+                                           **self.sel_kwargs)
+        np.testing.assert_allclose(climatology.values, file_climatology.values, rtol=1e-6)
+        np.testing.assert_array_equal(climatology['count'], file_climatology['count'])
+        self.assertEqual(METRICS.counters['mirror_hits'], 3)
+
+    def test_stale(self):
+        """ Testing files changed since the mirror was built are read instead of the mirror. """
+
+        self.assertIsNotNone(find_mirror(self.files['gridT'], ['votemper']))
+        self.assertIsNone(find_mirror(self.files['gridT'], ['vosaline']))
+
+        stat = os.stat(self.files['gridT'][2])
+        os.utime(self.files['gridT'][2], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        METRICS.reset()
+        self.assertIsNone(find_mirror(self.files['gridT'], ['votemper']))
+        timeseries = get_timeseries(self.files['gridT'], mask_filename=self.files['mask'], **self.sel_kwargs)
+        self.assertEqual(len(timeseries), len(self.files['gridT']))
+        self.assertEqual(METRICS.counters['mirror_misses'], 2)
+        self.assertNotIn('mirror_hits', METRICS.counters)
+
+    def test_dtype(self):
+        """ Testing variables keep the type of the files, so results are the same with or without mirror. """
+
+        run_dir = os.path.join(self.tmp_dir.name, 'dtype')
+        os.makedirs(run_dir)
+        file_list = []
+        for filename in self.files['gridT']:
+            with xr.open_dataset(filename) as ds:
+                ds = ds.assign(sossheig=ds['sossheig'].astype('float64'),
+                               somxl010=ds['somxl010'].fillna(0).astype('int32'))
+                file_list.append(os.path.join(run_dir, os.path.basename(filename)))
+                ds.to_netcdf(file_list[-1])
+
+        mirror = open_mirror(build_zarr_mirror(file_list, variables=['sossheig', 'somxl010']))
+        for var, dtype in [('sossheig', 'float64'), ('somxl010', 'int32')]:
+            self.assertEqual(mirror[var].dtype, dtype)
+            for i, filename in enumerate(file_list):
+                np.testing.assert_array_equal(mirror[var][i].values, open_dataset(filename)[var][0].values)
+
+        pd.testing.assert_frame_equal(get_timeseries(file_list, var='sossheig', mask_filename=self.files['mask']),
+                                      get_timeseries(file_list, var='sossheig', use_mirror=False,
+                                                     mask_filename=self.files['mask']))
+
+
+if __name__ == '__main__':
+    unittest.main()
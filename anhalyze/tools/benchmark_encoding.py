@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# System-related libraries
+import argparse
+import os
+import tempfile
+import time
+
+# Project custom-made libraries
+import anhalyze as ah
+from anhalyze.core.encoding import ENCODING_PRESETS
+
+
+def main():
+    """ Benchmark of `AnhaDataset.to_netcdf` write throughput and file size for each encoding preset.
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('filename', help='ANHA file, e.g. ANHA4-WLS001_y1980m01d05_gridT.nc')
+    parser.add_argument('--lat-range', nargs=2, type=float, default=None, help='Latitude range of cut')
+    parser.add_argument('--lon-range', nargs=2, type=float, default=None, help='Longitude range of cut')
+    parser.add_argument('--mask-filename', default=None, help='Mask filename')
+    args = parser.parse_args()
+
+    ds = ah.AnhaDataset(args.filename, mask_filename=args.mask_filename)
+    if args.lat_range or args.lon_range:
+        ds = ds.sel(lat_range=args.lat_range, lon_range=args.lon_range)
+
+    # Reading data first, so only writing is timed.
+    ds.load()
+    ah.set_log_level('WARNING')
+    n_bytes = ds._xr_dataset.nbytes
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for preset in [None] + list(ENCODING_PRESETS):
+            start = time.perf_counter()
+            ds.to_netcdf(path=tmp_dir, suffix=f'_{preset}', preset=preset)
+            elapsed = time.perf_counter() - start
+
+            size = os.path.getsize(os.path.join(tmp_dir, ds._xr_dataset.attrs['filename']))
+            print(f'[Anhalyze] {str(preset):>12}: {elapsed:.3f} s, {n_bytes / elapsed / 1e6:8.1f} MB/s, '
+                  f'{size / 1e6:8.2f} MB, ratio {n_bytes / size:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
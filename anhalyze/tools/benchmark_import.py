@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# System-related libraries
+import argparse
+import statistics
+import sys
+
+
+def main():
+    """ Benchmark of package import time, with `python -X importtime`, compared with
+        `anhalyze.core.profiling.IMPORT_TIME_TARGETS`.
+        Returns a non-zero exit code if a target is missed or heavy dependencies are imported.
+    """
+
+    from anhalyze.core.profiling import IMPORT_TIME_TARGETS, get_heavy_modules, get_import_times
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('modules', nargs='*', default=list(IMPORT_TIME_TARGETS),
+                        help=f'Modules to import (default: {list(IMPORT_TIME_TARGETS)})')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of repeats (default: 5)')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest imports shown (default: 10)')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [get_import_times(module) for _ in range(args.repeat)]
+        median = statistics.median(run[module] for run in runs)
+        target = IMPORT_TIME_TARGETS.get(module)
+        heavy = get_heavy_modules(module)
+
+        status = 'ok' if (target is None or median <= target) and not heavy else 'FAILED'
+        failed |= status == 'FAILED'
+
+        print(f'[Anhalyze] import {module}: median {median:.1f} ms (target: {target} ms) -> {status}')
+        if heavy:
+            print(f'[Anhalyze]     heavy modules imported: {heavy}')
+
+        slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)[1:args.top + 1]
+        for name, value in slowest:
+            print(f'[Anhalyze]     {value:8.1f} ms  {name}')
+
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
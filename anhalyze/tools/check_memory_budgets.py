@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# System-related libraries
+import argparse
+import os
+import sys
+import tempfile
+
+
+def main():
+    """ Checks peak memory of `AnhaDataset` operations on synthetic files against
+        `anhalyze.core.profiling.MEMORY_BUDGETS`.
+        Returns a non-zero exit code if a budget is exceeded.
+    """
+
+    from anhalyze.core.anhalyze_utils import set_log_level
+    from anhalyze.core.profiling import check_memory_budgets
+    from anhalyze.core.synthetic import GRID_SIZES, write_synthetic_run
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('sizes', nargs='*', default=['tiny', 'small'],
+                        help=f"Synthetic grid sizes, from {list(GRID_SIZES)} (default: ['tiny', 'small'])")
+    parser.add_argument('--data-dir', default=None,
+                        help='Directory of synthetic files, kept between runs (default: temporary directory)')
+    args = parser.parse_args()
+
+    set_log_level('ERROR')
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            files = write_synthetic_run(os.path.join(args.data_dir or tmp_dir, size),
+                                        grids=['gridT'], n_files=1, size=size)
+
+            for name, (peak, budget, passed) in check_memory_budgets(files).items():
+                failed |= not passed
+                print(f'[Anhalyze] {size:<8}{name:<16} peak {peak:6.2f} x var (budget: {budget:.2f}) -> '
+                      f'{"ok" if passed else "FAILED"}')
+
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Benchmarks of `AnhaDataset` operations on synthetic files: open, mask, selection and reductions.
+"""
+
+# System-related libraries
+import numpy as np
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset
+from anhalyze.core.anhalyze_run import get_climatology, get_timeseries
+from anhalyze.core.file_pool import FILE_POOL
+
+from .common import SIZES, write_files
+
+# Region of selections (Baffin Bay like).
+LAT_RANGE = [60, 78]
+LON_RANGE = [-80, -40]
+
+
+class DatasetSuite:
+    """ Single file operations.
+    """
+
+    params = [SIZES]
+    param_names = ['size']
+    timeout = 300
+
+    def setup_cache(self):
+        return write_files()
+
+    def setup(self, files, size):
+        self.files = files[size]
+        self.ds = AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+        self.region = self.ds.sel(lat_range=LAT_RANGE, lon_range=LON_RANGE)
+        self.ice = AnhaDataset(self.files['icemod'][0], mask_filename=self.files['mask'])
+
+    def time_open(self, files, size):
+        AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'], use_file_pool=False)
+
+    def time_open_pooled(self, files, size):
+        AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'])
+
+    def time_apply_mask_3d(self, files, size):
+        self.ds._get_var_data_array('votemper').values
+
+    def time_apply_mask_2d(self, files, size):
+        self.ice._get_var_data_array('ileadfra').values
+
+    def time_sel(self, files, size):
+        self.ds.sel(lat_range=LAT_RANGE, lon_range=LON_RANGE)
+
+    def time_sel_depth(self, files, size):
+        self.ds.sel(depth_range=[0, 200])
+
+    def time_isel(self, files, size):
+        self.ds.isel(x_range=[10, 40], y_range=[10, 60], z_range=[0, 5])
+
+    def time_region_mean(self, files, size):
+        np.nanmean(self.region._get_var_data_array('votemper').values)
+
+    def time_profile_mean(self, files, size):
+        var_da = self.region._get_var_data_array('votemper')
+        var_da.mean(dim=[self.ds.attrs['dim_y'], self.ds.attrs['dim_x']]).values
+
+    def time_load(self, files, size):
+        AnhaDataset(self.files['gridT'][0], mask_filename=self.files['mask'], use_file_pool=False).load()
+
+    def peakmem_apply_mask_3d(self, files, size):
+        self.ds._get_var_data_array('votemper').values
+
+    def teardown(self, files, size):
+        FILE_POOL.close()
+
+
+class RunSuite:
+    """ Run-level operations over several files.
+    """
+
+    params = [SIZES]
+    param_names = ['size']
+    timeout = 600
+
+    def setup_cache(self):
+        return write_files()
+
+    def setup(self, files, size):
+        self.files = files[size]
+
+    def time_timeseries(self, files, size):
+        get_timeseries(self.files['gridT'], var='votemper', lat_range=LAT_RANGE, lon_range=LON_RANGE,
+                       mask_filename=self.files['mask'])
+
+    def time_climatology(self, files, size):
+        get_climatology(self.files['gridT'], var='sossheig', mask_filename=self.files['mask'])
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Benchmarks of `AnhaDataset.to_netcdf` on synthetic files, for each encoding preset.
+"""
+
+# System-related libraries
+import os
+import tempfile
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset
+
+from .common import SIZES, write_files
+
+
+class ExportSuite:
+    """ Export of a regional cut.
+    """
+
+    params = [SIZES, ['none', 'archive', 'fast-read', 'time-series']]
+    param_names = ['size', 'preset']
+    timeout = 300
+
+    def setup_cache(self):
+        return write_files()
+
+    def setup(self, files, size, preset):
+        files = files[size]
+        self.ds = AnhaDataset(files['gridT'][0], mask_filename=files['mask']).sel(lat_range=[50, 80],
+                                                                                 lon_range=[-100, -20])
+        self.ds.load()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.preset = None if preset == 'none' else preset
+
+    def teardown(self, files, size, preset):
+        self.tmp_dir.cleanup()
+
+    def time_to_netcdf(self, files, size, preset):
+        self.ds.to_netcdf(path=self.tmp_dir.name, preset=self.preset, overwrite=True)
+
+    def time_to_netcdf_precision(self, files, size, preset):
+        self.ds.to_netcdf(path=self.tmp_dir.name, preset=self.preset, precision=True, overwrite=True)
+
+    def track_file_size(self, files, size, preset):
+        filename = self.ds.to_netcdf(path=self.tmp_dir.name, preset=self.preset, overwrite=True)
+        return os.path.getsize(filename)
+
+    track_file_size.unit = 'bytes'
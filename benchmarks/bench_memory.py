@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Peak memory (tracemalloc) of `AnhaDataset` operations on synthetic files,
+    see `anhalyze.core.profiling.MEMORY_BUDGETS`.
+"""
+
+# Project-related libraries
+from anhalyze.core.profiling import measure_peaks
+
+from .common import SIZES, write_files
+
+
+class MemorySuite:
+    """ Peak memory of each operation, as multiple of the size of one 3D variable.
+    """
+
+    params = [SIZES]
+    param_names = ['size']
+    timeout = 300
+
+    def setup_cache(self):
+        files = write_files()
+        peaks = {}
+        for size in SIZES:
+            size_peaks, var_nbytes = measure_peaks(files[size])
+            peaks[size] = {name: peak / var_nbytes for name, peak in size_peaks.items()}
+        return peaks
+
+    def track_open(self, peaks, size):
+        return peaks[size]['open']
+
+    def track_read(self, peaks, size):
+        return peaks[size]['read']
+
+    def track_apply_mask(self, peaks, size):
+        return peaks[size]['apply_mask']
+
+    def track_sel_apply_mask(self, peaks, size):
+        return peaks[size]['sel_apply_mask']
+
+    def track_region_mean(self, peaks, size):
+        return peaks[size]['region_mean']
+
+    def track_to_netcdf(self, peaks, size):
+        return peaks[size]['to_netcdf']
+
+    def track_plot_config(self, peaks, size):
+        return peaks[size]['plot_config']
+
+    track_open.unit = 'x var size'
+    track_read.unit = 'x var size'
+    track_apply_mask.unit = 'x var size'
+    track_sel_apply_mask.unit = 'x var size'
+    track_region_mean.unit = 'x var size'
+    track_to_netcdf.unit = 'x var size'
+    track_plot_config.unit = 'x var size'
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# coding: utf-8
+""" Benchmarks of map plotting on synthetic files.
+    Skipped if Natural Earth data is not available offline, see `anhalyze.core.natural_earth`.
+"""
+
+# System-related libraries
+import os
+import tempfile
+
+# Project-related libraries
+from anhalyze.core.anhalyze import AnhaDataset
+
+from .common import SIZES, write_files
+
+
+def has_natural_earth(resolution='50m'):
+    """ Returns True if Natural Earth land/ocean shapefiles are available without download.
+    """
+
+    from anhalyze.core.natural_earth import find_shapefile
+
+    return all(find_shapefile(name, resolution) for name in ['land', 'ocean'])
+
+
+class PlotSuite:
+    """ Map of a variable saved to file.
+    """
+
+    params = [SIZES, ['LambertConformal', 'NorthPolarStereo']]
+    param_names = ['size', 'projection']
+    timeout = 600
+
+    def setup_cache(self):
+        return write_files(grids=('gridT',), n_files=1)
+
+    def setup(self, files, size, projection):
+        if not has_natural_earth():
+            raise NotImplementedError('Natural Earth data not available offline.')
+
+        import matplotlib
+        matplotlib.use('Agg')
+
+        files = files[size]
+        self.ds = AnhaDataset(files['gridT'][0], mask_filename=files['mask']).sel(lat_range=[50, 80],
+                                                                                 lon_range=[-100, -20])
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def teardown(self, files, size, projection):
+        import matplotlib.pyplot as plt
+        plt.close('all')
+        self.tmp_dir.cleanup()
+
+    def time_show_var_data_map(self, files, size, projection):
+        self.ds.show_var_data_map('votemper', savefig=os.path.join(self.tmp_dir.name, 'map.png'),
+                                  projection_name=projection)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# System-related libraries
+import os
+
+# Project-related libraries
+from anhalyze.core.anhalyze_utils import set_log_level
+from anhalyze.core.synthetic import write_synthetic_run
+
+# Grid sizes benchmarked, see `anhalyze.core.synthetic.GRID_SIZES`.
+SIZES = ['tiny', 'small', 'medium']
+
+# Number of files of each run, for run-level benchmarks.
+N_FILES = 6
+
+# Directory of synthetic files, kept between runs if set.
+DATA_DIR = os.environ.get('ANHALYZE_BENCHMARK_DIR', os.path.abspath('anhalyze_benchmark_data'))
+
+# Messages would be timed too.
+set_log_level('ERROR')
+
+
+def write_files(sizes=SIZES, grids=('gridT', 'icemod'), n_files=N_FILES):
+    """ Writes synthetic runs for each size (only once if `ANHALYZE_BENCHMARK_DIR` is set),
+        and returns {size: {'mask': mask_filename, grid: [filenames]}}.
+    """
+
+    return {size: write_synthetic_run(os.path.join(DATA_DIR, size), grids=grids, n_files=n_files, size=size)
+            for size in sizes}